@@ -0,0 +1,68 @@
+"""Модуль содержит форматы потоковой выгрузки пользователей."""
+import csv
+import io
+import zlib
+from typing import AsyncIterator, List, Union
+
+from pydantic_models.pydantic_models import UserResp
+
+FORMATS = ('ndjson', 'csv')
+CSV_COLUMNS = ('id', 'surname', 'name', 'patronymic', 'version')
+MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+async def users_to_ndjson(batches: AsyncIterator[List[UserResp]]) -> AsyncIterator[str]:
+    """Преобразует пачки пользователей в строки формата NDJSON.
+
+    Parameters
+    ----------
+    batches: AsyncIterator[List[UserResp]]
+        Асинхронный итератор по пачкам пользователей.
+    """
+    async for users in batches:
+        yield ''.join(user.model_dump_json() + '\n' for user in users)
+
+
+async def users_to_csv(batches: AsyncIterator[List[UserResp]]) -> AsyncIterator[str]:
+    """Преобразует пачки пользователей в строки формата CSV
+    с заголовком.
+
+    Parameters
+    ----------
+    batches: AsyncIterator[List[UserResp]]
+        Асинхронный итератор по пачкам пользователей.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(CSV_COLUMNS)
+    async for users in batches:
+        writer.writerows(
+            (user.id, user.surname, user.name, user.patronymic, user.version)
+            for user in users
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def gzip_chunks(chunks: AsyncIterator[Union[str, bytes]]) -> AsyncIterator[bytes]:
+    """Сжимает поток частей в формат gzip.
+
+    Parameters
+    ----------
+    chunks: AsyncIterator[Union[str, bytes]]
+        Части выгрузки, строки кодируются в UTF-8.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,282 @@
+"""Модуль содержит потоковый импорт пользователей из CSV и NDJSON.
+
+Файл читается частями и разбирается построчно, корректные строки
+собираются в пачки и записываются методом import_users репозитория,
+поэтому файл любого размера не загружается в память целиком.
+"""
+import codecs
+import csv
+import json
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from pydantic_models.pydantic_models import ImportProgressResp, ImportRowError, UserModel
+
+FORMATS = ('csv', 'ndjson')
+FIELDS = ('surname', 'name', 'patronymic')
+#Число ошибок строк, которое передается в отчете, остальные только
+#подсчитываются.
+MAX_REPORTED_ERRORS = 1000
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Разбивает поток байт в кодировке UTF-8 на строки.
+
+    Parameters
+    ----------
+    chunks: AsyncIterator[bytes]
+        Части файла.
+    """
+
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    tail = ''
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail.rstrip('\r')
+
+
+async def iter_csv_rows(
+    lines: AsyncIterator[str],
+) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Разбирает строки CSV с заголовком.
+
+    Возвращает номер строки файла и данные строки либо ошибку.
+    Значения в кавычках могут содержать переводы строк.
+
+    Parameters
+    ----------
+    lines: AsyncIterator[str]
+        Строки файла.
+    """
+
+    header = None
+    line_number = 0
+    record = ''
+    record_start = 0
+    async for line in lines:
+        line_number += 1
+        if not record:
+            record_start = line_number
+            record = line
+        else:
+            record += '\n' + line
+        #Нечетное число кавычек - значение продолжается на следующей строке.
+        if record.count('"') % 2:
+            continue
+        if not record.strip():
+            record = ''
+            continue
+        fields = next(csv.reader([record]))
+        record = ''
+        if header is None:
+            header = [field.strip() for field in fields]
+            missing = [field for field in FIELDS if field not in header]
+            if missing:
+                yield record_start, None, f"В заголовке нет колонок: {', '.join(missing)}"
+                return
+            continue
+        if len(fields) != len(header):
+            yield record_start, None, 'Число значений не совпадает с заголовком'
+            continue
+        yield record_start, dict(zip(header, fields)), None
+    if record:
+        yield record_start, None, 'Незакрытые кавычки'
+
+
+async def iter_ndjson_rows(
+    lines: AsyncIterator[str],
+) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Разбирает строки NDJSON.
+
+    Возвращает номер строки файла и данные строки либо ошибку.
+
+    Parameters
+    ----------
+    lines: AsyncIterator[str]
+        Строки файла.
+    """
+
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as some_ex:
+            yield line_number, None, f'Некорректный JSON: {some_ex}'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Строка должна содержать объект JSON'
+            continue
+        yield line_number, row, None
+
+
+class UserImport():
+    """Класс выполняет импорт пользователей и считает результат.
+
+    Attributes
+    ----------
+    imported : int
+        число записанных пользователей
+    failed : int
+        число строк с ошибками
+    errors : List[ImportRowError]
+        ошибки строк, еще не переданные в отчете
+
+    Methods
+    -------
+    chunks()
+        Возвращает корректных пользователей файла пачками.
+
+    report()
+        Возвращает отчет о ходе импорта.
+
+    run()
+        Возвращает отчеты о ходе импорта по мере записи пачек.
+    """
+
+    def __init__(self, import_format: str, chunk_size: int):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        import_format: str
+            Формат файла: csv либо ndjson.
+        chunk_size: int
+            Число пользователей в пачке записи.
+        """
+
+        if import_format not in FORMATS:
+            raise ValueError(f'Неизвестный формат импорта: {import_format}')
+        self.import_format = import_format
+        self.chunk_size = chunk_size
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[ImportRowError] = []
+        self._reported_errors = 0
+        #Номера строк файла пачек, переданных на запись, но еще
+        #не записанных.
+        self._chunk_lines: 'deque[List[int]]' = deque()
+        self._started = time.perf_counter()
+
+    def _fail(self, line: int, error: str):
+        self.failed += 1
+        if self._reported_errors < MAX_REPORTED_ERRORS:
+            self._reported_errors += 1
+            self.errors.append(ImportRowError(line=line, error=error))
+
+    async def chunks(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[List[UserModel]]:
+        """Возвращает корректных пользователей файла пачками,
+        строки с ошибками учитываются в отчете.
+
+        Parameters
+        ----------
+        chunks: AsyncIterator[bytes]
+            Части файла.
+        """
+
+        if self.import_format == 'csv':
+            rows = iter_csv_rows(iter_lines(chunks))
+        else:
+            rows = iter_ndjson_rows(iter_lines(chunks))
+        users, lines = [], []
+        async for line, row, error in rows:
+            if error is None:
+                try:
+                    users.append(UserModel(**{field: row.get(field) for field in FIELDS}))
+                    lines.append(line)
+                except ValidationError as some_ex:
+                    error = '; '.join(
+                        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+                        for item in some_ex.errors()
+                    )
+            if error is not None:
+                self._fail(line, error)
+            if len(users) >= self.chunk_size:
+                self._chunk_lines.append(lines)
+                yield users
+                users, lines = [], []
+        if users:
+            self._chunk_lines.append(lines)
+            yield users
+
+    def report(self, done: bool = False, error: Optional[str] = None) -> ImportProgressResp:
+        """Возвращает отчет о ходе импорта с новыми ошибками строк.
+
+        Parameters
+        ----------
+        done: bool
+            Импорт завершен.
+        error: Optional[str]
+            Ошибка, прервавшая импорт.
+        """
+
+        elapsed = time.perf_counter() - self._started
+        errors, self.errors = self.errors, []
+        return ImportProgressResp(
+            imported=self.imported,
+            failed=self.failed,
+            errors=errors,
+            elapsed=round(elapsed, 3),
+            rows_per_second=round(self.imported / elapsed, 1) if elapsed else 0.0,
+            done=done,
+            error=error,
+        )
+
+    async def run(
+        self, written: AsyncIterator[Tuple[int, List[Tuple[int, str]]]],
+    ) -> AsyncIterator[ImportProgressResp]:
+        """Возвращает отчет после каждой записанной пачки и итоговый
+        отчет.
+
+        Строки, отклоненные хранилищем, учитываются в отчете с
+        номером строки файла и сообщением хранилища, импорт при
+        этом продолжается. Остальные ошибки записи прерывают импорт:
+        итоговый отчет содержит строки файла незаписанной пачки,
+        пачки, записанные до нее, остаются в хранилище.
+
+        Parameters
+        ----------
+        written: AsyncIterator[Tuple[int, List[Tuple[int, str]]]]
+            Результат import_users репозитория для пачек chunks():
+            число записанных пользователей каждой пачки и позиции
+            отклоненных строк в пачке с сообщением хранилища.
+        """
+
+        try:
+            async for count, rejected in written:
+                lines = self._chunk_lines.popleft()
+                self.imported += count
+                for position, error in rejected:
+                    self._fail(lines[position], error)
+                yield self.report()
+        except Exception:
+            error = 'Ошибка на стороне сервера'
+            if self._chunk_lines:
+                lines = self._chunk_lines[0]
+                error += f', не записаны строки {lines[0]}-{lines[-1]}'
+            yield self.report(done=True, error=error)
+            return
+        yield self.report(done=True)
+
+
+def format_from_content_type(content_type: Optional[str]) -> Optional[str]:
+    """Возвращает формат импорта по заголовку Content-Type."""
+
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    mapping: Dict[str, str] = {
+        'text/csv': 'csv',
+        'application/x-ndjson': 'ndjson',
+        'application/ndjson': 'ndjson',
+        'application/jsonl': 'ndjson',
+    }
+    return mapping.get(media_type)
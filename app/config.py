@@ -1,5 +1,6 @@
 """Модуль содержит конфигурацию работы приложения."""
 import os
+from typing import Literal
 
 from starlette.config import Config
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -51,6 +52,86 @@ class Settings(BaseSettings):
         разрешение на чтение данных
     delete: bool
         разрешение на удаление данных
+    bulk_copy_threshold: int
+        число записей, начиная с которого массовое добавление
+        выполняется через COPY
+    redis_key_prefix: str
+        префикс ключей redis, под которыми хранятся пользователи
+    redis_key_format: str
+        формат id пользователя в ключе redis: text либо binary
+    redis_value_format: str
+        формат данных пользователя в redis: string либо msgpack
+    redis_search_prefix: str
+        префикс ключей redis индексов поиска пользователей
+    user_cache_enabled: bool
+        кэширование пользователей в redis при работе с реляционной СУБД
+    user_cache_ttl: int
+        время жизни записи кэша пользователей в секундах
+    local_cache_enabled: bool
+        кэширование пользователей в памяти процесса
+    local_cache_size: int
+        максимальное число пользователей в кэше процесса
+    local_cache_ttl: float
+        время жизни записи кэша процесса в секундах
+    local_cache_channel: str
+        канал redis для инвалидации кэша процессов, пустая строка
+        отключает оповещение
+    single_flight_enabled: bool
+        объединение одновременных чтений одного пользователя
+        в процессе
+    db_pool_size: int
+        число постоянных соединений с базой данных в пуле процесса
+    db_max_overflow: int
+        число дополнительных соединений сверх db_pool_size при пиковой
+        нагрузке
+    db_pool_timeout: float
+        время ожидания свободного соединения из пула в секундах
+    db_pool_pre_ping: bool
+        проверка соединения перед выдачей из пула
+    db_pool_recycle: int
+        время жизни соединения в секундах, -1 без ограничения
+    db_statement_cache_size: int
+        размер кэша подготовленных выражений на соединение
+    redis_max_connections: int
+        максимальное число соединений с redis в пуле процесса
+    db_pool_warmup: int
+        число соединений с базой данных, открываемых при запуске
+        процесса
+    redis_pool_warmup: int
+        число соединений с redis, открываемых при запуске процесса
+    readiness_timeout: float
+        время ожидания ответа хранилища при проверке готовности
+        в секундах
+    log_level: str
+        минимальный уровень записей журнала
+    log_queue_size: int
+        максимальное число записей в очереди журнала, при переполнении
+        записи отбрасываются
+    log_error_burst: int
+        число одинаковых ошибок, записываемых в журнал за интервал
+    log_error_interval: float
+        интервал ограничения одинаковых ошибок в секундах
+    write_batch_enabled: bool
+        объединение добавлений и обновлений пользователей процесса
+        в групповые запросы
+    write_batch_size: int
+        максимальное число изменений в групповом запросе
+    write_batch_delay: float
+        максимальное время ожидания пополнения группового запроса
+        в секундах
+    redis_replica_enabled: bool
+        хранение пользователей в реляционной СУБД с репликой в redis
+        для чтения
+    redis_replica_sync_writes: bool
+        запись изменений в реплику сразу после фиксации транзакции,
+        а не только через очередь user_outbox
+    redis_replica_batch_size: int
+        число записей очереди user_outbox, переносимых в redis за раз
+    redis_replica_poll_interval: float
+        интервал проверки очереди user_outbox в секундах
+    redis_replica_reconcile_interval: float
+        интервал сверки реплики с реляционной СУБД в секундах,
+        0 отключает сверку
 
     """
 
@@ -68,6 +149,40 @@ class Settings(BaseSettings):
     update: bool
     read: bool
     delete: bool
+    bulk_copy_threshold: int = 1000
+    redis_key_prefix: str = 'user:'
+    redis_key_format: Literal['text', 'binary'] = 'text'
+    redis_value_format: Literal['string', 'msgpack'] = 'string'
+    redis_search_prefix: str = 'user_search:'
+    user_cache_enabled: bool = False
+    user_cache_ttl: int = 60
+    local_cache_enabled: bool = False
+    local_cache_size: int = 10000
+    local_cache_ttl: float = 5
+    local_cache_channel: str = 'user-cache-invalidation'
+    single_flight_enabled: bool = False
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_pre_ping: bool = False
+    db_pool_recycle: int = -1
+    db_statement_cache_size: int = 100
+    redis_max_connections: int = 100
+    db_pool_warmup: int = 5
+    redis_pool_warmup: int = 5
+    readiness_timeout: float = 1
+    log_level: str = 'INFO'
+    log_queue_size: int = 10000
+    log_error_burst: int = 10
+    log_error_interval: float = 60
+    write_batch_enabled: bool = False
+    write_batch_size: int = 100
+    write_batch_delay: float = 0.002
+    redis_replica_enabled: bool = False
+    redis_replica_sync_writes: bool = False
+    redis_replica_batch_size: int = 500
+    redis_replica_poll_interval: float = 0.5
+    redis_replica_reconcile_interval: float = 0
     model_config = SettingsConfigDict(
         env_file='.env', extra='ignore', env_file_encoding='utf-8')
 
@@ -80,8 +195,57 @@ settings = Settings(
 
 DB_URL = f'postgresql+asyncpg://{settings.db_user}:{settings.password}@{settings.db_host}:{settings.db_port}/{settings.db_name}'
 
-redis_instance = aioredis.from_url(
+class CountingConnectionPool(aioredis.ConnectionPool):
+    """Пул соединений с redis, который сам считает созданные
+    и выданные соединения, не обращаясь к внутренним полям
+    redis-py.
+
+    Attributes
+    ----------
+    created : int
+        число созданных соединений
+    in_use : int
+        число выданных и еще не возвращенных соединений
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.created = 0
+        self.in_use = 0
+        super().__init__(*args, **kwargs)
+
+    def make_connection(self):
+        connection = super().make_connection()
+        self.created += 1
+        return connection
+
+    def get_available_connection(self):
+        connection = super().get_available_connection()
+        self.in_use += 1
+        return connection
+
+    async def release(self, connection):
+        await super().release(connection)
+        self.in_use -= 1
+
+
+#Пул создается явно, чтобы ограничение REDIS_MAX_CONNECTIONS
+#гарантированно относилось к пулу экземпляра.
+redis_pool = CountingConnectionPool.from_url(
         f"redis://{settings.redis_host}:{settings.redis_port}",
         encoding="utf8",
-        decode_responses=True,
+        decode_responses=False,
+        max_connections=settings.redis_max_connections,
 )
+redis_instance = aioredis.Redis.from_pool(redis_pool)
+
+
+def get_redis_pool_stats() -> dict:
+    """Возвращает состояние пула соединений с redis по счетчикам
+    CountingConnectionPool.
+    """
+    pool = redis_instance.connection_pool
+    return {
+        'max_connections': pool.max_connections,
+        'idle': pool.created - pool.in_use,
+        'in_use': pool.in_use,
+    }
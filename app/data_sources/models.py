@@ -1,39 +1,120 @@
 """Модуль с моделями данных базы данных."""
-import uuid
 
 from sqlalchemy import (
+    BigInteger,
+    DateTime,
+    Index,
     MetaData,
     Table,
     Column,
+    Integer,
     String,
+    func,
 )
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.dialects.postgresql import UUID
 
-from config import DB_URL
+from config import DB_URL, settings
+from data_sources.user_ids import uuid7
 
 
 metadata = MetaData()
 
-engine = create_async_engine(DB_URL)
+#Соединения процессов с репликой в redis включают запись изменений
+#пользователей в таблицу user_outbox триггером базы данных.
+server_settings = {}
+if settings.redis_replica_enabled and not settings.no_sql:
+    server_settings['app.user_outbox'] = 'on'
 
-async_session_maker = sessionmaker(
-    engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
+#Размеры пула задаются на один процесс приложения: общее число
+#соединений с базой данных равно числу процессов gunicorn,
+#умноженному на DB_POOL_SIZE + DB_MAX_OVERFLOW.
+engine = create_async_engine(
+    DB_URL,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    pool_recycle=settings.db_pool_recycle,
+    connect_args={
+        'prepared_statement_cache_size': settings.db_statement_cache_size,
+        'server_settings': server_settings,
+    },
 )
 
-async def get_async_session():
-    async with async_session_maker() as session:
-        yield session
+
+async def get_read_connection():
+    """Выдает соединение из пула в режиме autocommit.
+
+    Используется запросами на чтение: запросы выполняются без
+    открытия транзакции.
+    """
+    async with engine.connect() as connection:
+        await connection.execution_options(isolation_level='AUTOCOMMIT')
+        yield connection
+
+
+async def get_write_connection():
+    """Выдает соединение из пула для изменения данных.
+
+    Транзакция открывается первым запросом, фиксирует и откатывает
+    ее репозиторий.
+    """
+    async with engine.connect() as connection:
+        yield connection
+
+
+async def get_no_connection():
+    """Заменяет соединение с базой данных при работе с redis."""
+    return None
+
+
+def get_db_pool_stats() -> dict:
+    """Возвращает состояние пула соединений с базой данных."""
+    pool = engine.pool
+    return {
+        'size': pool.size(),
+        'max_overflow': settings.db_max_overflow,
+        'idle': pool.checkedin(),
+        'in_use': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+    }
 
 #Модель данных для сущности пользователь.
 User_model = Table(
     "user",
     metadata,
-    Column('id', UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True),
+    #id создаются по времени(UUID версии 7), поэтому новые строки
+    #добавляются в конец индекса первичного ключа.
+    Column('id', UUID(as_uuid=True), primary_key=True, default=uuid7),
     Column('surname', String, nullable=False),
     Column('name', String, nullable=False),
     Column('patronymic', String, nullable=False),
+    #Версия записи, увеличивается при каждом обновлении.
+    Column('version', Integer, nullable=False, default=1, server_default='1'),
+)
+
+#Индексы поиска пользователей: btree для точного поиска и поиска
+#по началу, GIN pg_trgm для нечеткого поиска.
+for search_field in ('surname', 'name', 'patronymic'):
+    Index(
+        f'ix_user_{search_field}_lower',
+        func.lower(User_model.c[search_field]).collate('C'),
+    )
+    Index(
+        f'ix_user_{search_field}_trgm',
+        func.lower(User_model.c[search_field]).label(f'lower_{search_field}'),
+        postgresql_using='gin',
+        postgresql_ops={f'lower_{search_field}': 'gin_trgm_ops'},
+    )
+
+#Модель данных очереди изменений пользователей для реплики в redis.
+#Строки добавляет триггер таблицы user, удаляет RedisUserReplica
+#после переноса изменений в redis.
+User_outbox_model = Table(
+    "user_outbox",
+    metadata,
+    Column('id', BigInteger, primary_key=True, autoincrement=True),
+    Column('user_id', UUID(as_uuid=True), nullable=False),
+    Column('created_at', DateTime(timezone=True), nullable=False, server_default=func.now()),
 )
@@ -0,0 +1,244 @@
+"""Модуль содержит кэш пользователей в памяти процесса."""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+
+class LocalUserCache():
+    """Ограниченный по размеру кэш с временем жизни записей
+    в памяти процесса.
+
+    При переполнении вытесняется запись, которая дольше всех не
+    запрашивалась. Кэш не использует блокировки: все операции
+    выполняются в цикле событий одного процесса.
+
+    Каждая инвалидация увеличивает счетчик кэша и запоминает его
+    значение для своего ключа. Загрузка сохраняется, только если ее
+    ключ не инвалидировался после начала загрузки, поэтому изменения
+    других пользователей не мешают заполнению кэша. Отметки
+    инвалидаций хранятся для последних max_size ключей; загрузки,
+    начатые до самой старой забытой отметки, а также до очистки кэша
+    после переподключения к каналу, не сохраняются.
+
+    Attributes
+    ----------
+    RECONNECT_DELAY : float
+        пауза перед повторной подпиской на канал в секундах
+
+    Methods
+    -------
+    get()
+        Возвращает значение из кэша.
+
+    epoch()
+        Возвращает счетчик инвалидаций на момент начала загрузки.
+
+    set()
+        Сохраняет значение в кэш.
+
+    invalidate()
+        Удаляет значение из кэша и оповещает другие процессы.
+
+    stats()
+        Возвращает счетчики работы кэша.
+
+    start_listening()
+        Запускает прием инвалидаций из канала redis.
+
+    stop_listening()
+        Останавливает прием инвалидаций из канала redis.
+    """
+
+    RECONNECT_DELAY = 1.0
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        redis: Optional[Redis] = None,
+        channel: str = '',
+    ):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        max_size: int
+            Максимальное число записей.
+        ttl: float
+            Время жизни записи в секундах.
+        redis: Optional[Redis]
+            Экземпляр redis для оповещения других процессов.
+        channel: str
+            Канал redis для инвалидаций, пустая строка отключает
+            оповещение.
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis = redis
+        self.channel = channel
+        self._items: 'OrderedDict[str, tuple]' = OrderedDict()
+        #Значение счетчика при последней инвалидации ключа, от
+        #давней к последней.
+        self._invalidated: 'OrderedDict[str, int]' = OrderedDict()
+        self._epoch = 0
+        #Загрузки, начатые до этого значения счетчика, не сохраняются.
+        self._min_epoch = 0
+        self._listener: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Возвращает значение из кэша либо None при промахе.
+
+        Parameters
+        ----------
+        key: str
+            Ключ записи.
+        """
+
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def epoch(self) -> int:
+        """Возвращает счетчик инвалидаций.
+
+        Значение нужно запомнить перед загрузкой данных из источника
+        и передать в set(): если за время загрузки ключ был
+        инвалидирован, загруженные данные могли устареть и не будут
+        сохранены.
+        """
+
+        return self._epoch
+
+    def set(self, key: str, value: Any, epoch: int):
+        """Сохраняет значение в кэш.
+
+        Parameters
+        ----------
+        key: str
+            Ключ записи.
+        value: Any
+            Значение.
+        epoch: int
+            Значение epoch() на момент начала загрузки.
+        """
+
+        if epoch < self._min_epoch or self._invalidated.get(key, 0) > epoch:
+            return
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def _evict(self, key: str):
+        self._epoch += 1
+        self._invalidated[key] = self._epoch
+        self._invalidated.move_to_end(key)
+        if len(self._invalidated) > self.max_size:
+            _, epoch = self._invalidated.popitem(last=False)
+            self._min_epoch = max(self._min_epoch, epoch)
+        if self._items.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def _clear(self):
+        self._epoch += 1
+        self._min_epoch = self._epoch
+        self._invalidated.clear()
+        self._items.clear()
+
+    async def invalidate(self, key: str):
+        """Удаляет значение из кэша и оповещает другие процессы.
+
+        Parameters
+        ----------
+        key: str
+            Ключ записи.
+        """
+
+        self._evict(key)
+        if self.redis is not None and self.channel:
+            try:
+                await self.redis.publish(self.channel, key)
+            except Exception as some_ex:
+                logger.warning(
+                    'Ошибка оповещения об инвалидации',
+                    exc_info=some_ex,
+                    extra={'backend': 'redis', 'operation': 'cache_publish'},
+                )
+
+    def stats(self) -> dict:
+        """Возвращает счетчики работы кэша."""
+
+        return {
+            'size': len(self._items),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+    def start_listening(self):
+        """Запускает прием инвалидаций из канала redis."""
+
+        if self.redis is not None and self.channel and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop_listening(self):
+        """Останавливает прием инвалидаций из канала redis."""
+
+        if self._listener is None:
+            return
+        self._listener.cancel()
+        try:
+            await self._listener
+        except asyncio.CancelledError:
+            pass
+        self._listener = None
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    #После переподключения часть сообщений могла быть
+                    #потеряна, поэтому кэш очищается целиком.
+                    self._clear()
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            key = message['data']
+                            if isinstance(key, bytes):
+                                key = key.decode()
+                            self._evict(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as some_ex:
+                logger.warning(
+                    'Ошибка подписки на инвалидации',
+                    exc_info=some_ex,
+                    extra={'backend': 'redis', 'operation': 'cache_listen'},
+                )
+                await asyncio.sleep(self.RECONNECT_DELAY)
@@ -0,0 +1,170 @@
+"""Модуль содержит формат хранения пользователей в redis."""
+import uuid
+from typing import Dict, List, Sequence
+
+import msgpack
+
+
+class RedisUserCodec():
+    """Класс преобразует id и данные пользователя в ключ и значение
+    redis и обратно.
+
+    Пользователь хранится одной строкой под ключом
+    "<префикс><id>". id в ключе записывается текстом (36 байт) либо
+    16 байтами UUID, в значении не дублируется.
+
+    Значение содержит поля FIELDS в одном из форматов:
+    string - длины всех полей, кроме последнего, через ":", затем "|"
+    и сами поля подряд в UTF-8, например "6:4|IvanovIvanIvanovich";
+    msgpack - массив msgpack из строк полей.
+    Оба формата хранят число полей, поэтому значения, записанные
+    с меньшим набором полей, читаются без миграции: недостающие поля
+    берутся из DEFAULTS.
+
+    Attributes
+    ----------
+    KEY_FORMATS : tuple
+        допустимые форматы id в ключе
+    VALUE_FORMATS : tuple
+        допустимые форматы значения
+    FIELDS : tuple
+        поля пользователя в порядке хранения
+    DEFAULTS : dict
+        значения полей, которых нет в прежних записях
+
+    Methods
+    -------
+    key()
+        Возвращает ключ пользователя.
+
+    user_id()
+        Возвращает id пользователя по ключу.
+
+    encode()
+        Возвращает значение для данных пользователя.
+
+    decode()
+        Возвращает данные пользователя по значению.
+    """
+
+    KEY_FORMATS = ('text', 'binary')
+    VALUE_FORMATS = ('string', 'msgpack')
+    FIELDS = ('surname', 'name', 'patronymic', 'version')
+    DEFAULTS = {'version': '1'}
+
+    def __init__(self, key_prefix: str, key_format: str, value_format: str):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        key_prefix: str
+            Префикс ключей пользователей.
+        key_format: str
+            Формат id в ключе: text либо binary.
+        value_format: str
+            Формат значения: string либо msgpack.
+        """
+
+        if key_format not in self.KEY_FORMATS:
+            raise ValueError(f'Неизвестный формат ключа: {key_format}')
+        if value_format not in self.VALUE_FORMATS:
+            raise ValueError(f'Неизвестный формат значения: {value_format}')
+        self.prefix = key_prefix.encode()
+        self.key_format = key_format
+        self.value_format = value_format
+        #Шаблон SCAN MATCH, спецсимволы шаблона в префиксе экранируются.
+        self.match = b''.join(
+            b'\\' + bytes([char]) if char in b'*?[]\\' else bytes([char])
+            for char in self.prefix
+        ) + b'*'
+
+    def key(self, user_id: uuid.UUID) -> bytes:
+        """Возвращает ключ пользователя.
+
+        Parameters
+        ----------
+        user_id: uuid.UUID
+            id пользователя.
+        """
+
+        if self.key_format == 'binary':
+            return self.prefix + user_id.bytes
+        return self.prefix + str(user_id).encode()
+
+    def user_id(self, key: bytes) -> str:
+        """Возвращает id пользователя по ключу.
+
+        Parameters
+        ----------
+        key: bytes
+            Ключ пользователя.
+        """
+
+        raw_id = key[len(self.prefix):]
+        if self.key_format == 'binary':
+            return str(uuid.UUID(bytes=raw_id))
+        return raw_id.decode()
+
+    def encode(self, user: Dict[str, str]) -> bytes:
+        """Возвращает значение для данных пользователя.
+
+        Parameters
+        ----------
+        user: Dict[str, str]
+            Данные пользователя с полями FIELDS.
+        """
+
+        fields = [str(user[field]) for field in self.FIELDS]
+        if self.value_format == 'msgpack':
+            return msgpack.packb(fields)
+        return self.encode_string(fields)
+
+    def decode(self, value: bytes) -> Dict[str, str]:
+        """Возвращает данные пользователя по значению.
+
+        Parameters
+        ----------
+        value: bytes
+            Значение, записанное encode().
+        """
+
+        if self.value_format == 'msgpack':
+            fields = msgpack.unpackb(value)
+        else:
+            fields = self.decode_string(value)
+        return {**self.DEFAULTS, **dict(zip(self.FIELDS, fields))}
+
+    @staticmethod
+    def encode_string(fields: Sequence[str]) -> bytes:
+        """Кодирует поля в формат string.
+
+        Parameters
+        ----------
+        fields: Sequence[str]
+            Значения полей.
+        """
+
+        encoded = [field.encode() for field in fields]
+        header = ':'.join(str(len(field)) for field in encoded[:-1])
+        return header.encode() + b'|' + b''.join(encoded)
+
+    @staticmethod
+    def decode_string(value: bytes) -> List[str]:
+        """Декодирует поля из формата string.
+
+        Parameters
+        ----------
+        value: bytes
+            Значение в формате string.
+        """
+
+        separator = value.index(b'|')
+        header = value[:separator]
+        lengths = [int(length) for length in header.split(b':')] if header else []
+        fields = []
+        position = separator + 1
+        for length in lengths:
+            fields.append(value[position:position + length].decode())
+            position += length
+        fields.append(value[position:].decode())
+        return fields
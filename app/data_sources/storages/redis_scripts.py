@@ -0,0 +1,507 @@
+"""Модуль содержит Lua-скрипты изменения пользователей в redis."""
+import logging
+from typing import List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+from data_sources.storages.user_search import RedisUserSearchIndex
+
+logger = logging.getLogger(__name__)
+
+#Функции чтения и записи значения пользователя в форматах
+#RedisUserCodec. Формат msgpack разбирается вручную, так как
+#встроенной библиотеки cmsgpack может не быть. Поля хранятся
+#в порядке RedisUserCodec.FIELDS, версия - последнее поле.
+PRELUDE = """
+local VERSION_FIELD = 4
+
+local function decode_string(value)
+    local separator = string.find(value, '|', 1, true)
+    local fields = {}
+    local position = separator + 1
+    for length in string.gmatch(string.sub(value, 1, separator - 1), '%d+') do
+        length = tonumber(length)
+        table.insert(fields, string.sub(value, position, position + length - 1))
+        position = position + length
+    end
+    table.insert(fields, string.sub(value, position))
+    return fields
+end
+
+local function encode_string(fields)
+    local lengths = {}
+    for index = 1, #fields - 1 do
+        lengths[index] = tostring(#fields[index])
+    end
+    return table.concat(lengths, ':') .. '|' .. table.concat(fields)
+end
+
+local function decode_msgpack(value)
+    local fields = {}
+    local position = 2
+    for index = 1, string.byte(value, 1) - 0x90 do
+        local marker = string.byte(value, position)
+        local length
+        if marker >= 0xa0 and marker <= 0xbf then
+            length = marker - 0xa0
+            position = position + 1
+        elseif marker == 0xd9 then
+            length = string.byte(value, position + 1)
+            position = position + 2
+        elseif marker == 0xda then
+            local high, low = string.byte(value, position + 1, position + 2)
+            length = high * 256 + low
+            position = position + 3
+        else
+            local b1, b2, b3, b4 = string.byte(value, position + 1, position + 4)
+            length = ((b1 * 256 + b2) * 256 + b3) * 256 + b4
+            position = position + 5
+        end
+        fields[index] = string.sub(value, position, position + length - 1)
+        position = position + length
+    end
+    return fields
+end
+
+local function encode_msgpack(fields)
+    local parts = {string.char(0x90 + #fields)}
+    for _, field in ipairs(fields) do
+        local length = #field
+        if length < 32 then
+            table.insert(parts, string.char(0xa0 + length))
+        elseif length < 256 then
+            table.insert(parts, string.char(0xd9, length))
+        elseif length < 65536 then
+            table.insert(parts, string.char(0xda, math.floor(length / 256), length % 256))
+        else
+            table.insert(parts, string.char(
+                0xdb,
+                math.floor(length / 16777216),
+                math.floor(length / 65536) % 256,
+                math.floor(length / 256) % 256,
+                length % 256
+            ))
+        end
+        table.insert(parts, field)
+    end
+    return table.concat(parts)
+end
+
+local function decode_user(value, format)
+    local fields
+    if format == 'msgpack' then
+        fields = decode_msgpack(value)
+    else
+        fields = decode_string(value)
+    end
+    if fields[VERSION_FIELD] == nil then
+        fields[VERSION_FIELD] = '1'
+    end
+    return fields
+end
+
+local function encode_user(fields, format)
+    if format == 'msgpack' then
+        return encode_msgpack(fields)
+    end
+    return encode_string(fields)
+end
+
+--Индексы поиска: запись поля содержит значение и триграммы через
+--"\0", пустая запись - поле не проиндексировано. Ключи индексов
+--вычисляются по префиксу и прежним значениям полей, которые
+--известны только внутри скрипта, поэтому они не передаются в KEYS,
+--и скрипты с индексами поиска не работают в Redis Cluster.
+local SEARCH_FIELDS = {'surname', 'name', 'patronymic'}
+
+local function split_record(record)
+    local parts = {}
+    local position = 1
+    while position <= #record do
+        local separator = string.find(record, '\0', position, true) or #record + 1
+        table.insert(parts, string.sub(record, position, separator - 1))
+        position = separator + 1
+    end
+    return parts
+end
+
+local function index_field(prefix, index, user_key, record, add)
+    local field = SEARCH_FIELDS[index]
+    for position, part in ipairs(split_record(record)) do
+        if position == 1 then
+            local member = part .. '\0' .. user_key
+            if add then
+                redis.call('ZADD', prefix .. 'lex:' .. field, 0, member)
+            else
+                redis.call('ZREM', prefix .. 'lex:' .. field, member)
+            end
+        elseif add then
+            redis.call('SADD', prefix .. 'trgm:' .. field .. ':' .. part, user_key)
+        else
+            redis.call('SREM', prefix .. 'trgm:' .. field .. ':' .. part, user_key)
+        end
+    end
+end
+
+local function search_records(prefix, user_key)
+    local terms = redis.call('GET', prefix .. 'terms:' .. user_key)
+    if not terms then
+        return {'', '', ''}
+    end
+    return decode_string(terms)
+end
+
+local function version_matches(version, expected)
+    if expected == '' then
+        return true
+    end
+    for candidate in string.gmatch(expected, '%d+') do
+        if candidate == version then
+            return true
+        end
+    end
+    return false
+end
+"""
+
+#Изменяет переданные поля пользователя, если он существует и его
+#версия совпадает с одной из ожидаемых, и увеличивает версию.
+#ARGV: формат, ожидаемые версии через пробел (пустая строка - любая),
+#префикс индексов поиска (пустая строка - без индексов), затем поля
+#без версии: "=" и новое значение либо пустая строка, если поле
+#не изменяется, затем записи индексов поиска новых значений полей.
+#Возвращает nil, если пользователя нет, иначе {1, новое значение},
+#{2, текущее значение}, если данные не изменились и запись не
+#выполнялась, либо {0, текущее значение}, если версия не совпала.
+UPDATE_USER = PRELUDE + """
+local value = redis.call('GET', KEYS[1])
+if not value then
+    return false
+end
+local fields = decode_user(value, ARGV[1])
+if not version_matches(fields[VERSION_FIELD], ARGV[2]) then
+    return {0, value}
+end
+local changed = {}
+local field_count = (#ARGV - 3) / 2
+for index = 1, field_count do
+    local argument = ARGV[index + 3]
+    if argument ~= '' and fields[index] ~= string.sub(argument, 2) then
+        fields[index] = string.sub(argument, 2)
+        table.insert(changed, index)
+    end
+end
+if #changed == 0 then
+    return {2, value}
+end
+fields[VERSION_FIELD] = tostring(tonumber(fields[VERSION_FIELD]) + 1)
+value = encode_user(fields, ARGV[1])
+redis.call('SET', KEYS[1], value)
+local prefix = ARGV[3]
+if prefix ~= '' then
+    local records = search_records(prefix, KEYS[1])
+    for _, index in ipairs(changed) do
+        index_field(prefix, index, KEYS[1], records[index], false)
+        records[index] = ARGV[index + 3 + field_count]
+        index_field(prefix, index, KEYS[1], records[index], true)
+    end
+    redis.call('SET', prefix .. 'terms:' .. KEYS[1], encode_string(records))
+end
+return {1, value}
+"""
+
+#Удаляет пользователя, если его версия совпадает с одной из
+#ожидаемых. ARGV: формат, ожидаемые версии через пробел, префикс
+#индексов поиска (пустая строка - без индексов).
+#Возвращает nil, если пользователя нет, иначе {1, удаленное значение}
+#либо {0, текущее значение}, если версия не совпала.
+DELETE_USER = PRELUDE + """
+local value = redis.call('GET', KEYS[1])
+if not value then
+    return false
+end
+if not version_matches(decode_user(value, ARGV[1])[VERSION_FIELD], ARGV[2]) then
+    return {0, value}
+end
+redis.call('DEL', KEYS[1])
+local prefix = ARGV[3]
+if prefix ~= '' then
+    for index, record in ipairs(search_records(prefix, KEYS[1])) do
+        index_field(prefix, index, KEYS[1], record, false)
+    end
+    redis.call('DEL', prefix .. 'terms:' .. KEYS[1])
+end
+return {1, value}
+"""
+
+#Записывает значения пользователей из реляционной СУБД, если в redis
+#нет более новой версии и пользователь не удален: значение
+#записывается, если нет отметки удаления и ключа нет либо его версия
+#меньше либо равна, но значение отличается.
+#KEYS: ключи пользователей, затем ключи их отметок удаления.
+#ARGV: формат, затем для каждого ключа значение и версия.
+#Возвращает число записанных значений.
+SET_USERS_IF_NEWER = PRELUDE + """
+local written = 0
+local count = #KEYS / 2
+for index = 1, count do
+    local key = KEYS[index]
+    local value = ARGV[index * 2]
+    local version = tonumber(ARGV[index * 2 + 1])
+    local write = redis.call('EXISTS', KEYS[count + index]) == 0
+    if write then
+        local current = redis.call('GET', key)
+        if current == value then
+            write = false
+        elseif current then
+            write = tonumber(decode_user(current, ARGV[1])[VERSION_FIELD]) <= version
+        end
+    end
+    if write then
+        redis.call('SET', key, value)
+        written = written + 1
+    end
+end
+return written
+"""
+
+#Удаляет пользователей и оставляет отметки удаления, которые не дают
+#SET_USERS_IF_NEWER записать их снова. Существующая отметка не
+#продлевается.
+#KEYS: ключи пользователей, затем ключи их отметок удаления.
+#ARGV: время жизни отметки в миллисекундах.
+#Возвращает число удаленных значений.
+REMOVE_USERS = """
+local removed = 0
+local count = #KEYS / 2
+for index = 1, count do
+    removed = removed + redis.call('DEL', KEYS[index])
+    redis.call('SET', KEYS[count + index], 1, 'PX', ARGV[1], 'NX')
+end
+return removed
+"""
+
+
+class RedisUserScripts():
+    """Класс выполняет изменения пользователей в redis Lua-скриптами.
+
+    Проверка существования и версии и изменение выполняются на
+    сервере атомарно, за одно обращение командой EVALSHA. Скрипты
+    загружаются на сервер при запуске приложения методом load();
+    если сервер их не знает(например, после перезапуска redis),
+    скрипт загружается повторно автоматически.
+
+    При заданном search_prefix скрипты изменяют ключи индексов поиска,
+    не переданные в KEYS: для этого нужен один сервер redis, а не
+    Redis Cluster.
+
+    Attributes
+    ----------
+    CONFLICT : int
+        версия пользователя не совпала, изменения нет
+    APPLIED : int
+        изменение выполнено
+    UNCHANGED : int
+        данные не изменились, запись не выполнялась
+
+    Methods
+    -------
+    load()
+        Загружает скрипты на сервер redis.
+
+    update_user()
+        Перезаписывает существующего пользователя.
+
+    delete_user()
+        Удаляет пользователя.
+
+    set_users_if_newer()
+        Записывает пользователей, если в redis нет более новой версии.
+
+    remove_users()
+        Удаляет пользователей с отметкой удаления.
+    """
+
+    CONFLICT = 0
+    APPLIED = 1
+    UNCHANGED = 2
+
+    def __init__(self, redis: Redis, value_format: str, search_prefix: str = ''):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        redis: Redis
+            Экземпляр redis.
+        value_format: str
+            Формат значения пользователя: string либо msgpack.
+        search_prefix: str
+            Префикс ключей индексов поиска RedisUserSearchIndex,
+            пустая строка - индексы не изменяются.
+        """
+
+        self.redis = redis
+        self.value_format = value_format
+        self.search_prefix = search_prefix
+        self._update_user = redis.register_script(UPDATE_USER)
+        self._delete_user = redis.register_script(DELETE_USER)
+        self._set_users_if_newer = redis.register_script(SET_USERS_IF_NEWER)
+        self._remove_users = redis.register_script(REMOVE_USERS)
+
+    async def load(self):
+        """Загружает скрипты на сервер redis.
+
+        Ошибка загрузки не прерывает запуск приложения: скрипт
+        будет загружен при первом вызове.
+        """
+
+        for script in (
+            self._update_user,
+            self._delete_user,
+            self._set_users_if_newer,
+            self._remove_users,
+        ):
+            try:
+                await self.redis.script_load(script.script)
+            except Exception as some_ex:
+                logger.warning(
+                    'Ошибка загрузки скрипта',
+                    exc_info=some_ex,
+                    extra={'backend': 'redis', 'operation': 'script_load'},
+                )
+
+    @staticmethod
+    def _expected(expected_versions: Optional[List[int]]) -> str:
+        if expected_versions is None:
+            return ''
+        #Пустой список не совпадает ни с одной версией.
+        return ' '.join(str(version) for version in expected_versions) or '-'
+
+    async def update_user(
+        self,
+        user_key: bytes,
+        fields: List[Optional[str]],
+        expected_versions: Optional[List[int]] = None,
+    ) -> Optional[Tuple[int, bytes]]:
+        """Изменяет поля существующего пользователя и увеличивает
+        его версию, если данные действительно изменились.
+
+        Возвращает None, если пользователя нет, иначе результат
+        (CONFLICT, APPLIED либо UNCHANGED) и значение: новое после
+        изменения, иначе текущее.
+
+        Parameters
+        ----------
+        user_key: bytes
+            Ключ пользователя.
+        fields: List[Optional[str]]
+            Новые значения полей без версии, None - не изменять.
+        expected_versions: Optional[List[int]]
+            Допустимые текущие версии, None - любая.
+        """
+
+        result = await self._update_user(
+            keys=[user_key],
+            args=[
+                self.value_format,
+                self._expected(expected_versions),
+                self.search_prefix,
+                *('' if field is None else '=' + field for field in fields),
+                *(
+                    '' if field is None or not self.search_prefix
+                    else RedisUserSearchIndex.field_terms(field)
+                    for field in fields
+                ),
+            ],
+        )
+        if result is None:
+            return None
+        return int(result[0]), result[1]
+
+    async def delete_user(
+        self,
+        user_key: bytes,
+        expected_versions: Optional[List[int]] = None,
+    ) -> Optional[Tuple[bool, bytes]]:
+        """Удаляет пользователя.
+
+        Возвращает None, если пользователя нет, иначе признак
+        удаления и значение пользователя.
+
+        Parameters
+        ----------
+        user_key: bytes
+            Ключ пользователя.
+        expected_versions: Optional[List[int]]
+            Допустимые текущие версии, None - любая.
+        """
+
+        result = await self._delete_user(
+            keys=[user_key],
+            args=[
+                self.value_format,
+                self._expected(expected_versions),
+                self.search_prefix,
+            ],
+        )
+        if result is None:
+            return None
+        return bool(result[0]), result[1]
+
+    async def set_users_if_newer(
+        self,
+        user_keys: List[bytes],
+        values: List[bytes],
+        versions: List[int],
+        tombstone_keys: List[bytes],
+    ) -> int:
+        """Записывает значения пользователей, если в redis нет более
+        новой версии и отметки удаления, и возвращает число записанных.
+
+        Parameters
+        ----------
+        user_keys: List[bytes]
+            Ключи пользователей.
+        values: List[bytes]
+            Значения пользователей.
+        versions: List[int]
+            Версии пользователей.
+        tombstone_keys: List[bytes]
+            Ключи отметок удаления пользователей.
+        """
+
+        if not user_keys:
+            return 0
+        args = [self.value_format]
+        for value, version in zip(values, versions):
+            args.extend((value, version))
+        return await self._set_users_if_newer(
+            keys=[*user_keys, *tombstone_keys],
+            args=args,
+        )
+
+    async def remove_users(
+        self,
+        user_keys: List[bytes],
+        tombstone_keys: List[bytes],
+        tombstone_ttl: int,
+    ) -> int:
+        """Удаляет пользователей, оставляя отметки удаления, и
+        возвращает число удаленных.
+
+        Parameters
+        ----------
+        user_keys: List[bytes]
+            Ключи пользователей.
+        tombstone_keys: List[bytes]
+            Ключи отметок удаления пользователей.
+        tombstone_ttl: int
+            Время жизни отметок удаления в секундах.
+        """
+
+        if not user_keys:
+            return 0
+        return await self._remove_users(
+            keys=[*user_keys, *tombstone_keys],
+            args=[tombstone_ttl * 1000],
+        )
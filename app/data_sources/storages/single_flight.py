@@ -0,0 +1,95 @@
+"""Модуль содержит объединение одновременных одинаковых обращений
+к хранилищу.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight():
+    """Класс объединяет одновременные обращения с одинаковым ключом
+    в одно.
+
+    Первое обращение по ключу запускает вызов отдельной задачей,
+    обращения, пришедшие до его завершения, ждут ту же задачу и
+    получают ее результат либо исключение. Результат не сохраняется:
+    после завершения вызова следующее обращение выполняет новый.
+    Отмена ожидающего обращения не отменяет общий вызов. Блокировки
+    не нужны: все операции выполняются в цикле событий одного
+    процесса.
+
+    Methods
+    -------
+    do()
+        Выполняет вызов либо присоединяется к выполняющемуся.
+
+    forget()
+        Отвязывает выполняющийся вызов от ключа.
+
+    stats()
+        Возвращает счетчики вызовов.
+    """
+
+    def __init__(self):
+        """Инициализатор класса."""
+
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+        self.forgotten = 0
+
+    async def do(self, key: str, call: Callable[[], Awaitable]) -> Tuple[Any, bool]:
+        """Выполняет вызов либо присоединяется к выполняющемуся вызову
+        с тем же ключом и возвращает результат и признак того, что
+        он получен чужим вызовом.
+
+        Parameters
+        ----------
+        key: str
+            Ключ обращения.
+        call: Callable[[], Awaitable]
+            Вызов, который выполняется, если вызова с этим ключом нет.
+        """
+
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            self.calls += 1
+            task.add_done_callback(lambda done: self._release(key, done))
+        return await asyncio.shield(task), shared
+
+    def _release(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        #Исключение получают ожидающие обращения; если их не осталось,
+        #оно считается полученным.
+        if not task.cancelled():
+            task.exception()
+
+    def forget(self, key: str):
+        """Отвязывает выполняющийся вызов от ключа: ожидающие его
+        обращения получат его результат, а следующие выполнят новый
+        вызов. Вызывается после изменения данных, которые мог
+        прочитать выполняющийся вызов.
+
+        Parameters
+        ----------
+        key: str
+            Ключ обращения.
+        """
+
+        if self._calls.pop(key, None) is not None:
+            self.forgotten += 1
+
+    def stats(self) -> dict:
+        """Возвращает счетчики вызовов."""
+
+        return {
+            'in_flight': len(self._calls),
+            'calls': self.calls,
+            'shared': self.shared,
+            'forgotten': self.forgotten,
+        }
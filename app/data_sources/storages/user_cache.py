@@ -0,0 +1,332 @@
+"""Модуль содержит кэш пользователей в redis."""
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+#Запись в кэш только более новых данных. Записи кэша - JSON:
+#данные пользователя с полем version, {} - пользователя нет,
+#{"tombstone": версия} - пользователь изменен до этой версии,
+#{"deleted": true} - пользователь удален. Загруженные данные
+#записываются, только если они новее записи кэша: версия больше
+#версии данных либо не меньше версии отметки изменения; отметку
+#удаления загруженные данные не заменяют. Отметка изменения
+#записывается, только если в кэше нет той же или более новой
+#версии.
+#KEYS[1] - ключ записи.
+#ARGV[1] - вид записи: load, updated либо deleted.
+#ARGV[2] - запись JSON.
+#ARGV[3] - версия записи, 0 - пользователя нет.
+#ARGV[4] - время жизни записи в миллисекундах.
+#Возвращает 1, если запись выполнена, иначе 0.
+SET_IF_NEWER = """
+local mode = ARGV[1]
+local version = tonumber(ARGV[3])
+local current = redis.call('GET', KEYS[1])
+if current and mode ~= 'deleted' then
+    local entry = cjson.decode(current)
+    if entry['deleted'] then
+        return 0
+    end
+    if mode == 'load' then
+        if entry['tombstone'] then
+            if version < tonumber(entry['tombstone']) then
+                return 0
+            end
+        elseif entry['version'] then
+            if version <= tonumber(entry['version']) then
+                return 0
+            end
+        elseif version == 0 then
+            return 0
+        end
+    else
+        local current_version = tonumber(entry['tombstone'] or entry['version'] or 0)
+        if current_version >= version then
+            return 0
+        end
+    end
+end
+redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[4])
+return 1
+"""
+
+
+class RedisUserCache():
+    """Кэш данных пользователей в redis с защитой от лавины запросов.
+
+    Одновременные промахи по одному ключу в пределах процесса
+    объединяются в одну загрузку, а между процессами загрузку
+    выполняет только тот, кто захватил короткую блокировку в redis,
+    остальные ждут появления значения в кэше. Отсутствие пользователя
+    тоже кэшируется, на время MISSING_TTL, в виде пустого словаря.
+
+    Изменения не записывают данные в кэш, а заменяют запись
+    отметкой изменения с новой версией либо отметкой удаления на
+    время TOMBSTONE_TTL. Загруженные данные записываются скриптом
+    SET_IF_NEWER, только если они новее записи кэша, поэтому
+    загрузка, прочитавшая пользователя до изменения либо удаления,
+    не перезапишет кэш устаревшими данными.
+
+    Attributes
+    ----------
+    KEY_PREFIX : str
+        префикс ключей кэша
+    MISSING_TTL : int
+        время жизни записи об отсутствии пользователя в секундах
+    TOMBSTONE_TTL : int
+        время жизни отметок изменения и удаления в секундах
+    LOCK_TTL_MS : int
+        время жизни блокировки загрузки в миллисекундах
+    LOCK_WAIT_INTERVAL : float
+        интервал проверки кэша при ожидании чужой загрузки в секундах
+
+    Methods
+    -------
+    get()
+        Возвращает данные пользователя из кэша.
+
+    set()
+        Сохраняет данные пользователя в кэш, если они новее.
+
+    invalidate()
+        Отмечает изменение пользователя.
+
+    mark_deleted()
+        Отмечает удаление пользователя.
+
+    get_or_load()
+        Возвращает данные пользователя из кэша либо загружает их.
+    """
+
+    #Версия формата записи в префиксе: записи прежних форматов
+    #(без поля version и без отметок изменений) не читаются
+    #и истекают сами.
+    KEY_PREFIX = 'cache:user:v3:'
+    MISSING_TTL = 5
+    TOMBSTONE_TTL = 30
+    LOCK_TTL_MS = 1000
+    LOCK_WAIT_INTERVAL = 0.01
+
+    def __init__(self, redis: Redis, ttl: int):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        redis: Redis
+            Экземпляр redis.
+        ttl: int
+            Время жизни записи кэша в секундах.
+        """
+
+        self.redis = redis
+        self.ttl = ttl
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._set_if_newer = redis.register_script(SET_IF_NEWER)
+
+    def _key(self, user_id: str) -> str:
+        return self.KEY_PREFIX + user_id
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        """Возвращает данные пользователя из кэша.
+
+        Ошибки redis не прерывают запрос: в этом случае
+        возвращается None, как при промахе.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+        """
+
+        try:
+            user = await self.redis.get(self._key(user_id))
+        except Exception as some_ex:
+            logger.warning(
+                'Ошибка кэша',
+                exc_info=some_ex,
+                extra={'backend': 'redis', 'operation': 'cache_get'},
+            )
+            return None
+        if user is None:
+            return None
+        user = json.loads(user)
+        if 'tombstone' in user:
+            return None
+        if 'deleted' in user:
+            return {}
+        return user
+
+    async def _write(self, operation: str, user_id: str, mode: str, entry: dict, version: int, ttl: int) -> bool:
+        try:
+            return bool(await self._set_if_newer(
+                keys=[self._key(user_id)],
+                args=[mode, json.dumps(entry), version, ttl * 1000],
+            ))
+        except Exception as some_ex:
+            logger.warning(
+                'Ошибка кэша',
+                exc_info=some_ex,
+                extra={'backend': 'redis', 'operation': operation},
+            )
+            return False
+
+    async def set(self, user_id: str, user: dict) -> bool:
+        """Сохраняет загруженные данные пользователя в кэш, если они
+        новее записи кэша, и возвращает True, если запись выполнена.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+        user: dict
+            Данные пользователя, пустой словарь если пользователя нет.
+        """
+
+        return await self._write(
+            'cache_set',
+            user_id,
+            'load',
+            user,
+            user.get('version', 0),
+            self.ttl if user else self.MISSING_TTL,
+        )
+
+    async def invalidate(self, user_id: str, version: int):
+        """Заменяет данные пользователя в кэше отметкой изменения:
+        следующее чтение загрузит их заново, а загруженные данные
+        версии меньше version не будут записаны.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+        version: int
+            Версия пользователя после изменения.
+        """
+
+        await self._write(
+            'cache_invalidate',
+            user_id,
+            'updated',
+            {'tombstone': version},
+            version,
+            self.TOMBSTONE_TTL,
+        )
+
+    async def mark_deleted(self, user_id: str):
+        """Заменяет данные пользователя в кэше отметкой удаления:
+        чтения получают отсутствие пользователя, а загруженные данные
+        не будут записаны.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+        """
+
+        await self._write(
+            'cache_invalidate',
+            user_id,
+            'deleted',
+            {'deleted': True},
+            0,
+            self.TOMBSTONE_TTL,
+        )
+
+    async def get_or_load(
+        self,
+        user_id: str,
+        loader: Callable[[], Awaitable[dict]],
+    ) -> dict:
+        """Возвращает данные пользователя из кэша либо загружает их.
+
+        Возвращает пустой словарь, если пользователя нет.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+        loader: Callable[[], Awaitable[dict]]
+            Функция загрузки данных пользователя из источника,
+            возвращает пустой словарь, если пользователя нет.
+        """
+
+        user = await self.get(user_id)
+        if user is not None:
+            return user
+        loading = self._loading.get(user_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+        loading = asyncio.get_running_loop().create_future()
+        self._loading[user_id] = loading
+        try:
+            user = await self._load_locked(user_id, loader)
+        except BaseException as some_ex:
+            loading.set_exception(some_ex)
+            #Исключение уже передано ожидающим, чтобы оно не
+            #считалось необработанным, если ожидающих нет.
+            loading.exception()
+            raise
+        else:
+            loading.set_result(user)
+            return user
+        finally:
+            del self._loading[user_id]
+
+    async def _load_locked(
+        self,
+        user_id: str,
+        loader: Callable[[], Awaitable[dict]],
+    ) -> dict:
+        """Загружает данные пользователя под блокировкой в redis.
+
+        Если блокировку держит другой процесс, ожидает появления
+        значения в кэше не дольше времени жизни блокировки, а затем
+        загружает данные самостоятельно.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+        loader: Callable[[], Awaitable[dict]]
+            Функция загрузки данных пользователя из источника,
+            возвращает пустой словарь, если пользователя нет.
+        """
+
+        lock_key = self._key(user_id) + ':lock'
+        try:
+            locked = await self.redis.set(
+                lock_key, 1, nx=True, px=self.LOCK_TTL_MS,
+            )
+        except Exception as some_ex:
+            logger.warning(
+                'Ошибка кэша',
+                exc_info=some_ex,
+                extra={'backend': 'redis', 'operation': 'cache_lock'},
+            )
+            locked = True
+        if not locked:
+            for _ in range(int(self.LOCK_TTL_MS / 1000 / self.LOCK_WAIT_INTERVAL)):
+                await asyncio.sleep(self.LOCK_WAIT_INTERVAL)
+                user = await self.get(user_id)
+                if user is not None:
+                    return user
+        try:
+            user = await loader()
+            await self.set(user_id, user)
+            return user
+        finally:
+            if locked:
+                try:
+                    await self.redis.delete(lock_key)
+                except Exception as some_ex:
+                    logger.warning(
+                        'Ошибка кэша',
+                        exc_info=some_ex,
+                        extra={'backend': 'redis', 'operation': 'cache_unlock'},
+                    )
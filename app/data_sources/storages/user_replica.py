@@ -0,0 +1,331 @@
+"""Модуль содержит реплику пользователей реляционной СУБД в redis."""
+import asyncio
+import logging
+import uuid
+from typing import Dict, List, Optional, Sequence
+
+from redis.asyncio import Redis
+from sqlalchemy import any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from data_sources.models import User_model, User_outbox_model
+from data_sources.storages.redis_codec import RedisUserCodec
+from data_sources.storages.redis_scripts import RedisUserScripts
+
+logger = logging.getLogger(__name__)
+
+
+class RedisUserReplica():
+    """Класс поддерживает в redis копию пользователей реляционной СУБД.
+
+    Пользователи хранятся в формате UserRepositoryNoSQL. Изменения
+    переносятся из очереди user_outbox, которую заполняет триггер
+    таблицы user в одной транзакции с изменением: фоновая задача
+    забирает пачку записей очереди(FOR UPDATE SKIP LOCKED, поэтому
+    процессы приложения не мешают друг другу), читает текущие строки
+    пользователей и записывает их в redis либо удаляет оттуда
+    удаленных, а записи очереди удаляются только после записи в redis.
+    Значения записываются, только если в redis нет более новой версии,
+    поэтому повторный и несвоевременный перенос не портит реплику.
+    Удаление оставляет в redis отметку удаления на TOMBSTONE_TTL
+    секунд, и запись, прочитанная до удаления(например, другим
+    процессом, забравшим более раннюю запись очереди), не вернет
+    удаленного пользователя в реплику.
+    Сверка reconcile() исправляет расхождения, возникшие в обход
+    очереди.
+
+    Attributes
+    ----------
+    TOMBSTONE_PREFIX : bytes
+        префикс ключей отметок удаления перед ключом пользователя
+    TOMBSTONE_TTL : int
+        время жизни отметки удаления в секундах
+    SELECT_USERS_BY_IDS : Select
+        выборка пользователей по массиву id
+    DRAIN_OUTBOX : Delete
+        удаление пачки записей очереди с возвратом id пользователей
+
+    Methods
+    -------
+    get_users()
+        Возвращает данные пользователей по списку id.
+
+    write_users()
+        Записывает пользователей в реплику.
+
+    remove_users()
+        Удаляет пользователей из реплики.
+
+    drain_outbox()
+        Переносит в реплику пачку изменений из очереди.
+
+    reconcile()
+        Сверяет реплику с реляционной СУБД.
+
+    start()
+        Запускает фоновый перенос изменений.
+
+    stop()
+        Останавливает фоновый перенос изменений.
+    """
+
+    TOMBSTONE_PREFIX = b'deleted:'
+    TOMBSTONE_TTL = 86400
+    SELECT_USERS_BY_IDS = select(User_model).where(
+        User_model.c.id == any_(
+            bindparam('user_ids', type_=ARRAY(UUID(as_uuid=True))),
+        ),
+    )
+    DRAIN_OUTBOX = User_outbox_model.delete().where(
+        User_outbox_model.c.id.in_(
+            select(User_outbox_model.c.id)
+            .order_by(User_outbox_model.c.id)
+            .limit(bindparam('batch_size'))
+            .with_for_update(skip_locked=True)
+        ),
+    ).returning(User_outbox_model.c.user_id)
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        redis: Redis,
+        codec: RedisUserCodec,
+        scripts: RedisUserScripts,
+        batch_size: int,
+        poll_interval: float,
+        reconcile_interval: float,
+    ):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        engine: AsyncEngine
+            Движок базы данных.
+        redis: Redis
+            Экземпляр redis.
+        codec: RedisUserCodec
+            Формат хранения пользователей в redis.
+        scripts: RedisUserScripts
+            Lua-скрипты изменения пользователей.
+        batch_size: int
+            Число записей очереди и пользователей сверки за раз.
+        poll_interval: float
+            Интервал проверки пустой очереди в секундах.
+        reconcile_interval: float
+            Интервал сверки в секундах, 0 - без сверки.
+        """
+
+        self.engine = engine
+        self.redis = redis
+        self.codec = codec
+        self.scripts = scripts
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.reconcile_interval = reconcile_interval
+        self._tasks: List[asyncio.Task] = []
+
+    async def get_users(self, user_ids: List[uuid.UUID]) -> List[Optional[dict]]:
+        """Возвращает данные пользователей по списку id одной
+        командой MGET, для не найденных- None.
+
+        Parameters
+        ----------
+        user_ids: List[uuid.UUID]
+            Список id пользователей.
+        """
+
+        values = await self.redis.mget([self.codec.key(user_id) for user_id in user_ids])
+        return [
+            {'id': str(user_id), **self.codec.decode(value)} if value is not None else None
+            for user_id, value in zip(user_ids, values)
+        ]
+
+    async def write_users(self, users: Sequence[Sequence]) -> int:
+        """Записывает пользователей в реплику, если в ней нет более
+        новой версии, и возвращает число записанных.
+
+        Parameters
+        ----------
+        users: Sequence[Sequence]
+            Строки пользователей: id, surname, name, patronymic, version.
+        """
+
+        if not users:
+            return 0
+        keys, values, versions = [], [], []
+        for user in users:
+            keys.append(self.codec.key(uuid.UUID(str(user[0]))))
+            values.append(self.codec.encode({
+                'surname': user[1],
+                'name': user[2],
+                'patronymic': user[3],
+                'version': user[4],
+            }))
+            versions.append(user[4])
+        return await self.scripts.set_users_if_newer(
+            keys,
+            values,
+            versions,
+            [self._tombstone_key(key) for key in keys],
+        )
+
+    async def remove_users(self, user_ids: List[uuid.UUID]) -> int:
+        """Удаляет пользователей из реплики, оставляя отметки
+        удаления, и возвращает число удаленных.
+
+        Parameters
+        ----------
+        user_ids: List[uuid.UUID]
+            Список id пользователей.
+        """
+
+        if not user_ids:
+            return 0
+        keys = [self.codec.key(user_id) for user_id in user_ids]
+        return await self.scripts.remove_users(
+            keys,
+            [self._tombstone_key(key) for key in keys],
+            self.TOMBSTONE_TTL,
+        )
+
+    def _tombstone_key(self, key: bytes) -> bytes:
+        #Отметки лежат вне префикса пользователей и не попадают
+        #в SCAN сверки и UserRepositoryNoSQL.
+        return self.TOMBSTONE_PREFIX + key
+
+    async def drain_outbox(self) -> int:
+        """Переносит в реплику пачку изменений из очереди и
+        возвращает число обработанных записей очереди.
+
+        Записи очереди удаляются в одной транзакции с чтением строк
+        пользователей и фиксируются после записи в redis; при ошибке
+        redis они остаются в очереди.
+        """
+
+        async with self.engine.connect() as connection:
+            result = await connection.execute(
+                RedisUserReplica.DRAIN_OUTBOX,
+                {'batch_size': self.batch_size},
+            )
+            entries = result.scalars().all()
+            if not entries:
+                await connection.rollback()
+                return 0
+            user_ids = list(set(entries))
+            result = await connection.execute(
+                RedisUserReplica.SELECT_USERS_BY_IDS,
+                {'user_ids': user_ids},
+            )
+            users = result.all()
+            found_ids = {user[0] for user in users}
+            await self.write_users(users)
+            await self.remove_users([
+                user_id for user_id in user_ids if user_id not in found_ids
+            ])
+            await connection.commit()
+            return len(entries)
+
+    async def reconcile(self) -> Dict[str, int]:
+        """Сверяет реплику с реляционной СУБД.
+
+        Все пользователи реляционной СУБД читаются серверным курсором
+        и записываются в реплику, если там их нет либо данные
+        отличаются, затем из реплики удаляются пользователи, которых
+        нет в реляционной СУБД.
+        """
+
+        counts = {'checked': 0, 'written': 0, 'removed': 0}
+        async with self.engine.connect() as connection:
+            result = await connection.stream(
+                select(User_model).execution_options(yield_per=self.batch_size),
+            )
+            async for users in result.partitions():
+                counts['checked'] += len(users)
+                counts['written'] += await self.write_users(users)
+        keys = []
+        async for key in self.redis.scan_iter(match=self.codec.match, count=self.batch_size):
+            keys.append(key)
+            if len(keys) >= self.batch_size:
+                counts['removed'] += await self._remove_missing(keys)
+                keys = []
+        if keys:
+            counts['removed'] += await self._remove_missing(keys)
+        return counts
+
+    async def _remove_missing(self, keys: List[bytes]) -> int:
+        user_ids = []
+        for key in keys:
+            try:
+                user_ids.append(uuid.UUID(self.codec.user_id(key)))
+            except ValueError:
+                continue
+        async with self.engine.connect() as connection:
+            result = await connection.execute(
+                RedisUserReplica.SELECT_USERS_BY_IDS,
+                {'user_ids': user_ids},
+            )
+            found_ids = {user[0] for user in result.all()}
+        return await self.remove_users([
+            user_id for user_id in user_ids if user_id not in found_ids
+        ])
+
+    def start(self):
+        """Запускает фоновый перенос изменений и сверку."""
+
+        if self._tasks:
+            return
+        self._tasks.append(asyncio.create_task(self._drain_forever()))
+        if self.reconcile_interval > 0:
+            self._tasks.append(asyncio.create_task(self._reconcile_forever()))
+
+    async def stop(self):
+        """Останавливает фоновый перенос изменений и сверку."""
+
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def _drain_forever(self):
+        while True:
+            try:
+                drained = await self.drain_outbox()
+            except asyncio.CancelledError:
+                raise
+            except Exception as some_ex:
+                logger.warning(
+                    'Ошибка переноса изменений в реплику',
+                    exc_info=some_ex,
+                    extra={'backend': 'redis', 'operation': 'replica_drain'},
+                )
+                drained = 0
+            #Пока очередь отдает полные пачки, следующая забирается сразу.
+            if drained < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def _reconcile_forever(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                counts = await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as some_ex:
+                logger.warning(
+                    'Ошибка сверки реплики',
+                    exc_info=some_ex,
+                    extra={'backend': 'redis', 'operation': 'replica_reconcile'},
+                )
+                continue
+            if counts['written'] or counts['removed']:
+                logger.warning(
+                    'Исправлены расхождения реплики: записано %s, удалено %s',
+                    counts['written'],
+                    counts['removed'],
+                    extra={'backend': 'redis', 'operation': 'replica_reconcile'},
+                )
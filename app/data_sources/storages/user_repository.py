@@ -2,19 +2,231 @@
 NoSQL СУБД.
 
 """
+import asyncio
+import logging
 import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
+from asyncpg.exceptions import DataError as PostgresDataError
+from asyncpg.exceptions import IntegrityConstraintViolationError
 from fastapi import HTTPException
 from starlette import status
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import (
+    Integer,
+    String,
+    any_,
+    bindparam,
+    func,
+    select,
+    true,
+    tuple_,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
 
 from pydantic_models.pydantic_models import (
+    UserModel,
     UserUpdateResp,
     UserResp,
+    UsersBatchResp,
+    UsersPageResp,
+    UsersSearchResp,
 )
-from data_sources.models import User_model
+from bulk_export import users_to_csv, users_to_ndjson
+from data_sources.models import User_model, engine
+from data_sources.user_ids import uuid7
+from data_sources.storages.local_cache import LocalUserCache
+from data_sources.storages.redis_codec import RedisUserCodec
+from data_sources.storages.redis_scripts import RedisUserScripts
+from data_sources.storages.single_flight import SingleFlight
+from data_sources.storages.user_cache import RedisUserCache
+from data_sources.storages.user_replica import RedisUserReplica
+from data_sources.storages.user_search import RedisUserSearchIndex, search_criteria
+from data_sources.storages.write_batcher import UserWriteBatcher
 from config import settings, redis_instance
+from metrics import REPOSITORY_ERRORS, USER_READS_COALESCED
+
+logger = logging.getLogger(__name__)
+
+
+def report_error(backend: str, operation: str, some_ex: Exception):
+    """Сообщает об ошибке хранилища.
+
+    Parameters
+    ----------
+    backend: str
+        Название хранилища.
+
+    operation: str
+        Название операции репозитория.
+
+    some_ex: Exception
+        Исключение.
+    """
+
+    REPOSITORY_ERRORS.labels(backend, operation).inc()
+    logger.error(
+        'Ошибка хранилища',
+        exc_info=some_ex,
+        extra={'backend': backend, 'operation': operation},
+    )
+
+
+def parse_user_id(user_id: str) -> uuid.UUID:
+    """Преобразует id пользователя из строки в UUID.
+
+    Parameters
+    ----------
+    user_id: str
+        id пользователя.
+
+    Raises
+    ------
+    HTTPException
+        Если строка не является UUID, такого пользователя не существует.
+    """
+
+    try:
+        return uuid.UUID(user_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Пользователь не найден',
+        )
+
+
+def build_update_user(check_version: bool):
+    """Строит запрос частичного обновления пользователя.
+
+    Не переданные поля (NULL) сохраняют текущее значение, а строка
+    перезаписывается, только если значения действительно меняются:
+    UPDATE ... WHERE (surname, name, patronymic) IS DISTINCT FROM (...).
+    Обновление выполняется в CTE, а запрос возвращает одной строкой
+    текущие значения пользователя (первые пять колонок) и, если запись
+    произошла, новые (следующие пять колонок, иначе NULL), поэтому
+    повторный PATCH с теми же данными обходится одним чтением.
+
+    Parameters
+    ----------
+    check_version: bool
+        Обновлять, только если версия совпадает с одной из
+        переданных в параметре versions.
+    """
+
+    new_surname = func.coalesce(
+        bindparam('new_surname', type_=String), User_model.c.surname,
+    )
+    new_name = func.coalesce(
+        bindparam('new_name', type_=String), User_model.c.name,
+    )
+    new_patronymic = func.coalesce(
+        bindparam('new_patronymic', type_=String), User_model.c.patronymic,
+    )
+    conditions = [
+        User_model.c.id == bindparam('user_id'),
+        tuple_(
+            User_model.c.surname, User_model.c.name, User_model.c.patronymic,
+        ).is_distinct_from(tuple_(new_surname, new_name, new_patronymic)),
+    ]
+    if check_version:
+        conditions.append(User_model.c.version == any_(
+            bindparam('versions', type_=ARRAY(Integer)),
+        ))
+    updated_user = User_model.update().where(*conditions).values(
+        surname=new_surname,
+        name=new_name,
+        patronymic=new_patronymic,
+        version=User_model.c.version + 1,
+    ).returning(User_model).cte('updated_user')
+    return select(User_model, updated_user).select_from(
+        User_model.outerjoin(updated_user, true()),
+    ).where(User_model.c.id == bindparam('user_id'))
+
+
+def build_search_users(criteria: Dict[str, str], mode: str, limit: int):
+    """Возвращает запрос поиска пользователей.
+
+    Точный поиск и поиск по началу сравнивают lower(поле) в порядке
+    байт(COLLATE "C") и используют btree-индексы ix_user_<поле>_lower,
+    результат упорядочен по первому полю условий и id. Нечеткий поиск
+    использует оператор % расширения pg_trgm и GIN-индексы
+    ix_user_<поле>_trgm, результат упорядочен по убыванию суммарного
+    сходства.
+
+    Parameters
+    ----------
+    criteria: Dict[str, str]
+        Нормализованные значения полей поиска в порядке SEARCH_FIELDS.
+    mode: str
+        Вид поиска: exact, prefix либо fuzzy.
+    limit: int
+        Максимальное число пользователей.
+    """
+
+    query = select(User_model).limit(limit)
+    similarities = []
+    for field, value in criteria.items():
+        column = func.lower(User_model.c[field])
+        if mode == 'exact':
+            query = query.where(column.collate('C') == value)
+        elif mode == 'prefix':
+            pattern = (
+                value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            )
+            query = query.where(column.collate('C').like(pattern, escape='\\'))
+        else:
+            query = query.where(column.op('%')(value))
+            similarities.append(func.similarity(column, value))
+    if mode == 'fuzzy':
+        return query.order_by(sum(similarities[1:], similarities[0]).desc(), User_model.c.id)
+    first_field = next(iter(criteria))
+    return query.order_by(
+        func.lower(User_model.c[first_field]).collate('C'),
+        User_model.c.id,
+    )
+
+
+def raise_missing_user(exists_user: bool):
+    """Сообщает, почему изменение не затронуло пользователя.
+
+    Parameters
+    ----------
+    exists_user: bool
+        Пользователь существует, но его версия не совпала с
+        ожидаемой.
+    """
+
+    if exists_user:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail='Версия пользователя не совпадает',
+        )
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail='Пользователь не найден',
+    )
+
+
+def split_user_ids(user_ids: List[str]):
+    """Разделяет список id на корректные UUID и некорректные строки.
+
+    Повторяющиеся id учитываются один раз, порядок сохраняется.
+
+    Parameters
+    ----------
+    user_ids: List[str]
+        Список id пользователей.
+    """
+
+    valid_ids = {}
+    invalid_ids = []
+    for user_id in dict.fromkeys(user_ids):
+        try:
+            valid_ids[user_id] = uuid.UUID(user_id)
+        except ValueError:
+            invalid_ids.append(user_id)
+    return valid_ids, invalid_ids
 
 
 class UserRepository():
@@ -28,9 +240,30 @@ class UserRepository():
     create_user()
         Добавляет нового пользователя в бд.
 
+    create_users()
+        Добавляет список пользователей в бд.
+
     get_user()
         Возвращает пользователя.
 
+    get_users()
+        Возвращает список пользователей по списку id.
+
+    list_users()
+        Возвращает страницу списка пользователей.
+
+    stream_users()
+        Возвращает асинхронный итератор по всем пользователям.
+
+    import_users()
+        Записывает пользователей из потока пачек.
+
+    export_users()
+        Возвращает поток выгрузки всех пользователей.
+
+    search_users()
+        Возвращает пользователей по фамилии, имени и отчеству.
+
     update_user()
         Обновляет данные пользователя.
 
@@ -66,9 +299,30 @@ class UserRepository():
 
     async def create_user(self):
         pass
+
+    async def create_users(self):
+        pass
     
     async def get_user(self):
         pass
+
+    async def get_users(self):
+        pass
+
+    async def list_users(self):
+        pass
+
+    async def stream_users(self):
+        pass
+
+    async def import_users(self):
+        pass
+
+    async def export_users(self):
+        pass
+
+    async def search_users(self):
+        pass
     
     async def update_user(self):
         pass
@@ -81,14 +335,38 @@ class UserRepositorySQL(UserRepository):
     """Класс совершает CRUD операции с сущностью
     пользователь с
     использованием реляционной СУБД.
-    
+
+    Если задан write_batcher, добавление и обновление одного
+    пользователя выполняются в составе групповых запросов
+    UserWriteBatcher, и соединение этим методам не требуется.
+
+    Attributes
+    ----------
+    write_batcher : Optional[UserWriteBatcher]
+        групповая запись пользователей
+
     Methods
     -------
     get_user_by_id()
         Возвращает пользователя по id.
+
+    user_exists()
+        Проверяет, существует ли пользователь.
+
+    get_users_by_ids()
+        Возвращает найденных пользователей по списку id.
+
+    iter_users()
+        Возвращает пользователей пачками.
+
+    warm_up()
+        Подготавливает запросы горячих путей в соединении.
     
     create_user()
         Создает нового пользователя.
+
+    create_users()
+        Создает список пользователей.
     
     update_user()
         Обновляет данные пользователя.
@@ -96,15 +374,114 @@ class UserRepositorySQL(UserRepository):
     get_user()
         Возвращает пользователя по id.
 
+    get_users()
+        Возвращает список пользователей по списку id.
+
+    list_users()
+        Возвращает страницу списка пользователей.
+
+    stream_users()
+        Возвращает асинхронный итератор по всем пользователям.
+
+    copy_records()
+        Записывает строки через COPY, отделяя отклоненные СУБД.
+
+    copy_users()
+        Записывает пачки пользователей через COPY.
+
+    import_users()
+        Записывает пользователей из потока пачек.
+
+    copy_out_users()
+        Выгружает всех пользователей в CSV через COPY.
+
+    export_users()
+        Возвращает поток выгрузки всех пользователей.
+
+    search_users()
+        Возвращает пользователей по фамилии, имени и отчеству.
+
     delete_user()
         Удаляет пользователя.
 
     """
 
+    #Названия колонок в порядке, в котором их принимает COPY.
+    COPY_COLUMNS = ('id', 'surname', 'name', 'patronymic', 'version')
+    #Максимальное число строк в одном INSERT: PostgreSQL принимает
+    #не более 32767 параметров в запросе.
+    MAX_ROWS_PER_INSERT = 32767 // len(COPY_COLUMNS)
+
+    #Запросы горячих путей строятся один раз при загрузке модуля и
+    #выполняются с параметрами: SQLAlchemy берет их компиляцию из
+    #кэша движка, а asyncpg - подготовленное выражение из кэша
+    #соединения (DB_STATEMENT_CACHE_SIZE).
+    SELECT_USER_BY_ID = select(User_model).where(
+        User_model.c.id == bindparam('user_id'),
+    )
+    INSERT_USER = User_model.insert().values(
+        id=bindparam('new_id'),
+        surname=bindparam('new_surname'),
+        name=bindparam('new_name'),
+        patronymic=bindparam('new_patronymic'),
+    ).returning(User_model)
+    UPDATE_USER = build_update_user(check_version=False)
+    DELETE_USER = User_model.delete().where(
+        User_model.c.id == bindparam('user_id'),
+    ).returning(User_model.c.id)
+    #Условные изменения для заголовка If-Match: строка изменяется,
+    #только если ее версия совпадает с одной из переданных.
+    VERSION_MATCHES = User_model.c.version == any_(
+        bindparam('versions', type_=ARRAY(Integer)),
+    )
+    UPDATE_USER_IF_VERSION = build_update_user(check_version=True)
+    DELETE_USER_IF_VERSION = DELETE_USER.where(VERSION_MATCHES)
+    #Выборка пользователей по массиву id одним запросом.
+    SELECT_USERS_BY_IDS = select(User_model).where(
+        User_model.c.id == any_(
+            bindparam('user_ids', type_=ARRAY(UUID(as_uuid=True))),
+        ),
+    )
+    #Число строк, которое серверный курсор передает за один раз.
+    STREAM_BATCH_SIZE = 1000
+    #Запрос выгрузки через COPY ... TO STDOUT и число частей вывода
+    #COPY, которые ждут отправки клиенту: при медленном клиенте
+    #чтение результата приостанавливается.
+    COPY_OUT_QUERY = str(select(User_model).compile(dialect=postgresql.dialect()))
+    COPY_OUT_QUEUE_SIZE = 16
+
+    def __init__(
+        self,
+        create: bool,
+        update: bool,
+        read: bool,
+        delete: bool,
+        write_batcher: Optional[UserWriteBatcher] = None,
+    ):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        create: bool
+            Разрешение на добавление данных.
+        update: bool
+            Разрешение на обновление данных.
+        read: bool
+            Разрешение на чтение данных.
+        delete: bool
+            Разрешение на удаление данных.
+        write_batcher: Optional[UserWriteBatcher]
+            Групповая запись пользователей, None - каждое изменение
+            фиксируется отдельной транзакцией.
+        """
+
+        super().__init__(create, update, read, delete)
+        self.write_batcher = write_batcher
+
     @classmethod
     async def get_user_by_id(
         cls, user_id: str,
-        session: AsyncSession,
+        connection: AsyncConnection,
     ):
         """Возвращает пользователя по id.
 
@@ -113,27 +490,139 @@ class UserRepositorySQL(UserRepository):
         user_id: str
             id пользователя.
             
-        session: AsyncSession
-            Сессия соединения с базой данных.
+        connection: AsyncConnection
+            Соединение с базой данных.
         """
 
         try:
-            query = select(User_model).where(User_model.c.id == uuid.UUID(user_id))
-            exists_user = await session.execute(query)
-            exists_user = exists_user.all()
-            if len(exists_user) > 0:
-                return exists_user[0]
+            exists_user = await connection.execute(
+                cls.SELECT_USER_BY_ID,
+                {'user_id': uuid.UUID(user_id)},
+            )
+            exists_user = exists_user.first()
+            if exists_user is not None:
+                return exists_user
             return False
         except Exception as some_ex:
-            print(some_ex)
+            report_error('postgresql', 'get_user_by_id', some_ex)
             return False
 
+    @classmethod
+    async def user_exists(
+        cls,
+        user_id: uuid.UUID,
+        connection: AsyncConnection,
+    ) -> bool:
+        """Проверяет, существует ли пользователь.
+
+        Parameters
+        ----------
+        user_id: uuid.UUID
+            id пользователя.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+        """
+
+        result = await connection.execute(
+            cls.SELECT_USER_BY_ID,
+            {'user_id': user_id},
+        )
+        return result.first() is not None
+
+    @classmethod
+    async def get_users_by_ids(
+        cls,
+        user_ids: List[uuid.UUID],
+        connection: AsyncConnection,
+    ):
+        """Возвращает найденных пользователей по списку id.
+
+        Parameters
+        ----------
+        user_ids: List[uuid.UUID]
+            Список id пользователей.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+        """
+
+        result = await connection.execute(
+            cls.SELECT_USERS_BY_IDS,
+            {'user_ids': user_ids},
+        )
+        return result.all()
+
+    @classmethod
+    async def iter_users(cls, batch_size: int) -> AsyncIterator[List[UserResp]]:
+        """Возвращает всех пользователей пачками.
+
+        Строки читаются через серверный курсор в отдельном соединении,
+        поэтому итератор можно использовать после завершения запроса.
+
+        Parameters
+        ----------
+        batch_size: int
+            Число пользователей в пачке.
+        """
+
+        async with engine.connect() as connection:
+            result = await connection.stream(
+                select(User_model).execution_options(yield_per=batch_size),
+            )
+            async for users in result.partitions():
+                yield [
+                    UserResp(
+                        id=str(user[0]),
+                        surname=user[1],
+                        name=user[2],
+                        patronymic=user[3],
+                        version=user[4],
+                    )
+                    for user in users
+                ]
+
+    @classmethod
+    async def warm_up(cls, connection: AsyncConnection):
+        """Выполняет запросы горячих путей с id, которого нет в базе
+        данных: SQLAlchemy кэширует их компиляцию, а соединение -
+        подготовленные выражения. Транзакция откатывается.
+
+        Parameters
+        ----------
+        connection: AsyncConnection
+            Соединение с базой данных.
+        """
+
+        missing_id = uuid.UUID(int=0)
+        update_parameters = {
+            'user_id': missing_id,
+            'new_surname': None,
+            'new_name': None,
+            'new_patronymic': None,
+        }
+        try:
+            await connection.execute(cls.SELECT_USER_BY_ID, {'user_id': missing_id})
+            await connection.execute(cls.SELECT_USERS_BY_IDS, {'user_ids': [missing_id]})
+            await connection.execute(cls.UPDATE_USER, update_parameters)
+            await connection.execute(
+                cls.UPDATE_USER_IF_VERSION,
+                {**update_parameters, 'versions': [1]},
+            )
+            await connection.execute(cls.DELETE_USER, {'user_id': missing_id})
+            await connection.execute(
+                cls.DELETE_USER_IF_VERSION,
+                {'user_id': missing_id, 'versions': [1]},
+            )
+        finally:
+            await connection.rollback()
+
     async def create_user(
         self,
         surname: str,
         name: str,
         patronymic: str,
-        session: AsyncSession,
+        connection: AsyncConnection,
     ):
         """Создает нового пользователя.
 
@@ -148,8 +637,9 @@ class UserRepositorySQL(UserRepository):
         patronymic: str
             Отчество пользователя.
             
-        session: AsyncSession
-            Сессия соединения с базой данных.
+        connection: AsyncConnection
+            Соединение с базой данных, не используется при групповой
+            записи.
         """
 
         if not self.create:
@@ -157,57 +647,144 @@ class UserRepositorySQL(UserRepository):
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Добавление данных запрещено",
             )
+        parameters = {
+            'new_id': uuid7(),
+            'new_surname': surname,
+            'new_name': name,
+            'new_patronymic': patronymic,
+        }
         try:
-            user_id = uuid.uuid4()
-            query = User_model.insert().values(
-                id=user_id,
-                surname=surname,
-                name=name,
-                patronymic=patronymic,
-            )
-            await session.execute(query)
-            await session.commit()
-            user = await UserRepositorySQL.get_user_by_id(str(user_id), session)
+            if self.write_batcher is not None:
+                user = await self.write_batcher.create_user(parameters)
+            else:
+                result = await connection.execute(
+                    UserRepositorySQL.INSERT_USER,
+                    parameters,
+                )
+                user = result.first()
+                await connection.commit()
             return UserResp(
                 id = str(user[0]),
                 surname = user[1],
                 name = user[2],
                 patronymic = user[3],
+                version = user[4],
             )
         except Exception as some_ex:
-            await session.rollback()
-            print(some_ex)
+            if connection is not None:
+                await connection.rollback()
+            report_error('postgresql', 'create_user', some_ex)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail='Ошибка на стороне сервера',
             )
         
+    async def create_users(
+        self,
+        users: List[UserModel],
+        connection: AsyncConnection,
+    ):
+        """Создает список пользователей за одну транзакцию.
+
+        Пользователи добавляются многострочным INSERT ... RETURNING,
+        а при числе записей не меньше settings.bulk_copy_threshold
+        через COPY.
+
+        Parameters
+        ----------
+        users: List[UserModel]
+            Данные пользователей.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+        """
+
+        if not self.create:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Добавление данных запрещено",
+            )
+        records = [
+            (uuid7(), user.surname, user.name, user.patronymic, 1)
+            for user in users
+        ]
+        if not records:
+            return []
+        try:
+            if len(records) >= settings.bulk_copy_threshold:
+                raw_connection = await connection.get_raw_connection()
+                await raw_connection.driver_connection.copy_records_to_table(
+                    User_model.name,
+                    records=records,
+                    columns=self.COPY_COLUMNS,
+                )
+                created_users = records
+            else:
+                created_users = []
+                for start in range(0, len(records), self.MAX_ROWS_PER_INSERT):
+                    query = User_model.insert().values([
+                        dict(zip(self.COPY_COLUMNS, record))
+                        for record in records[start:start + self.MAX_ROWS_PER_INSERT]
+                    ]).returning(User_model)
+                    result = await connection.execute(query)
+                    created_users.extend(result.all())
+            await connection.commit()
+            return [
+                UserResp(
+                    id=str(user[0]),
+                    surname=user[1],
+                    name=user[2],
+                    patronymic=user[3],
+                    version=user[4],
+                )
+                for user in created_users
+            ]
+        except Exception as some_ex:
+            await connection.rollback()
+            report_error('postgresql', 'create_users', some_ex)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Ошибка на стороне сервера',
+            )
+
     async def update_user(
         self,
-        surname: str,
-        name: str,
-        patronymic: str,
+        surname: Optional[str],
+        name: Optional[str],
+        patronymic: Optional[str],
         user_id: str,
-        session: AsyncSession,
+        connection: AsyncConnection,
+        expected_versions: Optional[List[int]] = None,
     ):
-        """Обновляет данные пользователя.
+        """Обновляет переданные поля пользователя и увеличивает его
+        версию.
+
+        Обновление выполняется одним запросом; если данные не
+        изменились, строка не перезаписывается, версия остается
+        прежней, а в ответе updated=False. При переданных
+        expected_versions запрос дополнительно проверяет
+        version = ANY(?).
 
         Parameters
         ----------
-        surname: str
-            Фамилия пользователя.
+        surname: Optional[str]
+            Фамилия пользователя, None - не изменять.
 
-        name: str
-            Имя пользователя.
+        name: Optional[str]
+            Имя пользователя, None - не изменять.
         
-        patronymic: str
-            Отчество пользователя.
+        patronymic: Optional[str]
+            Отчество пользователя, None - не изменять.
 
         user_id: str
             id пользователя.
             
-        session: AsyncSession
-            Сессия соединения с базой данных.
+        connection: AsyncConnection
+            Соединение с базой данных, не используется при групповой
+            записи.
+
+        expected_versions: Optional[List[int]]
+            Допустимые текущие версии пользователя, None - любая.
         """
 
         if not self.update:
@@ -215,40 +792,57 @@ class UserRepositorySQL(UserRepository):
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Обновление данных запрещено",
             )
-        exists_user = await UserRepositorySQL.get_user_by_id(user_id, session)
-
-        if exists_user:
-            try:
-                query = User_model.update().where(
-                    User_model.c.id == uuid.UUID(user_id),
-                ).values(
-                    surname=surname,
-                    name=name,
-                    patronymic=patronymic,
-                )
-                await session.execute(query)
-                await session.commit()
-                user = await UserRepositorySQL.get_user_by_id(user_id, session)
-                return UserUpdateResp(
-                    id=str(user[0]),
-                    new_surname=user[1],
-                    new_name=user[2],
-                    new_patronymic=user[3],
+        parameters = {
+            'user_id': parse_user_id(user_id),
+            'new_surname': surname,
+            'new_name': name,
+            'new_patronymic': patronymic,
+        }
+        try:
+            if self.write_batcher is not None:
+                row = await self.write_batcher.update_user(
+                    parameters,
+                    expected_versions,
                 )
-            except Exception as some_ex:
-                await session.rollback()
-                print(some_ex)
-                raise HTTPException(
+            else:
+                if expected_versions is None:
+                    result = await connection.execute(
+                        UserRepositorySQL.UPDATE_USER,
+                        parameters,
+                    )
+                else:
+                    result = await connection.execute(
+                        UserRepositorySQL.UPDATE_USER_IF_VERSION,
+                        {**parameters, 'versions': expected_versions},
+                    )
+                row = result.first()
+                await connection.commit()
+        except Exception as some_ex:
+            if connection is not None:
+                await connection.rollback()
+            report_error('postgresql', 'update_user', some_ex)
+            raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail='Ошибка на стороне сервера',
-                )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Пользователь не найден",
             )
+        if row is None:
+            raise_missing_user(False)
+        #Колонки 0-4 - пользователь до обновления, 5-9 - после.
+        updated = row[5] is not None
+        if not updated and expected_versions is not None \
+                and row[4] not in expected_versions:
+            raise_missing_user(True)
+        user = row[5:] if updated else row[:5]
+        return UserUpdateResp(
+            id=str(user[0]),
+            new_surname=user[1],
+            new_name=user[2],
+            new_patronymic=user[3],
+            version=user[4],
+            updated=updated,
+        )
         
-    async def get_user(self, user_id: str, session: AsyncSession):
+    async def get_user(self, user_id: str, connection: AsyncConnection):
         """Возвращает пользователя по id.
 
         Parameters
@@ -256,8 +850,8 @@ class UserRepositorySQL(UserRepository):
         user_id: str
             id пользователя.
             
-        session: AsyncSession
-            Сессия соединения с базой данных.
+        connection: AsyncConnection
+            Соединение с базой данных.
         """
 
         if not self.read:
@@ -265,7 +859,7 @@ class UserRepositorySQL(UserRepository):
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Чтение данных запрещено",
             )
-        user = await UserRepositorySQL.get_user_by_id(user_id, session)
+        user = await UserRepositorySQL.get_user_by_id(user_id, connection)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -277,71 +871,454 @@ class UserRepositorySQL(UserRepository):
                 surname=user[1],
                 name=user[2],
                 patronymic=user[3],
+                version=user[4],
             )
         except Exception as some_ex:
-            print(some_ex)
+            report_error('postgresql', 'get_user', some_ex)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail='Ошибка на стороне сервера',
             )
         
-    async def delete_user(self, user_id: str, session: AsyncSession):
-        """Удаляет пользователя по id.
+    async def get_users(self, user_ids: List[str], connection: AsyncConnection):
+        """Возвращает список пользователей по списку id.
+
+        Не найденные id возвращаются в поле missing.
 
         Parameters
         ----------
-        user_id: str
-            id пользователя.
+        user_ids: List[str]
+            Список id пользователей.
 
-        session: AsyncSession
-            Сессия соединения с базой данных.
+        connection: AsyncConnection
+            Соединение с базой данных.
         """
 
-        if not self.delete:
+        if not self.read:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Удаление данных запрещено",
+                detail="Чтение данных запрещено",
+            )
+        valid_ids, missing = split_user_ids(user_ids)
+        try:
+            found_users = {}
+            if valid_ids:
+                users = await UserRepositorySQL.get_users_by_ids(
+                    list(valid_ids.values()),
+                    connection,
+                )
+                found_users = {user[0]: user for user in users}
+        except Exception as some_ex:
+            report_error('postgresql', 'get_users', some_ex)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Ошибка на стороне сервера',
             )
-        exists_user = await UserRepositorySQL.get_user_by_id(user_id, session)
-        if not exists_user:
+        result_users = []
+        for user_id, target_user_id in valid_ids.items():
+            user = found_users.get(target_user_id)
+            if user is None:
+                missing.append(user_id)
+                continue
+            result_users.append(UserResp(
+                id=str(user[0]),
+                surname=user[1],
+                name=user[2],
+                patronymic=user[3],
+                version=user[4],
+            ))
+        return UsersBatchResp(users=result_users, missing=missing)
+
+    async def list_users(
+        self,
+        limit: int,
+        cursor: Optional[str],
+        connection: AsyncConnection,
+    ):
+        """Возвращает страницу списка пользователей.
+
+        Пользователи упорядочены по id, страница начинается после
+        переданного курсора (id последнего пользователя предыдущей
+        страницы), поэтому запрос не использует OFFSET.
+
+        Parameters
+        ----------
+        limit: int
+            Максимальное число пользователей на странице.
+
+        cursor: Optional[str]
+            Курсор, полученный с предыдущей страницей.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+        """
+
+        if not self.read:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f'Пользователь не найден',
+                detail="Чтение данных запрещено",
             )
+        query = select(User_model).order_by(User_model.c.id).limit(limit)
+        if cursor:
+            try:
+                query = query.where(User_model.c.id > uuid.UUID(cursor))
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail='Некорректный курсор',
+                )
         try:
-            query = User_model.delete().where(User_model.c.id == uuid.UUID(user_id))
-            await session.execute(query)
-            await session.commit()
-            return {
-                "status": True,
-                "message": "Пользователь успешно удален"
-            }
+            result = await connection.execute(query)
+            users = result.all()
         except Exception as some_ex:
-            await session.rollback()
-            print(some_ex)
+            report_error('postgresql', 'list_users', some_ex)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail='Ошибка на стороне сервера',
             )
-        
+        return UsersPageResp(
+            users=[
+                UserResp(
+                    id=str(user[0]),
+                    surname=user[1],
+                    name=user[2],
+                    patronymic=user[3],
+                    version=user[4],
+                )
+                for user in users
+            ],
+            next_cursor=str(users[-1][0]) if len(users) == limit else None,
+        )
 
-class UserRepositoryNoSQL(UserRepository):
-    """Класс совершает CRUD операции с сущностью
-    пользователь с
-    использованием NoSQL СУБД.
+    async def stream_users(self):
+        """Возвращает асинхронный итератор по всем пользователям."""
+
+        if not self.read:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Чтение данных запрещено",
+            )
+        return UserRepositorySQL.iter_users(UserRepositorySQL.STREAM_BATCH_SIZE)
+
+    @classmethod
+    async def copy_records(
+        cls, connection: AsyncConnection, records: List[tuple],
+    ) -> List[Tuple[int, str]]:
+        """Записывает строки через COPY в отдельной транзакции и
+        возвращает позиции отклоненных строк с сообщением СУБД.
+
+        Если СУБД отклонила данные пачки, транзакция откатывается,
+        а пачка делится пополам и записывается по частям, пока
+        не останутся только отклоненные строки. Остальные ошибки,
+        в том числе ошибки фиксации, передаются дальше.
+
+        Parameters
+        ----------
+        connection: AsyncConnection
+            Соединение с базой данных.
+        records: List[tuple]
+            Строки таблицы пользователей.
+        """
+
+        try:
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                User_model.name,
+                records=records,
+                columns=cls.COPY_COLUMNS,
+            )
+        except (PostgresDataError, IntegrityConstraintViolationError) as some_ex:
+            await connection.rollback()
+            if len(records) == 1:
+                return [(0, str(some_ex))]
+            middle = len(records) // 2
+            rejected = await cls.copy_records(connection, records[:middle])
+            for position, error in await cls.copy_records(connection, records[middle:]):
+                rejected.append((middle + position, error))
+            return rejected
+        await connection.commit()
+        return []
+
+    @classmethod
+    async def copy_users(
+        cls, users: AsyncIterator[List[UserModel]],
+    ) -> AsyncIterator[Tuple[int, List[Tuple[int, str]]]]:
+        """Записывает пачки пользователей через COPY и возвращает
+        для каждой пачки число записанных пользователей и позиции
+        отклоненных строк с сообщением СУБД.
+
+        Каждая пачка фиксируется отдельной транзакцией в отдельном
+        соединении, поэтому итератор можно использовать после
+        завершения запроса.
+
+        Parameters
+        ----------
+        users: AsyncIterator[List[UserModel]]
+            Пачки данных пользователей.
+        """
+
+        async with engine.connect() as connection:
+            async for chunk in users:
+                try:
+                    rejected = await cls.copy_records(connection, [
+                        (uuid7(), user.surname, user.name, user.patronymic, 1)
+                        for user in chunk
+                    ])
+                except Exception as some_ex:
+                    await connection.rollback()
+                    report_error('postgresql', 'import_users', some_ex)
+                    raise
+                yield len(chunk) - len(rejected), rejected
+
+    async def import_users(self, users: AsyncIterator[List[UserModel]]):
+        """Возвращает асинхронный итератор, записывающий пачки
+        пользователей и возвращающий для каждой число записанных
+        и позиции отклоненных строк с сообщением хранилища.
+
+        Parameters
+        ----------
+        users: AsyncIterator[List[UserModel]]
+            Пачки данных пользователей.
+        """
+
+        if not self.create:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Добавление данных запрещено",
+            )
+        return UserRepositorySQL.copy_users(users)
+
+    @classmethod
+    async def copy_out_users(cls) -> AsyncIterator[bytes]:
+        """Выгружает всех пользователей в формате CSV с заголовком
+        через COPY ... TO STDOUT в отдельном соединении.
+        """
+
+        async with engine.connect() as connection:
+            raw_connection = await connection.get_raw_connection()
+            parts: 'asyncio.Queue[Optional[bytes]]' = asyncio.Queue()
+            free_slots = asyncio.Semaphore(cls.COPY_OUT_QUEUE_SIZE)
+
+            async def put_part(part: bytearray):
+                await free_slots.acquire()
+                parts.put_nowait(bytes(part))
+
+            async def copy_out():
+                try:
+                    await raw_connection.driver_connection.copy_from_query(
+                        cls.COPY_OUT_QUERY,
+                        output=put_part,
+                        format='csv',
+                        header=True,
+                    )
+                finally:
+                    parts.put_nowait(None)
+
+            copy_task = asyncio.create_task(copy_out())
+            try:
+                while True:
+                    part = await parts.get()
+                    if part is None:
+                        break
+                    free_slots.release()
+                    yield part
+                await copy_task
+            except Exception as some_ex:
+                report_error('postgresql', 'export_users', some_ex)
+                raise
+            finally:
+                if not copy_task.done():
+                    #Выгрузка прервана клиентом: COPY отменяется, а
+                    #соединение не возвращается в пул.
+                    copy_task.cancel()
+                    await asyncio.wait([copy_task])
+                    await connection.invalidate()
+
+    async def export_users(self, export_format: str):
+        """Возвращает асинхронный итератор по частям выгрузки всех
+        пользователей.
+
+        CSV выгружается через COPY, NDJSON- через серверный курсор.
+
+        Parameters
+        ----------
+        export_format: str
+            Формат выгрузки: ndjson либо csv.
+        """
+
+        if not self.read:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Чтение данных запрещено",
+            )
+        if export_format == 'csv':
+            return UserRepositorySQL.copy_out_users()
+        return users_to_ndjson(
+            UserRepositorySQL.iter_users(UserRepositorySQL.STREAM_BATCH_SIZE),
+        )
+
+    async def search_users(
+        self,
+        values: Dict[str, Optional[str]],
+        mode: str,
+        limit: int,
+        connection: AsyncConnection,
+    ):
+        """Возвращает пользователей по фамилии, имени и отчеству.
+
+        Условия по нескольким полям должны выполняться одновременно,
+        регистр букв не учитывается.
+
+        Parameters
+        ----------
+        values: Dict[str, Optional[str]]
+            Значения полей поиска, None - поле не участвует в поиске.
+
+        mode: str
+            Вид поиска: exact, prefix либо fuzzy.
+
+        limit: int
+            Максимальное число пользователей.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+        """
+
+        if not self.read:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Чтение данных запрещено",
+            )
+        criteria = search_criteria(values)
+        if not criteria:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Не заданы условия поиска',
+            )
+        try:
+            result = await connection.execute(build_search_users(criteria, mode, limit))
+            users = result.all()
+        except Exception as some_ex:
+            report_error('postgresql', 'search_users', some_ex)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Ошибка на стороне сервера',
+            )
+        return UsersSearchResp(users=[
+            UserResp(
+                id=str(user[0]),
+                surname=user[1],
+                name=user[2],
+                patronymic=user[3],
+                version=user[4],
+            )
+            for user in users
+        ])
+
+    async def delete_user(
+        self,
+        user_id: str,
+        connection: AsyncConnection,
+        expected_versions: Optional[List[int]] = None,
+    ):
+        """Удаляет пользователя по id.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+
+        expected_versions: Optional[List[int]]
+            Допустимые текущие версии пользователя, None - любая.
+        """
+
+        if not self.delete:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Удаление данных запрещено",
+            )
+        target_user_id = parse_user_id(user_id)
+        try:
+            if expected_versions is None:
+                result = await connection.execute(
+                    UserRepositorySQL.DELETE_USER,
+                    {'user_id': target_user_id},
+                )
+            else:
+                result = await connection.execute(
+                    UserRepositorySQL.DELETE_USER_IF_VERSION,
+                    {'user_id': target_user_id, 'versions': expected_versions},
+                )
+            deleted_user = result.first()
+            exists_user = deleted_user is not None
+            if not exists_user and expected_versions is not None:
+                exists_user = await UserRepositorySQL.user_exists(
+                    target_user_id,
+                    connection,
+                )
+            await connection.commit()
+        except Exception as some_ex:
+            await connection.rollback()
+            report_error('postgresql', 'delete_user', some_ex)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Ошибка на стороне сервера',
+            )
+        if deleted_user is None:
+            raise_missing_user(exists_user)
+        return {
+            "status": True,
+            "message": "Пользователь успешно удален"
+        }
+        
+
+class UserRepositoryNoSQL(UserRepository):
+    """Класс совершает CRUD операции с сущностью
+    пользователь с
+    использованием NoSQL СУБД.
+
+    Пользователь хранится одной строкой, формат ключа и значения
+    задается CODEC.
 
     Attributes
     ----------
     REDIS_INSTANCE : Redis
         экземпляр редис
+
+    CODEC : RedisUserCodec
+        формат хранения пользователей
+
+    SCRIPTS : RedisUserScripts
+        Lua-скрипты изменения пользователей
+
+    SEARCH_INDEX : RedisUserSearchIndex
+        индексы поиска пользователей
+
+    STREAM_BATCH_SIZE : int
+        число пользователей в пачке при потоковом чтении
     
     Methods
     -------
+    user_key()
+        Возвращает ключ redis для пользователя.
+
     get_user_by_id()
         Возвращает пользователя по id.
+
+    get_users_by_ids()
+        Возвращает найденных пользователей по списку id.
+
+    iter_users()
+        Возвращает пользователей пачками.
     
     create_user()
         Создает нового пользователя.
+
+    create_users()
+        Создает список пользователей.
     
     update_user()
         Обновляет данные пользователя.
@@ -349,12 +1326,105 @@ class UserRepositoryNoSQL(UserRepository):
     get_user()
         Возвращает пользователя по id.
 
+    get_users()
+        Возвращает список пользователей по списку id.
+
+    list_users()
+        Возвращает страницу списка пользователей.
+
+    stream_users()
+        Возвращает асинхронный итератор по всем пользователям.
+
+    pipeline_users()
+        Записывает пачки пользователей конвейером команд.
+
+    import_users()
+        Записывает пользователей из потока пачек.
+
+    export_users()
+        Возвращает поток выгрузки всех пользователей.
+
+    search_users()
+        Возвращает пользователей по фамилии, имени и отчеству.
+
     delete_user()
         Удаляет пользователя.
 
     """
 
     REDIS_INSTANCE = redis_instance
+    CODEC = RedisUserCodec(
+        settings.redis_key_prefix,
+        settings.redis_key_format,
+        settings.redis_value_format,
+    )
+    SCRIPTS = RedisUserScripts(
+        redis_instance,
+        settings.redis_value_format,
+        settings.redis_search_prefix,
+    )
+    SEARCH_INDEX = RedisUserSearchIndex(
+        redis_instance,
+        CODEC,
+        settings.redis_search_prefix,
+    )
+    STREAM_BATCH_SIZE = 1000
+
+    @classmethod
+    def user_key(cls, user_id: uuid.UUID) -> bytes:
+        """Возвращает ключ redis для пользователя.
+
+        Parameters
+        ----------
+        user_id: uuid.UUID
+            id пользователя.
+        """
+
+        return cls.CODEC.key(user_id)
+
+    @classmethod
+    async def iter_users(cls, batch_size: int) -> AsyncIterator[List[UserResp]]:
+        """Возвращает всех пользователей пачками.
+
+        Ключи перебираются командой SCAN по префиксу пользователей,
+        данные каждой пачки читаются одной командой MGET.
+
+        Parameters
+        ----------
+        batch_size: int
+            Число пользователей в пачке.
+        """
+
+        user_keys = []
+        async for user_key in cls.REDIS_INSTANCE.scan_iter(
+            match=cls.CODEC.match,
+            count=batch_size,
+        ):
+            user_keys.append(user_key)
+            if len(user_keys) >= batch_size:
+                yield await cls._load_users(user_keys)
+                user_keys = []
+        if user_keys:
+            yield await cls._load_users(user_keys)
+
+    @classmethod
+    async def _load_users(cls, user_keys: List[bytes]) -> List[UserResp]:
+        """Возвращает пользователей по списку ключей redis.
+
+        Parameters
+        ----------
+        user_keys: List[bytes]
+            Список ключей пользователей.
+        """
+
+        if not user_keys:
+            return []
+        values = await cls.REDIS_INSTANCE.mget(user_keys)
+        return [
+            UserResp(id=cls.CODEC.user_id(user_key), **cls.CODEC.decode(value))
+            for user_key, value in zip(user_keys, values)
+            if value is not None
+        ]
 
     @classmethod
     async def get_user_by_id(cls, user_id: str):
@@ -368,14 +1438,39 @@ class UserRepositoryNoSQL(UserRepository):
         """
 
         try:
-            user = await cls.REDIS_INSTANCE.hgetall(user_id)
-            if user:
-                return user
+            user_key = cls.user_key(uuid.UUID(user_id))
+        except ValueError:
+            return False
+        try:
+            value = await cls.REDIS_INSTANCE.get(user_key)
+            if value is not None:
+                return {'id': user_id, **cls.CODEC.decode(value)}
             return False
         except Exception as some_ex:
-            print(some_ex)
+            report_error('redis', 'get_user_by_id', some_ex)
             return False
         
+    @classmethod
+    async def get_users_by_ids(cls, user_ids: List[uuid.UUID]):
+        """Возвращает данные пользователей по списку id.
+
+        Все пользователи читаются одной командой MGET, для не
+        найденных пользователей в списке возвращается пустой словарь.
+
+        Parameters
+        ----------
+        user_ids: List[uuid.UUID]
+            Список id пользователей.
+        """
+
+        values = await cls.REDIS_INSTANCE.mget(
+            [cls.user_key(user_id) for user_id in user_ids],
+        )
+        return [
+            {'id': str(user_id), **cls.CODEC.decode(value)} if value is not None else {}
+            for user_id, value in zip(user_ids, values)
+        ]
+
     async def get_user(self, user_id: str):
         """Возвращает пользователя по id.
 
@@ -403,173 +1498,1237 @@ class UserRepositoryNoSQL(UserRepository):
                 surname = user['surname'],
                 name = user['name'],
                 patronymic = user['patronymic'],
+                version = int(user['version']),
             )
         except Exception as some_ex:
-            print(some_ex)
+            report_error('redis', 'get_user', some_ex)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail='Ошибка на стороне сервера',
             )
 
-    async def create_user(
-        self,
-        surname: str,
-        name: str,
-        patronymic: str,
-    ):
-        """Создает нового пользователя.
+    async def get_users(self, user_ids: List[str]):
+        """Возвращает список пользователей по списку id.
+
+        Не найденные id возвращаются в поле missing.
 
         Parameters
         ----------
-        surname: str
-            Фамилия пользователя.
-
-        name: str
-            Имя пользователя.
-        
-        patronymic: str
-            Отчество пользователя.
+        user_ids: List[str]
+            Список id пользователей.
         """
 
-        if not self.create:
+        if not self.read:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Добавление данных запрещено",
+                detail="Чтение данных запрещено",
             )
+        valid_ids, missing = split_user_ids(user_ids)
         try:
-            user_id = str(uuid.uuid4())
-            pipeline = await UserRepositoryNoSQL.REDIS_INSTANCE.pipeline(
-                transaction=True,
-            )
-            await pipeline.hmset(
-                user_id,
-                {   'id': user_id,
-                    'surname': surname,
-                    'name': name,
-                    'patronymic': patronymic,
-                }
-            )
-            await pipeline.execute()
-            user = await UserRepositoryNoSQL.REDIS_INSTANCE.hgetall(user_id)
-            return UserResp(
-                id = user['id'],
-                surname = user['surname'],
-                name = user['name'],
-                patronymic = user['patronymic'],
-            )
+            users = []
+            if valid_ids:
+                users = await UserRepositoryNoSQL.get_users_by_ids(
+                    list(valid_ids.values()),
+                )
         except Exception as some_ex:
-            await pipeline.discard()
-            print(some_ex)
+            report_error('redis', 'get_users', some_ex)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail='Ошибка на стороне сервера',
             )
+        result_users = []
+        for user_id, user in zip(valid_ids, users):
+            if not user:
+                missing.append(user_id)
+                continue
+            result_users.append(UserResp(
+                id=user_id,
+                surname=user['surname'],
+                name=user['name'],
+                patronymic=user['patronymic'],
+                version=int(user['version']),
+            ))
+        return UsersBatchResp(users=result_users, missing=missing)
 
-    async def update_user(
-        self,
-        surname: str,
-        name: str,
-        patronymic: str,
-        user_id: str,
-    ):
-        """Обновляет данные пользователя.
+    async def list_users(self, limit: int, cursor: Optional[str]):
+        """Возвращает страницу списка пользователей.
+
+        Страница строится одной командой SCAN, поэтому ее размер
+        приблизительный: страница может содержать больше или меньше
+        пользователей, чем limit, в том числе быть пустой при
+        непустом курсоре.
 
         Parameters
         ----------
-        surname: str
-            Фамилия пользователя.
-
-        name: str
-            Имя пользователя.
-        
-        patronymic: str
-            Отчество пользователя.
+        limit: int
+            Желаемое число пользователей на странице.
 
-        user_id: str
-            id пользователя.
+        cursor: Optional[str]
+            Курсор, полученный с предыдущей страницей.
         """
 
-        if not self.update:
+        if not self.read:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Обновление данных запрещено",
+                detail="Чтение данных запрещено",
             )
-        user = await UserRepositoryNoSQL.get_user_by_id(user_id)
-        if not user:
+        try:
+            scan_cursor = int(cursor) if cursor else 0
+        except ValueError:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f'Пользователь не найден',
+                detail='Некорректный курсор',
             )
         try:
-            pipeline = await UserRepositoryNoSQL.REDIS_INSTANCE.pipeline(
-                transaction=True,
-            )
-            await pipeline.hmset(
-                user_id,
-                {   'id': user_id,
-                    'surname': surname,
-                    'name': name,
-                    'patronymic': patronymic,
-                }
-            )
-            await pipeline.execute()
-            user = await UserRepositoryNoSQL.REDIS_INSTANCE.hgetall(user_id)
-            return UserUpdateResp(
-                id = user['id'],
-                new_surname = user['surname'],
-                new_name = user['name'],
-                new_patronymic = user['patronymic'],
+            next_cursor, user_keys = await UserRepositoryNoSQL.REDIS_INSTANCE.scan(
+                cursor=scan_cursor,
+                match=UserRepositoryNoSQL.CODEC.match,
+                count=limit,
             )
+            users = await UserRepositoryNoSQL._load_users(user_keys)
         except Exception as some_ex:
-            await pipeline.discard()
-            print(some_ex)
+            report_error('redis', 'list_users', some_ex)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail='Ошибка на стороне сервера',
             )
+        return UsersPageResp(
+            users=users,
+            next_cursor=str(next_cursor) if next_cursor else None,
+        )
 
-    async def delete_user(self, user_id: str):
-        """Удаляет пользователя по id.
+    async def stream_users(self):
+        """Возвращает асинхронный итератор по всем пользователям."""
 
-        Parameters
-        ----------
-        user_id: str
-            id пользователя.
-        """
-        
-        if not self.delete:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Удаление данных запрещено",
-            )
-        user = await UserRepositoryNoSQL.get_user_by_id(user_id)
-        if not user:
+        if not self.read:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f'Пользователь не найден',
+                detail="Чтение данных запрещено",
             )
+        return UserRepositoryNoSQL.iter_users(UserRepositoryNoSQL.STREAM_BATCH_SIZE)
+
+    @classmethod
+    async def pipeline_users(
+        cls, users: AsyncIterator[List[UserModel]],
+    ) -> AsyncIterator[Tuple[int, List[Tuple[int, str]]]]:
+        """Записывает пачки пользователей и возвращает для каждой
+        пачки число записанных пользователей и позиции отклоненных
+        строк с сообщением redis.
+
+        Каждая пачка отправляется одним конвейером команд SET
+        и индексации без транзакции, поэтому ошибка команды
+        отклоняет только строку, к которой команда относится.
+
+        Parameters
+        ----------
+        users: AsyncIterator[List[UserModel]]
+            Пачки данных пользователей.
+        """
+
+        async for chunk in users:
+            pipeline = cls.REDIS_INSTANCE.pipeline(transaction=False)
+            #Номер первой команды каждой строки в конвейере.
+            starts = []
+            for user in chunk:
+                starts.append(len(pipeline))
+                user_key = cls.user_key(uuid7())
+                created_user = {
+                    'surname': user.surname,
+                    'name': user.name,
+                    'patronymic': user.patronymic,
+                    'version': 1,
+                }
+                pipeline.set(user_key, cls.CODEC.encode(created_user))
+                cls.SEARCH_INDEX.add(pipeline, user_key, created_user)
+            try:
+                results = await pipeline.execute(raise_on_error=False)
+            except Exception as some_ex:
+                report_error('redis', 'import_users', some_ex)
+                raise
+            rejected = []
+            for position, start in enumerate(starts):
+                end = starts[position + 1] if position + 1 < len(starts) else len(results)
+                errors = [
+                    result for result in results[start:end]
+                    if isinstance(result, Exception)
+                ]
+                if errors:
+                    rejected.append((position, str(errors[0])))
+            yield len(chunk) - len(rejected), rejected
+
+    async def import_users(self, users: AsyncIterator[List[UserModel]]):
+        """Возвращает асинхронный итератор, записывающий пачки
+        пользователей и возвращающий для каждой число записанных
+        и позиции отклоненных строк с сообщением хранилища.
+
+        Parameters
+        ----------
+        users: AsyncIterator[List[UserModel]]
+            Пачки данных пользователей.
+        """
+
+        if not self.create:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Добавление данных запрещено",
+            )
+        return UserRepositoryNoSQL.pipeline_users(users)
+
+    async def export_users(self, export_format: str):
+        """Возвращает асинхронный итератор по частям выгрузки всех
+        пользователей.
+
+        Пользователи перебираются SCAN и читаются пачками MGET.
+
+        Parameters
+        ----------
+        export_format: str
+            Формат выгрузки: ndjson либо csv.
+        """
+
+        if not self.read:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Чтение данных запрещено",
+            )
+        batches = UserRepositoryNoSQL.iter_users(UserRepositoryNoSQL.STREAM_BATCH_SIZE)
+        if export_format == 'csv':
+            return users_to_csv(batches)
+        return users_to_ndjson(batches)
+
+    async def search_users(
+        self,
+        values: Dict[str, Optional[str]],
+        mode: str,
+        limit: int,
+    ):
+        """Возвращает пользователей по фамилии, имени и отчеству
+        по индексам SEARCH_INDEX.
+
+        Условия по нескольким полям должны выполняться одновременно,
+        регистр букв не учитывается.
+
+        Parameters
+        ----------
+        values: Dict[str, Optional[str]]
+            Значения полей поиска, None - поле не участвует в поиске.
+
+        mode: str
+            Вид поиска: exact, prefix либо fuzzy.
+
+        limit: int
+            Максимальное число пользователей.
+        """
+
+        if not self.read:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Чтение данных запрещено",
+            )
+        criteria = search_criteria(values)
+        if not criteria:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Не заданы условия поиска',
+            )
+        try:
+            users = await UserRepositoryNoSQL.SEARCH_INDEX.search(criteria, mode, limit)
+        except Exception as some_ex:
+            report_error('redis', 'search_users', some_ex)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Ошибка на стороне сервера',
+            )
+        return UsersSearchResp(users=[UserResp(**user) for user in users])
+
+    async def create_user(
+        self,
+        surname: str,
+        name: str,
+        patronymic: str,
+    ):
+        """Создает нового пользователя.
+
+        Parameters
+        ----------
+        surname: str
+            Фамилия пользователя.
+
+        name: str
+            Имя пользователя.
+        
+        patronymic: str
+            Отчество пользователя.
+        """
+
+        if not self.create:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Добавление данных запрещено",
+            )
+        user_id = uuid7()
+        user = {
+            'surname': surname,
+            'name': name,
+            'patronymic': patronymic,
+            'version': 1,
+        }
+        user_key = UserRepositoryNoSQL.user_key(user_id)
+        try:
+            pipeline = UserRepositoryNoSQL.REDIS_INSTANCE.pipeline(transaction=True)
+            pipeline.set(user_key, UserRepositoryNoSQL.CODEC.encode(user))
+            UserRepositoryNoSQL.SEARCH_INDEX.add(pipeline, user_key, user)
+            await pipeline.execute()
+            return UserResp(id=str(user_id), **user)
+        except Exception as some_ex:
+            report_error('redis', 'create_user', some_ex)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Ошибка на стороне сервера',
+            )
+
+    async def create_users(self, users: List[UserModel]):
+        """Создает список пользователей одной командой MSET
+        в транзакции с индексацией.
+
+        Parameters
+        ----------
+        users: List[UserModel]
+            Данные пользователей.
+        """
+
+        if not self.create:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Добавление данных запрещено",
+            )
+        if not users:
+            return []
+        try:
+            created_users = []
+            values = {}
+            pipeline = UserRepositoryNoSQL.REDIS_INSTANCE.pipeline(transaction=True)
+            for user in users:
+                user_id = uuid7()
+                created_user = {
+                    'surname': user.surname,
+                    'name': user.name,
+                    'patronymic': user.patronymic,
+                    'version': 1,
+                }
+                user_key = UserRepositoryNoSQL.user_key(user_id)
+                values[user_key] = UserRepositoryNoSQL.CODEC.encode(created_user)
+                UserRepositoryNoSQL.SEARCH_INDEX.add(pipeline, user_key, created_user)
+                created_users.append(UserResp(id=str(user_id), **created_user))
+            pipeline.mset(values)
+            await pipeline.execute()
+            return created_users
+        except Exception as some_ex:
+            report_error('redis', 'create_users', some_ex)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Ошибка на стороне сервера',
+            )
+
+    async def update_user(
+        self,
+        surname: Optional[str],
+        name: Optional[str],
+        patronymic: Optional[str],
+        user_id: str,
+        expected_versions: Optional[List[int]] = None,
+    ):
+        """Обновляет переданные поля пользователя и увеличивает его
+        версию.
+
+        Проверка существования и версии, сравнение с текущими данными
+        и перезапись выполняются атомарно Lua-скриптом; если данные
+        не изменились, значение не перезаписывается. Ответ строится
+        по значению, которое вернул скрипт.
+
+        Parameters
+        ----------
+        surname: Optional[str]
+            Фамилия пользователя, None - не изменять.
+
+        name: Optional[str]
+            Имя пользователя, None - не изменять.
+        
+        patronymic: Optional[str]
+            Отчество пользователя, None - не изменять.
+
+        user_id: str
+            id пользователя.
+
+        expected_versions: Optional[List[int]]
+            Допустимые текущие версии пользователя, None - любая.
+        """
+
+        if not self.update:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Обновление данных запрещено",
+            )
+        user_key = UserRepositoryNoSQL.user_key(parse_user_id(user_id))
+        try:
+            result = await UserRepositoryNoSQL.SCRIPTS.update_user(
+                user_key,
+                [surname, name, patronymic],
+                expected_versions,
+            )
+        except Exception as some_ex:
+            report_error('redis', 'update_user', some_ex)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Ошибка на стороне сервера',
+            )
+        if result is None or result[0] == RedisUserScripts.CONFLICT:
+            raise_missing_user(result is not None)
+        user = UserRepositoryNoSQL.CODEC.decode(result[1])
+        return UserUpdateResp(
+            id=user_id,
+            new_surname=user['surname'],
+            new_name=user['name'],
+            new_patronymic=user['patronymic'],
+            version=int(user['version']),
+            updated=result[0] == RedisUserScripts.APPLIED,
+        )
+
+    async def delete_user(
+        self,
+        user_id: str,
+        expected_versions: Optional[List[int]] = None,
+    ):
+        """Удаляет пользователя по id.
+
+        Проверка версии и удаление выполняются атомарно Lua-скриптом.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+
+        expected_versions: Optional[List[int]]
+            Допустимые текущие версии пользователя, None - любая.
+        """
+        
+        if not self.delete:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Удаление данных запрещено",
+            )
+        user_key = UserRepositoryNoSQL.user_key(parse_user_id(user_id))
+        try:
+            result = await UserRepositoryNoSQL.SCRIPTS.delete_user(
+                user_key,
+                expected_versions,
+            )
+        except Exception as some_ex:
+            report_error('redis', 'delete_user', some_ex)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Ошибка на стороне сервера',
+            )
+        if result is None or not result[0]:
+            raise_missing_user(result is not None)
+        return {
+            "status": True,
+            "message": "Пользователь успешно удален"
+        }
+
+
+class UserRepositoryCachedSQL(UserRepositorySQL):
+    """Класс совершает CRUD операции с сущностью
+    пользователь с
+    использованием реляционной СУБД и кэша в redis.
+
+    Чтение пользователя по id обслуживается из кэша, при промахе
+    данные загружаются из реляционной СУБД. Обновление и удаление
+    заменяют запись кэша отметкой изменения либо удаления.
+
+    Attributes
+    ----------
+    cache : RedisUserCache
+        кэш пользователей
+
+    Methods
+    -------
+    get_user()
+        Возвращает пользователя по id.
+
+    update_user()
+        Обновляет данные пользователя.
+
+    delete_user()
+        Удаляет пользователя.
+
+    """
+
+    def __init__(
+        self,
+        create: bool,
+        update: bool,
+        read: bool,
+        delete: bool,
+        cache: RedisUserCache,
+        write_batcher: Optional[UserWriteBatcher] = None,
+    ):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        create: bool
+            Разрешение на добавление данных.
+        update: bool
+            Разрешение на обновление данных.
+        read: bool
+            Разрешение на чтение данных.
+        delete: bool
+            Разрешение на удаление данных.
+        cache: RedisUserCache
+            Кэш пользователей.
+        write_batcher: Optional[UserWriteBatcher]
+            Групповая запись пользователей.
+        """
+
+        super().__init__(create, update, read, delete, write_batcher)
+        self.cache = cache
+
+    async def get_user(self, user_id: str, connection: AsyncConnection):
+        """Возвращает пользователя по id.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+        """
+
+        if not self.read:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Чтение данных запрещено",
+            )
+        target_user_id = parse_user_id(user_id)
+
+        async def load_user():
+            result = await connection.execute(
+                UserRepositorySQL.SELECT_USER_BY_ID,
+                {'user_id': target_user_id},
+            )
+            user = result.first()
+            if user is None:
+                return {}
+            return {
+                'id': str(user[0]),
+                'surname': user[1],
+                'name': user[2],
+                'patronymic': user[3],
+                'version': user[4],
+            }
+
+        try:
+            user = await self.cache.get_or_load(str(target_user_id), load_user)
+        except Exception as some_ex:
+            report_error('postgresql', 'get_user', some_ex)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail='Ошибка на стороне сервера',
+            )
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f'Пользователь не найден',
+            )
+        return UserResp(**user)
+
+    async def update_user(
+        self,
+        surname: str,
+        name: str,
+        patronymic: str,
+        user_id: str,
+        connection: AsyncConnection,
+        expected_versions: Optional[List[int]] = None,
+    ):
+        """Обновляет данные пользователя.
+
+        Если данные не изменились, кэш не изменяется.
+
+        Parameters
+        ----------
+        surname: str
+            Фамилия пользователя.
+
+        name: str
+            Имя пользователя.
+
+        patronymic: str
+            Отчество пользователя.
+
+        user_id: str
+            id пользователя.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+
+        expected_versions: Optional[List[int]]
+            Допустимые текущие версии пользователя, None - любая.
+        """
+
+        user = await super().update_user(
+            surname,
+            name,
+            patronymic,
+            user_id,
+            connection,
+            expected_versions,
+        )
+        if user.updated:
+            await self.cache.invalidate(user.id, user.version)
+        return user
+
+    async def delete_user(
+        self,
+        user_id: str,
+        connection: AsyncConnection,
+        expected_versions: Optional[List[int]] = None,
+    ):
+        """Удаляет пользователя по id.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+
+        expected_versions: Optional[List[int]]
+            Допустимые текущие версии пользователя, None - любая.
+        """
+
+        result = await super().delete_user(user_id, connection, expected_versions)
+        await self.cache.mark_deleted(str(parse_user_id(user_id)))
+        return result
+
+
+class UserRepositoryReplicatedSQL(UserRepositorySQL):
+    """Класс совершает CRUD операции с сущностью
+    пользователь с
+    использованием реляционной СУБД и реплики в redis.
+
+    Реляционная СУБД хранит пользователей, изменения переносятся
+    в реплику через очередь user_outbox, а при sync_writes также
+    сразу после фиксации транзакции. Чтение по id обслуживается из
+    реплики, при промахе либо ошибке redis данные загружаются из
+    реляционной СУБД. Загруженные при промахе данные в реплику не
+    записываются: ключа нет, только пока очередь не перенесла
+    создание либо после удаления, и такая запись могла бы вернуть
+    удаленного пользователя. Недостающих пользователей(например,
+    после очистки redis) записывает сверка.
+
+    Attributes
+    ----------
+    replica : RedisUserReplica
+        реплика пользователей в redis
+    sync_writes : bool
+        запись изменений в реплику сразу после фиксации транзакции
+
+    Methods
+    -------
+    get_user()
+        Возвращает пользователя по id.
+
+    get_users()
+        Возвращает список пользователей по списку id.
+
+    create_user()
+        Создает нового пользователя.
+
+    update_user()
+        Обновляет данные пользователя.
+
+    delete_user()
+        Удаляет пользователя.
+
+    """
+
+    def __init__(
+        self,
+        create: bool,
+        update: bool,
+        read: bool,
+        delete: bool,
+        replica: RedisUserReplica,
+        sync_writes: bool,
+        write_batcher: Optional[UserWriteBatcher] = None,
+    ):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        create: bool
+            Разрешение на добавление данных.
+        update: bool
+            Разрешение на обновление данных.
+        read: bool
+            Разрешение на чтение данных.
+        delete: bool
+            Разрешение на удаление данных.
+        replica: RedisUserReplica
+            Реплика пользователей в redis.
+        sync_writes: bool
+            Запись изменений в реплику сразу после фиксации транзакции.
+        write_batcher: Optional[UserWriteBatcher]
+            Групповая запись пользователей.
+        """
+
+        super().__init__(create, update, read, delete, write_batcher)
+        self.replica = replica
+        self.sync_writes = sync_writes
+
+    async def _write_replica(self, users: List[UserResp], operation: str):
+        #Ошибка реплики не отменяет изменение: его перенесет очередь.
+        try:
+            await self.replica.write_users([
+                (user.id, user.surname, user.name, user.patronymic, user.version)
+                for user in users
+            ])
+        except Exception as some_ex:
+            report_error('redis', operation, some_ex)
+
+    async def get_user(self, user_id: str, connection: AsyncConnection):
+        """Возвращает пользователя по id.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+        """
+
+        if not self.read:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Чтение данных запрещено",
+            )
+        target_user_id = parse_user_id(user_id)
+        try:
+            user = (await self.replica.get_users([target_user_id]))[0]
+        except Exception as some_ex:
+            report_error('redis', 'get_user', some_ex)
+            user = None
+        if user is not None:
+            return UserResp(**user)
+        return await super().get_user(user_id, connection)
+
+    async def get_users(self, user_ids: List[str], connection: AsyncConnection):
+        """Возвращает список пользователей по списку id.
+
+        Пользователи, которых нет в реплике, загружаются из
+        реляционной СУБД. Не найденные id возвращаются в поле missing.
+
+        Parameters
+        ----------
+        user_ids: List[str]
+            Список id пользователей.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+        """
+
+        if not self.read:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Чтение данных запрещено",
+            )
+        valid_ids, missing = split_user_ids(user_ids)
+        target_user_ids = list(valid_ids.values())
+        found_users = {}
+        if target_user_ids:
+            try:
+                users = await self.replica.get_users(target_user_ids)
+            except Exception as some_ex:
+                report_error('redis', 'get_users', some_ex)
+                users = [None] * len(target_user_ids)
+            found_users = {
+                target_user_id: UserResp(**user)
+                for target_user_id, user in zip(target_user_ids, users)
+                if user is not None
+            }
+        not_replicated = [
+            target_user_id for target_user_id in target_user_ids
+            if target_user_id not in found_users
+        ]
+        if not_replicated:
+            try:
+                users = await UserRepositorySQL.get_users_by_ids(
+                    not_replicated,
+                    connection,
+                )
+            except Exception as some_ex:
+                report_error('postgresql', 'get_users', some_ex)
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail='Ошибка на стороне сервера',
+                )
+            loaded_users = [
+                UserResp(
+                    id=str(user[0]),
+                    surname=user[1],
+                    name=user[2],
+                    patronymic=user[3],
+                    version=user[4],
+                )
+                for user in users
+            ]
+            found_users.update(zip((user[0] for user in users), loaded_users))
+        result_users = []
+        for user_id, target_user_id in valid_ids.items():
+            user = found_users.get(target_user_id)
+            if user is None:
+                missing.append(user_id)
+                continue
+            result_users.append(user)
+        return UsersBatchResp(users=result_users, missing=missing)
+
+    async def create_user(
+        self,
+        surname: str,
+        name: str,
+        patronymic: str,
+        connection: AsyncConnection,
+    ):
+        """Создает нового пользователя.
+
+        Parameters
+        ----------
+        surname: str
+            Фамилия пользователя.
+
+        name: str
+            Имя пользователя.
+
+        patronymic: str
+            Отчество пользователя.
+
+        connection: AsyncConnection
+            Соединение с базой данных, не используется при групповой
+            записи.
+        """
+
+        user = await super().create_user(surname, name, patronymic, connection)
+        if self.sync_writes:
+            await self._write_replica([user], 'create_user')
+        return user
+
+    async def update_user(
+        self,
+        surname: str,
+        name: str,
+        patronymic: str,
+        user_id: str,
+        connection: AsyncConnection,
+        expected_versions: Optional[List[int]] = None,
+    ):
+        """Обновляет данные пользователя.
+
+        Parameters
+        ----------
+        surname: str
+            Фамилия пользователя.
+
+        name: str
+            Имя пользователя.
+
+        patronymic: str
+            Отчество пользователя.
+
+        user_id: str
+            id пользователя.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+
+        expected_versions: Optional[List[int]]
+            Допустимые текущие версии пользователя, None - любая.
+        """
+
+        user = await super().update_user(
+            surname,
+            name,
+            patronymic,
+            user_id,
+            connection,
+            expected_versions,
+        )
+        if self.sync_writes and user.updated:
+            await self._write_replica([UserResp(
+                id=user.id,
+                surname=user.new_surname,
+                name=user.new_name,
+                patronymic=user.new_patronymic,
+                version=user.version,
+            )], 'update_user')
+        return user
+
+    async def delete_user(
+        self,
+        user_id: str,
+        connection: AsyncConnection,
+        expected_versions: Optional[List[int]] = None,
+    ):
+        """Удаляет пользователя по id.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+
+        connection: AsyncConnection
+            Соединение с базой данных.
+
+        expected_versions: Optional[List[int]]
+            Допустимые текущие версии пользователя, None - любая.
+        """
+
+        result = await super().delete_user(user_id, connection, expected_versions)
+        if self.sync_writes:
+            try:
+                await self.replica.remove_users([parse_user_id(user_id)])
+            except Exception as some_ex:
+                report_error('redis', 'delete_user', some_ex)
+        return result
+
+
+class UserRepositorySingleFlight():
+    """Класс объединяет одновременные чтения одного пользователя
+    по id в любом репозитории.
+
+    Чтения, пришедшие, пока обращение к хранилищу за тем же
+    пользователем еще выполняется, получают его результат.
+    Изменение пользователя через этот процесс отвязывает
+    выполняющееся чтение: последующие чтения не получат данные,
+    прочитанные до изменения. Остальные методы передаются
+    репозиторию без изменений.
+
+    Общее чтение переживает запрос, который его начал, поэтому при
+    работе с реляционной СУБД оно выполняется собственным соединением
+    из пула движка, а не соединением запроса, которое вернется в пул
+    по завершении запроса.
+
+    Attributes
+    ----------
+    repository : UserRepository
+        репозиторий, чтения которого объединяются
+    single_flight : SingleFlight
+        выполняющиеся чтения пользователей
+    engine : Optional[AsyncEngine]
+        движок базы данных для общих чтений, None - репозиторий
+        не использует соединения
+
+    Methods
+    -------
+    get_user()
+        Возвращает пользователя по id.
+
+    update_user()
+        Обновляет данные пользователя.
+
+    delete_user()
+        Удаляет пользователя.
+
+    """
+
+    def __init__(
+        self,
+        repository: UserRepository,
+        single_flight: SingleFlight,
+        engine: Optional[AsyncEngine] = None,
+    ):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        repository: UserRepository
+            Репозиторий, чтения которого объединяются.
+        single_flight: SingleFlight
+            Выполняющиеся чтения пользователей.
+        engine: Optional[AsyncEngine]
+            Движок базы данных для общих чтений, None - репозиторий
+            не использует соединения.
+        """
+
+        self.repository = repository
+        self.single_flight = single_flight
+        self.engine = engine
+
+    def __getattr__(self, name: str):
+        return getattr(self.repository, name)
+
+    def _forget(self, user_id: str):
+        try:
+            key = str(uuid.UUID(user_id))
+        except ValueError:
+            return
+        self.single_flight.forget(key)
+
+    async def _get_user(self, user_id: str, args: tuple):
+        if self.engine is None:
+            return await self.repository.get_user(user_id, *args)
+        async with self.engine.connect() as connection:
+            return await self.repository.get_user(user_id, connection, *args[1:])
+
+    async def get_user(self, user_id: str, *args):
+        """Возвращает пользователя по id.
+
+        При работе с реляционной СУБД общее чтение выполняется
+        собственным соединением, соединение запроса не используется.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+
+        *args
+            Остальные аргументы метода get_user репозитория.
+        """
+
+        key = str(parse_user_id(user_id))
+        user, shared = await self.single_flight.do(
+            key,
+            lambda: self._get_user(user_id, args),
+        )
+        if shared:
+            USER_READS_COALESCED.inc()
+        return user
+
+    async def update_user(
+        self,
+        surname: str,
+        name: str,
+        patronymic: str,
+        user_id: str,
+        *args,
+        **kwargs,
+    ):
+        """Обновляет данные пользователя.
+
+        Parameters
+        ----------
+        surname: str
+            Фамилия пользователя.
+
+        name: str
+            Имя пользователя.
+
+        patronymic: str
+            Отчество пользователя.
+
+        user_id: str
+            id пользователя.
+
+        *args, **kwargs
+            Остальные аргументы метода update_user репозитория.
+        """
+
         try:
-            pipeline = await UserRepositoryNoSQL.REDIS_INSTANCE.pipeline(
-                transaction=True,
+            return await self.repository.update_user(
+                surname,
+                name,
+                patronymic,
+                user_id,
+                *args,
+                **kwargs,
             )
-            await pipeline.delete(user_id)
-            await pipeline.execute()
-            return {
-                "status": True,
-                "message": "Пользователь успешно удален"
-            }
-        except Exception as some_ex:
-            await pipeline.discard()
-            print(some_ex)
+        finally:
+            self._forget(user_id)
+
+    async def delete_user(self, user_id: str, *args, **kwargs):
+        """Удаляет пользователя по id.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+
+        *args, **kwargs
+            Остальные аргументы метода delete_user репозитория.
+        """
+
+        try:
+            return await self.repository.delete_user(user_id, *args, **kwargs)
+        finally:
+            self._forget(user_id)
+
+
+class UserRepositoryLocalCache():
+    """Класс добавляет к любому репозиторию кэш пользователей
+    в памяти процесса.
+
+    Чтение пользователя по id обслуживается из кэша, изменения
+    через этот процесс удаляют запись из кэша и оповещают другие
+    процессы через канал redis. Остальные методы передаются
+    репозиторию без изменений.
+
+    Attributes
+    ----------
+    repository : UserRepository
+        репозиторий, к которому добавляется кэш
+    cache : LocalUserCache
+        кэш пользователей в памяти процесса
+
+    Methods
+    -------
+    get_user()
+        Возвращает пользователя по id.
+
+    update_user()
+        Обновляет данные пользователя.
+
+    delete_user()
+        Удаляет пользователя.
+
+    """
+
+    def __init__(self, repository: UserRepository, cache: LocalUserCache):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        repository: UserRepository
+            Репозиторий, к которому добавляется кэш.
+        cache: LocalUserCache
+            Кэш пользователей в памяти процесса.
+        """
+
+        self.repository = repository
+        self.cache = cache
+
+    def __getattr__(self, name: str):
+        return getattr(self.repository, name)
+
+    async def _invalidate(self, user_id: str):
+        try:
+            cache_key = str(uuid.UUID(user_id))
+        except ValueError:
+            return
+        await self.cache.invalidate(cache_key)
+
+    async def get_user(self, user_id: str, *args):
+        """Возвращает пользователя по id.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+
+        *args
+            Остальные аргументы метода get_user репозитория.
+        """
+
+        if not self.repository.read:
             raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail='Ошибка на стороне сервера',
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Чтение данных запрещено",
+            )
+        cache_key = str(parse_user_id(user_id))
+        user = self.cache.get(cache_key)
+        if user is not None:
+            return user
+        epoch = self.cache.epoch()
+        user = await self.repository.get_user(user_id, *args)
+        self.cache.set(cache_key, user, epoch)
+        return user
+
+    async def update_user(
+        self,
+        surname: str,
+        name: str,
+        patronymic: str,
+        user_id: str,
+        *args,
+        **kwargs,
+    ):
+        """Обновляет данные пользователя.
+
+        Если данные не изменились, сброс кэша не рассылается.
+
+        Parameters
+        ----------
+        surname: str
+            Фамилия пользователя.
+
+        name: str
+            Имя пользователя.
+
+        patronymic: str
+            Отчество пользователя.
+
+        user_id: str
+            id пользователя.
+
+        *args, **kwargs
+            Остальные аргументы метода update_user репозитория.
+        """
+
+        try:
+            user = await self.repository.update_user(
+                surname,
+                name,
+                patronymic,
+                user_id,
+                *args,
+                **kwargs,
             )
- 
+        except Exception:
+            await self._invalidate(user_id)
+            raise
+        if user.updated:
+            await self._invalidate(user_id)
+        return user
+
+    async def delete_user(self, user_id: str, *args, **kwargs):
+        """Удаляет пользователя по id.
+
+        Parameters
+        ----------
+        user_id: str
+            id пользователя.
+
+        *args, **kwargs
+            Остальные аргументы метода delete_user репозитория.
+        """
+
+        try:
+            return await self.repository.delete_user(user_id, *args, **kwargs)
+        finally:
+            await self._invalidate(user_id)
+
+
 #Если значение переменной окружение NO_SQL = True,
 #создается экземпляр репозитория с использованием нереляционной СУБД.
 #Если значение переменной окружение NO_SQL = False,
-#создается экземпляр репозитория с использованием реляционной СУБД.
+#создается экземпляр репозитория с использованием реляционной СУБД,
+#а при USER_CACHE_ENABLED = True репозиторий дополнительно
+#кэширует пользователей в redis.
+#При REDIS_REPLICA_ENABLED = True пользователи хранятся
+#в реляционной СУБД, а читаются из реплики в redis.
+#При WRITE_BATCH_ENABLED = True добавление и обновление одного
+#пользователя объединяются в групповые запросы.
+user_write_batcher = None
+user_replica = None
+if settings.write_batch_enabled and not settings.no_sql:
+    user_write_batcher = UserWriteBatcher(
+        engine,
+        settings.write_batch_size,
+        settings.write_batch_delay,
+    )
 if settings.no_sql:
     user_repository = UserRepositoryNoSQL(
         settings.create,
@@ -577,10 +2736,61 @@ if settings.no_sql:
         settings.read,
         settings.delete,
     )
+elif settings.redis_replica_enabled:
+    user_replica = RedisUserReplica(
+        engine,
+        redis_instance,
+        UserRepositoryNoSQL.CODEC,
+        UserRepositoryNoSQL.SCRIPTS,
+        settings.redis_replica_batch_size,
+        settings.redis_replica_poll_interval,
+        settings.redis_replica_reconcile_interval,
+    )
+    user_repository = UserRepositoryReplicatedSQL(
+        settings.create,
+        settings.update,
+        settings.read,
+        settings.delete,
+        user_replica,
+        settings.redis_replica_sync_writes,
+        user_write_batcher,
+    )
+elif settings.user_cache_enabled:
+    user_repository = UserRepositoryCachedSQL(
+        settings.create,
+        settings.update,
+        settings.read,
+        settings.delete,
+        RedisUserCache(redis_instance, settings.user_cache_ttl),
+        user_write_batcher,
+    )
 else:
     user_repository = UserRepositorySQL(
         settings.create,
         settings.update,
         settings.read,
         settings.delete,
+        user_write_batcher,
+    )
+
+#Если значение переменной окружения SINGLE_FLIGHT_ENABLED = True,
+#одновременные чтения одного пользователя объединяются в одно.
+user_single_flight = None
+if settings.single_flight_enabled:
+    user_single_flight = SingleFlight()
+    user_repository = UserRepositorySingleFlight(
+        user_repository,
+        user_single_flight,
+        None if settings.no_sql else engine,
+    )
+#Если значение переменной окружения LOCAL_CACHE_ENABLED = True,
+#перед репозиторием добавляется кэш в памяти процесса.
+local_user_cache = None
+if settings.local_cache_enabled:
+    local_user_cache = LocalUserCache(
+        settings.local_cache_size,
+        settings.local_cache_ttl,
+        redis_instance,
+        settings.local_cache_channel,
     )
+    user_repository = UserRepositoryLocalCache(user_repository, local_user_cache)
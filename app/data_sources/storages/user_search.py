@@ -0,0 +1,289 @@
+"""Модуль содержит поиск пользователей по фамилии, имени и отчеству."""
+import re
+import uuid
+from typing import Dict, List, Optional, Set
+
+from redis.asyncio import Redis
+
+from data_sources.storages.redis_codec import RedisUserCodec
+
+SEARCH_FIELDS = ('surname', 'name', 'patronymic')
+SEARCH_MODES = ('exact', 'prefix', 'fuzzy')
+#Минимальное сходство нечеткого поиска, как у pg_trgm по умолчанию.
+SIMILARITY_THRESHOLD = 0.3
+#Число пользователей с наибольшим числом общих триграмм, которые
+#проверяет нечеткий поиск в redis.
+MAX_FUZZY_CANDIDATES = 1000
+#Время жизни временного ключа нечеткого поиска в секундах, если
+#он не удален после поиска.
+FUZZY_UNION_TTL = 10
+#Слова для триграмм, как в pg_trgm: буквы и цифры.
+WORD = re.compile(r'[^\W_]+')
+
+
+def normalize(value: str) -> str:
+    """Приводит значение поля к виду, по которому выполняется поиск."""
+
+    return value.lower().replace('\x00', '')
+
+
+def trigrams(value: str) -> Set[str]:
+    """Возвращает триграммы значения так же, как pg_trgm: каждое
+    слово дополняется двумя пробелами в начале и одним в конце.
+    """
+
+    result = set()
+    for word in WORD.findall(normalize(value)):
+        padded = f'  {word} '
+        result.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return result
+
+
+def similarity(first: Set[str], second: Set[str]) -> float:
+    """Возвращает сходство наборов триграмм, как similarity() pg_trgm."""
+
+    if not first or not second:
+        return 0.0
+    common = len(first & second)
+    return common / (len(first) + len(second) - common)
+
+
+def search_criteria(values: Dict[str, Optional[str]]) -> Dict[str, str]:
+    """Возвращает нормализованные непустые условия поиска в порядке
+    SEARCH_FIELDS.
+
+    Parameters
+    ----------
+    values: Dict[str, Optional[str]]
+        Значения полей поиска, None - поле не участвует в поиске.
+    """
+
+    criteria = {}
+    for field in SEARCH_FIELDS:
+        value = normalize((values.get(field) or '').strip())
+        if value:
+            criteria[field] = value
+    return criteria
+
+
+def matches(user: dict, criteria: Dict[str, str], mode: str) -> bool:
+    """Проверяет, подходит ли пользователь под условия поиска.
+
+    Parameters
+    ----------
+    user: dict
+        Данные пользователя.
+    criteria: Dict[str, str]
+        Нормализованные значения полей поиска.
+    mode: str
+        Вид поиска: exact, prefix либо fuzzy.
+    """
+
+    for field, query in criteria.items():
+        value = normalize(user[field])
+        if mode == 'exact':
+            found = value == query
+        elif mode == 'prefix':
+            found = value.startswith(query)
+        else:
+            found = similarity(trigrams(value), trigrams(query)) >= SIMILARITY_THRESHOLD
+        if not found:
+            return False
+    return True
+
+
+def score(user: dict, criteria: Dict[str, str]) -> float:
+    """Возвращает суммарное сходство полей пользователя с условиями
+    нечеткого поиска.
+    """
+
+    return sum(
+        similarity(trigrams(user[field]), trigrams(query))
+        for field, query in criteria.items()
+    )
+
+
+class RedisUserSearchIndex():
+    """Класс ведет индексы поиска пользователей в redis.
+
+    Для каждого поля хранятся:
+    упорядоченное множество "<префикс>lex:<поле>" с элементами
+    "<значение>\\0<ключ пользователя>" и одинаковым весом - точный
+    поиск и поиск по началу выполняются ZRANGEBYLEX;
+    множества "<префикс>trgm:<поле>:<триграмма>" ключей пользователей -
+    для нечеткого поиска.
+    Под ключом "<префикс>terms:<ключ пользователя>" хранятся
+    проиндексированные значения и триграммы пользователя, по которым
+    Lua-скрипты изменения и удаления убирают прежние элементы
+    индексов. Индексы изменяются в одной транзакции либо в одном
+    скрипте с пользователем. Нечеткий поиск подсчитывает общие
+    триграммы ZUNIONSTORE во временный ключ "<префикс>tmp:<uuid>"
+    и забирает из него не больше MAX_FUZZY_CANDIDATES кандидатов,
+    поэтому клиенту не передаются все пользователи с общими
+    триграммами.
+
+    Methods
+    -------
+    field_terms()
+        Возвращает проиндексированное значение и триграммы поля.
+
+    add()
+        Добавляет в конвейер команды индексации пользователя.
+
+    search()
+        Возвращает пользователей, подходящих под условия поиска.
+    """
+
+    def __init__(self, redis: Redis, codec: RedisUserCodec, prefix: str):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        redis: Redis
+            Экземпляр redis.
+        codec: RedisUserCodec
+            Формат хранения пользователей.
+        prefix: str
+            Префикс ключей индексов.
+        """
+
+        self.redis = redis
+        self.codec = codec
+        self.prefix = prefix.encode()
+        #Шаблон SCAN MATCH всех ключей индексов.
+        self.match = b''.join(
+            b'\\' + bytes([char]) if char in b'*?[]\\' else bytes([char])
+            for char in self.prefix
+        ) + b'*'
+        #Иначе ключи индексов попадали бы в перебор пользователей SCAN.
+        if self.prefix.startswith(codec.prefix) or codec.prefix.startswith(self.prefix):
+            raise ValueError(
+                'Префиксы ключей пользователей и индексов поиска '
+                'не должны совпадать или начинаться один с другого'
+            )
+
+    def lex_key(self, field: str) -> bytes:
+        return self.prefix + b'lex:' + field.encode()
+
+    def trigram_key(self, field: str, trigram: str) -> bytes:
+        return self.prefix + b'trgm:' + field.encode() + b':' + trigram.encode()
+
+    def terms_key(self, user_key: bytes) -> bytes:
+        return self.prefix + b'terms:' + user_key
+
+    @staticmethod
+    def field_terms(value: str) -> str:
+        """Возвращает проиндексированное значение поля и его
+        триграммы через "\\0", для пустого значения - пустую строку.
+
+        Parameters
+        ----------
+        value: str
+            Значение поля.
+        """
+
+        return '\x00'.join([normalize(value), *sorted(trigrams(value))])
+
+    def add(self, pipeline, user_key: bytes, user: Dict[str, str]):
+        """Добавляет в конвейер команды индексации нового
+        пользователя.
+
+        Parameters
+        ----------
+        pipeline: Pipeline
+            Конвейер команд redis.
+        user_key: bytes
+            Ключ пользователя.
+        user: Dict[str, str]
+            Данные пользователя.
+        """
+
+        records = []
+        for field in SEARCH_FIELDS:
+            value = normalize(user[field])
+            if value:
+                pipeline.zadd(self.lex_key(field), {value.encode() + b'\x00' + user_key: 0})
+            for trigram in trigrams(value):
+                pipeline.sadd(self.trigram_key(field, trigram), user_key)
+            records.append(self.field_terms(user[field]))
+        pipeline.set(self.terms_key(user_key), RedisUserCodec.encode_string(records))
+
+    async def _load(self, user_keys: List[bytes]) -> List[dict]:
+        if not user_keys:
+            return []
+        values = await self.redis.mget(user_keys)
+        return [
+            {'id': self.codec.user_id(user_key), **self.codec.decode(value)}
+            for user_key, value in zip(user_keys, values)
+            if value is not None
+        ]
+
+    async def search(self, criteria: Dict[str, str], mode: str, limit: int) -> List[dict]:
+        """Возвращает данные пользователей, подходящих под условия
+        поиска.
+
+        Кандидаты выбираются по индексу первого поля условий, затем
+        все условия проверяются по данным пользователей. Точный поиск
+        и поиск по началу упорядочены по значению первого поля и id,
+        нечеткий - по убыванию суммарного сходства.
+
+        Parameters
+        ----------
+        criteria: Dict[str, str]
+            Нормализованные значения полей поиска в порядке
+            SEARCH_FIELDS.
+        mode: str
+            Вид поиска: exact, prefix либо fuzzy.
+        limit: int
+            Максимальное число пользователей.
+        """
+
+        field, query = next(iter(criteria.items()))
+        if mode == 'fuzzy':
+            query_trigrams = trigrams(query)
+            if not query_trigrams:
+                return []
+            #Сходство не меньше порога возможно, только если общих
+            #триграмм не меньше порога от числа триграмм запроса.
+            minimum = SIMILARITY_THRESHOLD * len(query_trigrams)
+            union_key = self.prefix + b'tmp:' + uuid.uuid4().bytes
+            async with self.redis.pipeline(transaction=True) as pipeline:
+                pipeline.zunionstore(
+                    union_key,
+                    [self.trigram_key(field, trigram) for trigram in query_trigrams],
+                )
+                pipeline.expire(union_key, FUZZY_UNION_TTL)
+                pipeline.zrevrangebyscore(
+                    union_key, '+inf', minimum, start=0, num=MAX_FUZZY_CANDIDATES,
+                )
+                pipeline.delete(union_key)
+                candidates = (await pipeline.execute())[2]
+            users = [
+                user for user in await self._load(candidates)
+                if matches(user, criteria, mode)
+            ]
+            users.sort(key=lambda user: (-score(user, criteria), user['id']))
+            return users[:limit]
+        value = query.encode()
+        if mode == 'exact':
+            low, high = b'[' + value + b'\x00', b'(' + value + b'\x01'
+        else:
+            #Байт 0xff не встречается в UTF-8.
+            low, high = b'[' + value, b'(' + value + b'\xff'
+        users = []
+        offset = 0
+        page_size = max(limit, 100)
+        while len(users) < limit:
+            members = await self.redis.zrangebylex(
+                self.lex_key(field), low, high, start=offset, num=page_size,
+            )
+            offset += len(members)
+            users.extend(
+                user for user in await self._load([
+                    member.split(b'\x00', 1)[1] for member in members
+                ])
+                if matches(user, criteria, mode)
+            )
+            if len(members) < page_size:
+                break
+        return users[:limit]
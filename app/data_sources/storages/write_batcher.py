@@ -0,0 +1,390 @@
+"""Модуль содержит групповую запись пользователей в реляционную СУБД."""
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import (
+    Integer,
+    String,
+    Text,
+    any_,
+    func,
+    or_,
+    select,
+    bindparam,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from data_sources.models import User_model
+
+logger = logging.getLogger(__name__)
+
+
+def build_insert_users():
+    """Строит запрос добавления пачки пользователей.
+
+    Данные передаются массивами по колонкам и разворачиваются
+    unnest, поэтому запрос один для пачки любого размера и
+    берется из кэша подготовленных выражений.
+    """
+
+    batch = func.unnest(
+        bindparam('ids', type_=ARRAY(UUID(as_uuid=True))),
+        bindparam('surnames', type_=ARRAY(String)),
+        bindparam('names', type_=ARRAY(String)),
+        bindparam('patronymics', type_=ARRAY(String)),
+    ).table_valued('id', 'surname', 'name', 'patronymic').render_derived()
+    return User_model.insert().from_select(
+        ['id', 'surname', 'name', 'patronymic'],
+        select(batch.c.id, batch.c.surname, batch.c.name, batch.c.patronymic),
+    ).returning(User_model)
+
+
+def build_lock_users():
+    """Строит запрос блокировки строк пачки пользователей.
+
+    Строки блокируются FOR UPDATE в порядке id до обновления пачки:
+    порядок блокировок UPDATE ... FROM unnest зависит от плана
+    запроса, а в явном порядке одновременные транзакции пачек
+    блокируют общие строки одинаково и не взаимоблокируются.
+    """
+
+    return select(User_model.c.id).where(
+        User_model.c.id == any_(bindparam('ids', type_=ARRAY(UUID(as_uuid=True)))),
+    ).order_by(User_model.c.id).with_for_update()
+
+
+def build_update_users():
+    """Строит запрос частичного обновления пачки пользователей.
+
+    Запрос повторяет build_update_user для каждой строки пачки:
+    не переданные поля (NULL) не изменяются, строка перезаписывается,
+    только если значения меняются и версия совпадает с одной из
+    ожидаемых (versions - версии через пробел, NULL - любая).
+    Для каждой строки пачки возвращаются ее номер, пользователь до
+    обновления и, если запись произошла, после. id в пачке должны
+    быть уникальны.
+    """
+
+    batch = select(func.unnest(
+        bindparam('ids', type_=ARRAY(UUID(as_uuid=True))),
+        bindparam('surnames', type_=ARRAY(String)),
+        bindparam('names', type_=ARRAY(String)),
+        bindparam('patronymics', type_=ARRAY(String)),
+        bindparam('versions', type_=ARRAY(Text)),
+    ).table_valued(
+        'id', 'surname', 'name', 'patronymic', 'versions',
+        with_ordinality='position',
+    ).render_derived()).cte('batch')
+    new_surname = func.coalesce(batch.c.surname, User_model.c.surname)
+    new_name = func.coalesce(batch.c.name, User_model.c.name)
+    new_patronymic = func.coalesce(batch.c.patronymic, User_model.c.patronymic)
+    updated_users = User_model.update().where(
+        User_model.c.id == batch.c.id,
+        tuple_(
+            User_model.c.surname, User_model.c.name, User_model.c.patronymic,
+        ).is_distinct_from(tuple_(new_surname, new_name, new_patronymic)),
+        or_(
+            batch.c.versions.is_(None),
+            User_model.c.version == any_(
+                func.string_to_array(batch.c.versions, ' ').cast(ARRAY(Integer)),
+            ),
+        ),
+    ).values(
+        surname=new_surname,
+        name=new_name,
+        patronymic=new_patronymic,
+        version=User_model.c.version + 1,
+    ).returning(User_model).cte('updated_users')
+    return select(batch.c.position, User_model, updated_users).select_from(
+        batch.outerjoin(
+            User_model, User_model.c.id == batch.c.id,
+        ).outerjoin(
+            updated_users, updated_users.c.id == batch.c.id,
+        ),
+    )
+
+
+class WriteRequest():
+    """Изменение, ожидающее записи в составе пачки."""
+
+    __slots__ = ('kind', 'parameters', 'future')
+
+    def __init__(self, kind: str, parameters: dict):
+        self.kind = kind
+        self.parameters = parameters
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class UserWriteBatcher():
+    """Класс объединяет одиночные добавления и обновления
+    пользователей процесса в групповые запросы.
+
+    Изменения складываются в очередь, фоновая задача забирает их
+    пачками не больше max_batch_size, дожидаясь пополнения пачки не
+    дольше max_delay секунд, и записывает пачку одним многострочным
+    запросом на добавление и одним на обновление в одной транзакции.
+    Перед обновлением строки пачки блокируются в порядке id. Каждый
+    вызывающий получает результат своей строки после фиксации
+    транзакции. Если запрос пачки отклонен из-за данных одной из
+    строк(IntegrityError, DataError), транзакция откатывается, и
+    изменения записываются по одному: ошибку получают только
+    изменения, которые не записались сами. При прочих ошибках, в том
+    числе потере соединения во время фиксации, когда пачка могла
+    быть записана, ошибку получают все изменения пачки: повторная
+    запись добавила бы пользователей дважды и увеличила бы версии
+    еще раз.
+
+    Attributes
+    ----------
+    INSERT_USERS : Insert
+        запрос добавления пачки пользователей
+    LOCK_USERS : Select
+        запрос блокировки обновляемых пользователей
+    UPDATE_USERS : Select
+        запрос обновления пачки пользователей
+
+    Methods
+    -------
+    create_user()
+        Добавляет пользователя в составе пачки.
+
+    update_user()
+        Обновляет пользователя в составе пачки.
+
+    start()
+        Запускает фоновую запись пачек.
+
+    stop()
+        Записывает оставшиеся изменения и останавливает запись.
+    """
+
+    INSERT_USERS = build_insert_users()
+    LOCK_USERS = build_lock_users()
+    UPDATE_USERS = build_update_users()
+
+    def __init__(self, engine: AsyncEngine, max_batch_size: int, max_delay: float):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        engine: AsyncEngine
+            Движок базы данных.
+        max_batch_size: int
+            Максимальное число изменений в пачке.
+        max_delay: float
+            Максимальное время ожидания пополнения пачки в секундах.
+        """
+
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue: 'Optional[asyncio.Queue[Optional[WriteRequest]]]' = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def create_user(self, parameters: dict) -> Row:
+        """Добавляет пользователя в составе пачки и возвращает
+        добавленную строку.
+
+        Parameters
+        ----------
+        parameters: dict
+            Параметры запроса UserRepositorySQL.INSERT_USER.
+        """
+
+        return await self._submit(WriteRequest('create', parameters))
+
+    async def update_user(
+        self,
+        parameters: dict,
+        expected_versions: Optional[List[int]] = None,
+    ) -> Row:
+        """Обновляет пользователя в составе пачки.
+
+        Возвращает строку той же формы, что запрос
+        UserRepositorySQL.UPDATE_USER, либо None, если пользователя нет.
+
+        Parameters
+        ----------
+        parameters: dict
+            Параметры запроса UserRepositorySQL.UPDATE_USER.
+        expected_versions: Optional[List[int]]
+            Допустимые текущие версии, None - любая.
+        """
+
+        versions = None
+        if expected_versions is not None:
+            versions = ' '.join(str(version) for version in expected_versions)
+        return await self._submit(
+            WriteRequest('update', {**parameters, 'versions': versions}),
+        )
+
+    def start(self):
+        """Запускает фоновую запись пачек."""
+
+        if self._flusher is None:
+            self._queue = asyncio.Queue()
+            self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Записывает оставшиеся изменения и останавливает запись."""
+
+        if self._flusher is None:
+            return
+        #Пустой элемент очереди - признак остановки: изменения,
+        #поставленные до него, будут записаны.
+        self._queue.put_nowait(None)
+        await self._flusher
+        self._flusher = None
+
+    async def _submit(self, request: WriteRequest):
+        self.start()
+        self._queue.put_nowait(request)
+        return await request.future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            request = await self._queue.get()
+            if request is None:
+                break
+            batch = [request]
+            deadline = loop.time() + self.max_delay
+            #Пачка дополняется, пока не заполнится или не истечет
+            #время ожидания; пока пачка записывается, следующая
+            #накапливается в очереди.
+            while len(batch) < self.max_batch_size:
+                try:
+                    request = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        request = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[WriteRequest]):
+        if len(batch) > 1:
+            try:
+                results = await self._write(batch)
+            except (IntegrityError, DataError) as some_ex:
+                logger.warning(
+                    'Ошибка записи пачки, изменения записываются по одному',
+                    exc_info=some_ex,
+                    extra={'backend': 'postgresql', 'operation': 'write_batch'},
+                )
+            except Exception as some_ex:
+                logger.warning(
+                    'Ошибка записи пачки',
+                    exc_info=some_ex,
+                    extra={'backend': 'postgresql', 'operation': 'write_batch'},
+                )
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(some_ex)
+                return
+            else:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_result(results.get(id(request)))
+                return
+        #Каждое изменение записывается отдельной транзакцией в порядке
+        #поступления, и ошибку получает только тот, чье изменение не
+        #записалось.
+        for request in batch:
+            try:
+                results = await self._write([request])
+            except Exception as some_ex:
+                logger.warning(
+                    'Ошибка записи изменения',
+                    exc_info=some_ex,
+                    extra={'backend': 'postgresql', 'operation': 'write_batch'},
+                )
+                if not request.future.done():
+                    request.future.set_exception(some_ex)
+                continue
+            if not request.future.done():
+                request.future.set_result(results.get(id(request)))
+
+    async def _write(self, batch: List[WriteRequest]) -> Dict[int, Optional[Row]]:
+        results: Dict[int, Optional[Row]] = {}
+        async with self.engine.connect() as connection:
+            creates = sorted(
+                (request for request in batch if request.kind == 'create'),
+                key=lambda request: request.parameters['new_id'],
+            )
+            if creates:
+                result = await connection.execute(
+                    UserWriteBatcher.INSERT_USERS,
+                    self._columns(creates, {
+                        'ids': 'new_id',
+                        'surnames': 'new_surname',
+                        'names': 'new_name',
+                        'patronymics': 'new_patronymic',
+                    }),
+                )
+                created = {row[0]: row for row in result.all()}
+                for request in creates:
+                    results[id(request)] = created[request.parameters['new_id']]
+            updates = [request for request in batch if request.kind == 'update']
+            if updates:
+                await connection.execute(
+                    UserWriteBatcher.LOCK_USERS,
+                    {'ids': sorted({request.parameters['user_id'] for request in updates})},
+                )
+            for part in self._unique_parts(updates):
+                part.sort(key=lambda request: request.parameters['user_id'])
+                result = await connection.execute(
+                    UserWriteBatcher.UPDATE_USERS,
+                    self._columns(part, {
+                        'ids': 'user_id',
+                        'surnames': 'new_surname',
+                        'names': 'new_name',
+                        'patronymics': 'new_patronymic',
+                        'versions': 'versions',
+                    }),
+                )
+                for row in result.all():
+                    #Без строки пользователя (колонка id пуста)
+                    #пользователя нет.
+                    results[id(part[row[0] - 1])] = row[1:] if row[1] is not None else None
+            await connection.commit()
+        return results
+
+    @staticmethod
+    def _columns(batch: List[WriteRequest], columns: Dict[str, str]) -> dict:
+        return {
+            column: [request.parameters[parameter] for request in batch]
+            for column, parameter in columns.items()
+        }
+
+    @staticmethod
+    def _unique_parts(updates: List[WriteRequest]) -> List[List[WriteRequest]]:
+        #Один запрос UPDATE ... FROM изменяет строку не больше одного
+        #раза, поэтому повторные обновления одного пользователя
+        #выполняются следующими запросами той же транзакции по порядку.
+        parts: List[List[WriteRequest]] = []
+        part_ids: List[set] = []
+        for request in updates:
+            user_id = request.parameters['user_id']
+            index = 0
+            while index < len(parts) and user_id in part_ids[index]:
+                index += 1
+            if index == len(parts):
+                parts.append([])
+                part_ids.append(set())
+            parts[index].append(request)
+            part_ids[index].add(user_id)
+        return parts
@@ -0,0 +1,35 @@
+"""Модуль содержит создание id пользователей."""
+import os
+import time
+import uuid
+
+_last_timestamp = 0
+_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    """Возвращает UUID версии 7(RFC 9562).
+
+    Первые 48 бит - время Unix в миллисекундах, поэтому новые id
+    больше прежних и добавляются в конец индекса первичного ключа,
+    а не в случайную страницу. Следующие 12 бит - счетчик в пределах
+    миллисекунды, начинающийся со случайного значения: id процесса
+    строго возрастают, при переполнении счетчика время сдвигается
+    на миллисекунду вперед. Остальные 62 бита случайные.
+    """
+
+    global _last_timestamp, _counter
+    timestamp = time.time_ns() // 1_000_000
+    if timestamp > _last_timestamp:
+        _last_timestamp = timestamp
+        _counter = int.from_bytes(os.urandom(2), 'big') & 0x7ff
+    else:
+        #Время не изменилось либо часы сдвинулись назад.
+        _counter += 1
+        if _counter > 0xfff:
+            _last_timestamp += 1
+            _counter = 0
+    random_bits = int.from_bytes(os.urandom(8), 'big') & 0x3fffffffffffffff
+    return uuid.UUID(int=(
+        _last_timestamp << 80 | 0x7 << 76 | _counter << 64 | 0x2 << 62 | random_bits
+    ))
@@ -0,0 +1,69 @@
+"""Выгрузка всех пользователей в файл NDJSON либо CSV.
+
+Пользователи читаются из хранилища из настроек(NO_SQL) потоком и
+сразу пишутся в файл, поэтому память не зависит от числа
+пользователей. Формат и сжатие определяются по расширению файла
+(.ndjson, .csv, с окончанием .gz- со сжатием gzip), "-" - вывод в stdout.
+
+Запуск из директории app:
+    python export_users.py users.csv.gz
+    python export_users.py - --format ndjson
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from bulk_export import FORMATS, gzip_chunks
+from config import redis_instance
+from data_sources.models import engine
+from data_sources.storages.user_repository import user_repository
+
+
+def detect_format(path: str) -> str:
+    """Возвращает формат выгрузки по расширению файла."""
+
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+
+async def main(args):
+    export_format = args.format or detect_format(args.path)
+    use_gzip = args.gzip or args.path.lower().endswith('.gz')
+    started = time.perf_counter()
+    written = 0
+    output = sys.stdout.buffer if args.path == '-' else open(args.path, 'wb')
+    try:
+        chunks = await user_repository.export_users(export_format)
+        if use_gzip:
+            chunks = gzip_chunks(chunks)
+        async for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            output.write(chunk)
+            written += len(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        await engine.dispose()
+        await redis_instance.aclose()
+    print(
+        f'Записано {written} байт за {time.perf_counter() - started:.1f} с',
+        file=sys.stderr,
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='путь к файлу либо "-" для stdout')
+    parser.add_argument('--format', choices=FORMATS,
+                        help='формат выгрузки, по умолчанию по расширению')
+    parser.add_argument('--gzip', action='store_true',
+                        help='сжать выгрузку, по умолчанию по расширению .gz')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
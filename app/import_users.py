@@ -0,0 +1,76 @@
+"""Импорт пользователей из файла CSV либо NDJSON.
+
+Файл читается частями и записывается пачками в хранилище из
+настроек(NO_SQL): в PostgreSQL через COPY, в Redis конвейерами команд.
+Ход импорта и ошибки строк выводятся в stderr, итоговый отчет- в stdout
+в формате JSON.
+
+Запуск из директории app:
+    python import_users.py users.csv
+    python import_users.py users.ndjson --chunk-size 10000
+"""
+import argparse
+import asyncio
+import sys
+from typing import AsyncIterator
+
+from bulk_import import FORMATS, UserImport
+from config import redis_instance
+from data_sources.models import engine
+from data_sources.storages.user_repository import user_repository
+
+#Размер части файла, читаемой за один раз.
+READ_SIZE = 1024 * 1024
+
+
+async def read_file(path: str) -> AsyncIterator[bytes]:
+    """Возвращает файл частями по READ_SIZE байт."""
+
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def detect_format(path: str) -> str:
+    """Возвращает формат файла по расширению."""
+
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+async def main(args) -> int:
+    user_import = UserImport(args.format or detect_format(args.path), args.chunk_size)
+    report = None
+    try:
+        written = await user_repository.import_users(
+            user_import.chunks(read_file(args.path)),
+        )
+        async for report in user_import.run(written):
+            for row_error in report.errors:
+                print(f'Строка {row_error.line}: {row_error.error}', file=sys.stderr)
+            print(
+                f'Записано {report.imported}, ошибок {report.failed}, '
+                f'{report.rows_per_second} строк/с',
+                file=sys.stderr,
+            )
+    finally:
+        await engine.dispose()
+        await redis_instance.aclose()
+    print(report.model_dump_json(exclude={'errors'}))
+    return 1 if report.error else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='путь к файлу')
+    parser.add_argument('--format', choices=FORMATS,
+                        help='формат файла, по умолчанию по расширению')
+    parser.add_argument('--chunk-size', type=int, default=5000,
+                        help='число пользователей в пачке записи')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main(parse_args())))
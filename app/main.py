@@ -1,21 +1,85 @@
 """Файл запуска приложения."""
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from redis import asyncio as aioredis
 import uvicorn
 
-from config import settings
+from config import settings, redis_instance, get_redis_pool_stats
 
+from data_sources.models import engine, get_db_pool_stats
+from data_sources.storages.user_repository import (
+    UserRepositoryNoSQL,
+    local_user_cache,
+    user_replica,
+    user_write_batcher,
+)
+from readiness import process_readiness
+from metrics import (
+    MetricsMiddleware,
+    instrument_engine,
+    instrument_redis,
+    register_pool_collector,
+)
+from structured_logging import (
+    RequestIdMiddleware,
+    setup_logging,
+    start_logging,
+    stop_logging,
+)
 from views.crud_for_users import user_router
+from views.service import service_router
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI):
+    """Запускает и останавливает фоновые задачи процесса приложения.
+
+    Выполняется в каждом процессе gunicorn после его создания: до
+    приема запросов загружаются Lua-скрипты и прогреваются пулы
+    соединений процесса.
+    """
+    start_logging()
+    if settings.no_sql or user_replica is not None:
+        await UserRepositoryNoSQL.SCRIPTS.load()
+    await process_readiness.warm_up()
+    if local_user_cache is not None:
+        local_user_cache.start_listening()
+    if user_write_batcher is not None:
+        user_write_batcher.start()
+    if user_replica is not None:
+        user_replica.start()
+    yield
+    process_readiness.stop()
+    if user_replica is not None:
+        await user_replica.stop()
+    if user_write_batcher is not None:
+        await user_write_batcher.stop()
+    if local_user_cache is not None:
+        await local_user_cache.stop_listening()
+    stop_logging()
 
 
 def get_application() -> FastAPI:
     """Возвращает экземпляр приложения."""
-    application = FastAPI()
+    setup_logging(
+        settings.log_level,
+        settings.log_queue_size,
+        settings.log_error_burst,
+        settings.log_error_interval,
+    )
+    application = FastAPI(lifespan=lifespan)
+    application.add_middleware(MetricsMiddleware)
+    application.add_middleware(RequestIdMiddleware)
+    instrument_engine(engine)
+    instrument_redis(redis_instance)
+    register_pool_collector(get_db_pool_stats, get_redis_pool_stats)
     return application
 
 application = get_application()
 
 application.include_router(user_router)
+application.include_router(service_router)
 
 if __name__ == '__main__':
     uvicorn.run(
@@ -0,0 +1,277 @@
+"""Модуль содержит метрики Prometheus приложения.
+
+Время каждого запроса раскладывается на этапы:
+validation - от получения запроса до вызова обработчика (маршрутизация,
+разбор и проверка тела запроса, зависимости);
+repository - выполнение обработчика, то есть вызов репозитория;
+backend - сетевые обращения к PostgreSQL и redis внутри обработчика;
+serialization - от возврата из обработчика до отправки заголовков
+ответа (проверка и сериализация ответа).
+"""
+import functools
+import os
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from fastapi.routing import APIRoute
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from redis.asyncio import Redis
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Время обработки запроса.',
+    ['method', 'route', 'status'],
+)
+STAGE_LATENCY = Histogram(
+    'http_request_stage_duration_seconds',
+    'Время этапа обработки запроса.',
+    ['route', 'stage'],
+)
+BACKEND_LATENCY = Histogram(
+    'backend_call_duration_seconds',
+    'Время обращения к хранилищу.',
+    ['backend'],
+)
+REPOSITORY_ERRORS = Counter(
+    'user_repository_errors_total',
+    'Число ошибок хранилища в репозиториях пользователей.',
+    ['backend', 'operation'],
+)
+USER_READS_COALESCED = Counter(
+    'user_reads_coalesced_total',
+    'Число чтений пользователя, получивших результат уже выполнявшегося обращения к хранилищу.',
+)
+LOG_RECORDS_DROPPED = Counter(
+    'log_records_dropped_total',
+    'Число записей журнала, отброшенных ограничением частоты или при переполнении очереди.',
+    ['reason'],
+)
+
+#Этапы текущего запроса, заполняются по мере его обработки.
+request_stages: 'ContextVar[Optional[dict]]' = ContextVar(
+    'request_stages', default=None,
+)
+
+
+def observe_backend_call(backend: str, started: float):
+    """Учитывает обращение к хранилищу, начатое в момент started.
+
+    Parameters
+    ----------
+    backend: str
+        Название хранилища.
+    started: float
+        Значение time.perf_counter() в начале обращения.
+    """
+    duration = time.perf_counter() - started
+    BACKEND_LATENCY.labels(backend).observe(duration)
+    stages = request_stages.get()
+    if stages is not None:
+        stages['backend'] = stages.get('backend', 0.0) + duration
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Добавляет учет времени запросов к базе данных.
+
+    Parameters
+    ----------
+    engine: AsyncEngine
+        Движок SQLAlchemy.
+    """
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        observe_backend_call('postgresql', context._metrics_started)
+
+
+def _timed(method: Callable) -> Callable:
+    @functools.wraps(method)
+    async def timed_method(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            observe_backend_call('redis', started)
+    return timed_method
+
+
+def instrument_redis(redis: Redis):
+    """Добавляет учет времени команд и пакетов команд redis.
+
+    Parameters
+    ----------
+    redis: Redis
+        Экземпляр redis.
+    """
+    redis.execute_command = _timed(redis.execute_command)
+    create_pipeline = redis.pipeline
+
+    @functools.wraps(create_pipeline)
+    def pipeline(*args, **kwargs):
+        new_pipeline = create_pipeline(*args, **kwargs)
+        new_pipeline.execute = _timed(new_pipeline.execute)
+        return new_pipeline
+
+    redis.pipeline = pipeline
+
+
+class PoolCollector():
+    """Сборщик состояния пулов соединений текущего процесса."""
+
+    def __init__(self, db_stats: Callable[[], dict], redis_stats: Callable[[], dict]):
+        self.db_stats = db_stats
+        self.redis_stats = redis_stats
+
+    def collect(self):
+        pid = str(os.getpid())
+        db_pool = GaugeMetricFamily(
+            'db_pool_connections',
+            'Соединения пула базы данных.',
+            labels=['pid', 'state'],
+        )
+        db_stats = self.db_stats()
+        for state in ('idle', 'in_use', 'overflow'):
+            db_pool.add_metric([pid, state], db_stats[state])
+        yield db_pool
+        redis_pool = GaugeMetricFamily(
+            'redis_pool_connections',
+            'Соединения пула redis.',
+            labels=['pid', 'state'],
+        )
+        redis_stats = self.redis_stats()
+        for state in ('idle', 'in_use'):
+            redis_pool.add_metric([pid, state], redis_stats[state])
+        yield redis_pool
+
+
+def register_pool_collector(db_stats: Callable[[], dict], redis_stats: Callable[[], dict]):
+    """Регистрирует сборщик состояния пулов соединений.
+
+    Parameters
+    ----------
+    db_stats: Callable[[], dict]
+        Функция, возвращающая состояние пула базы данных.
+    redis_stats: Callable[[], dict]
+        Функция, возвращающая состояние пула redis.
+    """
+    REGISTRY.register(PoolCollector(db_stats, redis_stats))
+
+
+def render_metrics():
+    """Возвращает метрики в текстовом формате Prometheus и его тип.
+
+    Если задана переменная окружения PROMETHEUS_MULTIPROC_DIR,
+    гистограммы и счетчики суммируются по всем процессам gunicorn,
+    а состояние пулов добавляется для процесса, обработавшего запрос.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    output = generate_latest(registry)
+    for collector in list(REGISTRY._collector_to_names):
+        if isinstance(collector, PoolCollector):
+            own_registry = CollectorRegistry()
+            own_registry.register(collector)
+            output += generate_latest(own_registry)
+    return output, CONTENT_TYPE_LATEST
+
+
+def timed_endpoint(endpoint: Callable) -> Callable:
+    """Оборачивает обработчик запроса учетом начала и конца его работы.
+
+    Parameters
+    ----------
+    endpoint: Callable
+        Асинхронный обработчик запроса.
+    """
+
+    @functools.wraps(endpoint)
+    async def timed(*args, **kwargs):
+        stages = request_stages.get()
+        if stages is not None:
+            stages['handler_started'] = time.perf_counter()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            if stages is not None:
+                stages['handler_finished'] = time.perf_counter()
+    return timed
+
+
+class InstrumentedRoute(APIRoute):
+    """Маршрут, обработчик которого отмечает этапы запроса."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, timed_endpoint(endpoint), **kwargs)
+
+
+class MetricsMiddleware():
+    """ASGI-промежуточный слой, учитывающий время запросов и их этапов."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        stages = {}
+        token = request_stages.set(stages)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_metrics(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                stages['response_started'] = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            request_stages.reset(token)
+            route = scope.get('route')
+            route_path = route.path if route is not None else 'unmatched'
+            REQUEST_LATENCY.labels(
+                scope['method'], route_path, str(status_code),
+            ).observe(time.perf_counter() - started)
+            self._observe_stages(route_path, started, stages)
+
+    @staticmethod
+    def _observe_stages(route_path: str, started: float, stages: dict):
+        handler_started = stages.get('handler_started')
+        handler_finished = stages.get('handler_finished')
+        if handler_started is None or handler_finished is None:
+            return
+        STAGE_LATENCY.labels(route_path, 'validation').observe(
+            handler_started - started,
+        )
+        STAGE_LATENCY.labels(route_path, 'repository').observe(
+            handler_finished - handler_started,
+        )
+        STAGE_LATENCY.labels(route_path, 'backend').observe(
+            stages.get('backend', 0.0),
+        )
+        response_started = stages.get('response_started')
+        if response_started is not None:
+            STAGE_LATENCY.labels(route_path, 'serialization').observe(
+                response_started - handler_finished,
+            )
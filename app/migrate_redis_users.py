@@ -0,0 +1,242 @@
+"""Перенос пользователей в redis в формат хранения из настроек.
+
+Переносятся хэши пользователей, записанные прежними версиями
+приложения: под ключом из id пользователя без префикса либо с
+префиксом из настроек или --source-prefix, с полями id, surname,
+name, patronymic. Остальные хэши не изменяются. С параметром
+--source-prefix дополнительно перекодируются пользователи, записанные
+с другими префиксом и форматами ключа и значения.
+
+Приложение на время переноса нужно остановить.
+
+Запуск из директории app:
+    python migrate_redis_users.py --dry-run
+    REDIS_KEY_PREFIX=u: python migrate_redis_users.py --source-prefix user: \\
+        --source-key-format text --source-value-format string
+"""
+import argparse
+import asyncio
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+from config import settings, redis_instance
+from data_sources.storages.redis_codec import RedisUserCodec
+
+#Шаблон SCAN MATCH ключей из id пользователя без префикса.
+LEGACY_ID_MATCH = b'-'.join(b'[0-9a-f]' * length for length in (8, 4, 4, 4, 12))
+
+
+async def write_batch(
+    redis: Redis,
+    codec: RedisUserCodec,
+    users: List[Tuple[bytes, uuid.UUID, Dict[str, str]]],
+    dry_run: bool,
+):
+    """Записывает пачку пользователей в новом формате и удаляет
+    старые ключи одной транзакцией.
+
+    Parameters
+    ----------
+    redis: Redis
+        Экземпляр redis.
+    codec: RedisUserCodec
+        Новый формат хранения.
+    users: List[Tuple[bytes, uuid.UUID, Dict[str, str]]]
+        Старый ключ, id и данные каждого пользователя.
+    dry_run: bool
+        Только подсчитать пользователей, не изменяя данные.
+    """
+
+    if dry_run or not users:
+        return
+    pipeline = redis.pipeline(transaction=True)
+    for old_key, user_id, user in users:
+        new_key = codec.key(user_id)
+        pipeline.set(new_key, codec.encode(user))
+        if new_key != old_key:
+            pipeline.delete(old_key)
+    await pipeline.execute()
+
+
+async def migrate_hashes(
+    redis: Redis,
+    codec: RedisUserCodec,
+    matches: List[bytes],
+    batch_size: int,
+    dry_run: bool,
+) -> Dict[str, int]:
+    """Переносит пользователей, хранящихся в хэшах под ключами,
+    подходящими под шаблоны matches. Хэши с другими ключами не
+    изменяются.
+
+    Parameters
+    ----------
+    redis: Redis
+        Экземпляр redis.
+    codec: RedisUserCodec
+        Новый формат хранения.
+    matches: List[bytes]
+        Шаблоны SCAN MATCH ключей пользователей.
+    batch_size: int
+        Число ключей в пачке.
+    dry_run: bool
+        Только подсчитать пользователей, не изменяя данные.
+    """
+
+    counts = {'migrated': 0, 'skipped': 0}
+    for match in matches:
+        await migrate_hash_keys(redis, codec, match, batch_size, dry_run, counts)
+    return counts
+
+
+async def migrate_hash_keys(
+    redis: Redis,
+    codec: RedisUserCodec,
+    match: bytes,
+    batch_size: int,
+    dry_run: bool,
+    counts: Dict[str, int],
+):
+    """Переносит пользователей из хэшей под ключами шаблона match
+    и добавляет результат в counts."""
+
+    async for keys in scan_batches(redis, match, 'hash', batch_size):
+        pipeline = redis.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hgetall(key)
+        users = []
+        for key, fields in zip(keys, await pipeline.execute()):
+            user = {
+                **codec.DEFAULTS,
+                **{field.decode(): value.decode() for field, value in fields.items()},
+            }
+            user_id = parse_id(user.get('id') or key.decode('latin-1')[-36:])
+            if user_id is None or any(field not in user for field in codec.FIELDS):
+                counts['skipped'] += 1
+                continue
+            users.append((key, user_id, user))
+        await write_batch(redis, codec, users, dry_run)
+        counts['migrated'] += len(users)
+
+
+async def reencode(
+    redis: Redis,
+    source: RedisUserCodec,
+    codec: RedisUserCodec,
+    batch_size: int,
+    dry_run: bool,
+) -> Dict[str, int]:
+    """Перекодирует пользователей из формата source в формат codec.
+
+    Parameters
+    ----------
+    redis: Redis
+        Экземпляр redis.
+    source: RedisUserCodec
+        Прежний формат хранения.
+    codec: RedisUserCodec
+        Новый формат хранения.
+    batch_size: int
+        Число ключей в пачке.
+    dry_run: bool
+        Только подсчитать пользователей, не изменяя данные.
+    """
+
+    counts = {'migrated': 0, 'skipped': 0}
+    async for keys in scan_batches(redis, source.match, 'string', batch_size):
+        users = []
+        for key, value in zip(keys, await redis.mget(keys)):
+            try:
+                user_id = uuid.UUID(source.user_id(key))
+                user = source.decode(value)
+            except Exception:
+                counts['skipped'] += 1
+                continue
+            users.append((key, user_id, user))
+        await write_batch(redis, codec, users, dry_run)
+        counts['migrated'] += len(users)
+    return counts
+
+
+async def scan_batches(redis: Redis, match: bytes, key_type: str, batch_size: int):
+    """Возвращает ключи заданного типа пачками.
+
+    Перенесенные пользователи в перебор не попадают: они хранятся
+    строками, а при перекодировании- под непересекающимся префиксом.
+    """
+
+    keys = []
+    async for key in redis.scan_iter(match=match, count=batch_size, _type=key_type):
+        keys.append(key)
+        if len(keys) >= batch_size:
+            yield keys
+            keys = []
+    if keys:
+        yield keys
+
+
+def parse_id(user_id: str) -> Optional[uuid.UUID]:
+    try:
+        return uuid.UUID(user_id)
+    except ValueError:
+        return None
+
+
+def prefixes_overlap(first: bytes, second: bytes) -> bool:
+    return first.startswith(second) or second.startswith(first)
+
+
+async def main(args):
+    codec = RedisUserCodec(
+        settings.redis_key_prefix,
+        settings.redis_key_format,
+        settings.redis_value_format,
+    )
+    source = None
+    if args.source_prefix is not None:
+        source = RedisUserCodec(
+            args.source_prefix,
+            args.source_key_format,
+            args.source_value_format,
+        )
+        if prefixes_overlap(source.prefix, codec.prefix):
+            raise SystemExit(
+                'Префиксы прежнего и нового формата не должны совпадать '
+                'или начинаться один с другого.'
+            )
+    #Хэши ищутся только под ключами пользователей: с префиксом из
+    #настроек, с прежним префиксом и из одного id.
+    matches = [LEGACY_ID_MATCH]
+    for user_codec in (codec, source):
+        if user_codec is not None and user_codec.prefix:
+            matches.append(user_codec.match)
+    counts = await migrate_hashes(
+        redis_instance, codec, matches, args.batch_size, args.dry_run,
+    )
+    print(f"Хэши: перенесено {counts['migrated']}, пропущено {counts['skipped']}")
+    if source is not None:
+        counts = await reencode(
+            redis_instance, source, codec, args.batch_size, args.dry_run,
+        )
+        print(f"Строки: перенесено {counts['migrated']}, пропущено {counts['skipped']}")
+    await redis_instance.aclose()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true',
+                        help='только подсчитать пользователей')
+    parser.add_argument('--source-prefix',
+                        help='префикс ключей пользователей в прежнем формате')
+    parser.add_argument('--source-key-format', default='text',
+                        choices=RedisUserCodec.KEY_FORMATS)
+    parser.add_argument('--source-value-format', default='string',
+                        choices=RedisUserCodec.VALUE_FORMATS)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,43 @@
+"""revision5
+
+Удаляет индекс ix_user_id: он дублирует индекс первичного ключа
+таблицы user и только удваивает стоимость записи в индексы.
+Индекс удаляется CONCURRENTLY, без блокировки таблицы.
+
+Revision ID: 5d9a3c7b1e20
+Revises: e8b4f2a6c9d1
+Create Date: 2026-10-18 13:48:06.572931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d9a3c7b1e20'
+down_revision: Union[str, None] = 'e8b4f2a6c9d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_user_id',
+            table_name='user',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_id',
+            'user',
+            ['id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
@@ -0,0 +1,28 @@
+"""revision2
+
+Добавляет колонку version для условных запросов.
+
+Revision ID: 9f2c7eee7df1
+Revises: 594efc6aef84
+Create Date: 2026-10-18 11:57:24.228747
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f2c7eee7df1'
+down_revision: Union[str, None] = '594efc6aef84'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('user', 'version')
@@ -0,0 +1,59 @@
+"""revision3
+
+Добавляет очередь изменений пользователей user_outbox для реплики
+в redis и триггер, заполняющий ее в соединениях с настройкой
+app.user_outbox = on.
+
+Revision ID: c3a1d7e5b2f4
+Revises: 9f2c7eee7df1
+Create Date: 2026-10-18 12:40:11.503218
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a1d7e5b2f4'
+down_revision: Union[str, None] = '9f2c7eee7df1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user_outbox',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('user_id', sa.UUID(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute('''
+        CREATE FUNCTION user_outbox_append() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO user_outbox (user_id) VALUES (OLD.id);
+            ELSE
+                INSERT INTO user_outbox (user_id) VALUES (NEW.id);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    #Условие WHEN проверяется без вызова функции, поэтому без реплики
+    #триггер почти не замедляет запись.
+    op.execute('''
+        CREATE TRIGGER user_outbox_append
+        AFTER INSERT OR UPDATE OR DELETE ON "user"
+        FOR EACH ROW
+        WHEN (current_setting('app.user_outbox', true) = 'on')
+        EXECUTE FUNCTION user_outbox_append()
+    ''')
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER user_outbox_append ON "user"')
+    op.execute('DROP FUNCTION user_outbox_append()')
+    op.drop_table('user_outbox')
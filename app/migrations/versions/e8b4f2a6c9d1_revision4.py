@@ -0,0 +1,65 @@
+"""revision4
+
+Добавляет индексы поиска пользователей по фамилии, имени и
+отчеству: btree по lower(поле) COLLATE "C" для точного поиска и
+поиска по началу и GIN pg_trgm по lower(поле) для нечеткого поиска.
+Индексы строятся CONCURRENTLY, без блокировки записи в таблицу.
+
+Revision ID: e8b4f2a6c9d1
+Revises: c3a1d7e5b2f4
+Create Date: 2026-10-18 13:05:42.118406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b4f2a6c9d1'
+down_revision: Union[str, None] = 'c3a1d7e5b2f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_FIELDS = ('surname', 'name', 'patronymic')
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.get_context().autocommit_block():
+        for field in SEARCH_FIELDS:
+            op.create_index(
+                f'ix_user_{field}_lower',
+                'user',
+                [sa.text(f'lower({field}) COLLATE "C"')],
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+            op.create_index(
+                f'ix_user_{field}_trgm',
+                'user',
+                [sa.text(f'lower({field}) gin_trgm_ops')],
+                unique=False,
+                postgresql_using='gin',
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for field in SEARCH_FIELDS:
+            op.drop_index(
+                f'ix_user_{field}_trgm',
+                table_name='user',
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+            op.drop_index(
+                f'ix_user_{field}_lower',
+                table_name='user',
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
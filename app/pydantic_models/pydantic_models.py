@@ -1,4 +1,6 @@
 """Модуль со схемами данных."""
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 class UserModel(BaseModel):
@@ -8,12 +10,27 @@ class UserModel(BaseModel):
     patronymic: str
 
 
+class UserPatchModel(BaseModel):
+    """Модель данных для частичного обновления пользователя.
+
+    Не переданные поля не изменяются.
+    """
+    surname: Optional[str] = None
+    name: Optional[str] = None
+    patronymic: Optional[str] = None
+
+
 class UserUpdateResp(BaseModel):
-    """Модель данных ответа для обновления пользователя."""
+    """Модель данных ответа для обновления пользователя.
+
+    updated - False, если данные не изменились и запись не выполнялась.
+    """
     id: str
     new_surname: str
     new_name: str
     new_patronymic: str
+    version: int
+    updated: bool
 
 
 class UserResp(BaseModel):
@@ -22,3 +39,47 @@ class UserResp(BaseModel):
     surname: str
     name: str
     patronymic: str
+    version: int
+
+
+class UsersIdsModel(BaseModel):
+    """Модель данных для запроса списка пользователей по id."""
+    ids: List[str]
+
+
+class UsersBatchResp(BaseModel):
+    """Модель данных ответа для запроса списка пользователей по id."""
+    users: List[UserResp]
+    missing: List[str]
+
+
+class UsersPageResp(BaseModel):
+    """Модель данных ответа для запроса страницы списка пользователей."""
+    users: List[UserResp]
+    next_cursor: Optional[str]
+
+
+class UsersSearchResp(BaseModel):
+    """Модель данных ответа для поиска пользователей."""
+    users: List[UserResp]
+
+
+class ImportRowError(BaseModel):
+    """Модель данных ошибки строки импорта."""
+    line: int
+    error: str
+
+
+class ImportProgressResp(BaseModel):
+    """Модель данных отчета о ходе импорта пользователей.
+
+    errors содержит ошибки строк, появившиеся после предыдущего
+    отчета.
+    """
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+    elapsed: float
+    rows_per_second: float
+    done: bool
+    error: Optional[str] = None
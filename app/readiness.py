@@ -0,0 +1,196 @@
+"""Модуль содержит прогрев соединений процесса приложения и проверку
+его готовности.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from redis.asyncio import Redis
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from config import settings, redis_instance
+from data_sources.models import engine
+from data_sources.storages.user_repository import (
+    UserRepositorySQL,
+    local_user_cache,
+    user_replica,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessReadiness():
+    """Класс прогревает пулы соединений процесса приложения и
+    проверяет его готовность.
+
+    Прогрев выполняется при запуске процесса до приема запросов:
+    в пуле базы данных заранее открываются соединения, в которых
+    выполняются запросы горячих путей, в пуле redis - соединения
+    командой PING. Ошибка прогрева не останавливает процесс, а
+    записывается в журнал: недоступное хранилище покажет проверка
+    готовности. Процесс готов, если прогрев завершен, остановка не
+    начата и используемые хранилища отвечают.
+
+    Attributes
+    ----------
+    warmed_up : bool
+        прогрев завершен
+    stopping : bool
+        процесс останавливается
+    warmup_seconds : Optional[float]
+        длительность прогрева
+
+    Methods
+    -------
+    warm_up()
+        Открывает соединения пулов и подготавливает запросы.
+
+    check()
+        Проверяет доступность используемых хранилищ.
+
+    stop()
+        Отмечает начало остановки процесса.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[AsyncEngine],
+        redis: Optional[Redis],
+        db_connections: int,
+        redis_connections: int,
+        timeout: float,
+        prepare: Optional[Callable[[AsyncConnection], Awaitable]] = None,
+    ):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        engine: Optional[AsyncEngine]
+            Движок базы данных, None - база данных не используется.
+        redis: Optional[Redis]
+            Экземпляр redis, None - redis не используется.
+        db_connections: int
+            Число соединений с базой данных, открываемых при прогреве.
+        redis_connections: int
+            Число соединений с redis, открываемых при прогреве.
+        timeout: float
+            Время ожидания ответа хранилища при проверке в секундах.
+        prepare: Optional[Callable[[AsyncConnection], Awaitable]]
+            Подготовка запросов в прогреваемом соединении.
+        """
+
+        self.engine = engine
+        self.redis = redis
+        self.db_connections = db_connections
+        self.redis_connections = redis_connections
+        self.timeout = timeout
+        self.prepare = prepare
+        self.warmed_up = False
+        self.stopping = False
+        self.warmup_seconds: Optional[float] = None
+
+    async def warm_up(self):
+        """Открывает соединения пулов и подготавливает запросы."""
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            self._warm_up('postgresql', self._warm_up_db),
+            self._warm_up('redis', self._warm_up_redis),
+        )
+        self.warmup_seconds = time.perf_counter() - started
+        self.warmed_up = True
+
+    async def _warm_up(self, backend: str, warm_up: Callable[[], Awaitable]):
+        try:
+            await warm_up()
+        except Exception as some_ex:
+            logger.warning(
+                'Ошибка прогрева соединений',
+                exc_info=some_ex,
+                extra={'backend': backend, 'operation': 'warm_up'},
+            )
+
+    async def _warm_up_db(self):
+        if self.engine is None or self.db_connections <= 0:
+            return
+        #Соединения открываются одновременно, иначе каждое следующее
+        #бралось бы из пула повторно.
+        results = await asyncio.gather(
+            *[self.engine.connect().start() for _ in range(self.db_connections)],
+            return_exceptions=True,
+        )
+        connections = [
+            result for result in results if isinstance(result, AsyncConnection)
+        ]
+        try:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            if self.prepare is not None:
+                await asyncio.gather(*[
+                    self.prepare(connection) for connection in connections
+                ])
+        finally:
+            for connection in connections:
+                await connection.close()
+
+    async def _warm_up_redis(self):
+        if self.redis is None or self.redis_connections <= 0:
+            return
+        await asyncio.gather(*[
+            self.redis.ping() for _ in range(self.redis_connections)
+        ])
+
+    async def _ping_db(self):
+        async with self.engine.connect() as connection:
+            await connection.execute(text('SELECT 1'))
+
+    async def _available(self, backend: str, ping: Callable[[], Awaitable]) -> bool:
+        try:
+            await asyncio.wait_for(ping(), self.timeout)
+        except Exception as some_ex:
+            logger.warning(
+                'Хранилище недоступно',
+                exc_info=some_ex,
+                extra={'backend': backend, 'operation': 'readiness'},
+            )
+            return False
+        return True
+
+    async def check(self) -> Dict[str, bool]:
+        """Возвращает доступность используемых хранилищ."""
+
+        checks = {}
+        if self.engine is not None:
+            checks['postgresql'] = await self._available('postgresql', self._ping_db)
+        if self.redis is not None:
+            checks['redis'] = await self._available('redis', self.redis.ping)
+        return checks
+
+    def stop(self):
+        """Отмечает начало остановки: процесс перестает быть готовым,
+        и балансировщик успевает снять с него запросы.
+        """
+
+        self.stopping = True
+
+
+#Прогреваются и проверяются только хранилища, которые использует
+#выбранный репозиторий. Размер прогрева ограничен размером пула:
+#лишние соединения закрылись бы при возврате в пул.
+uses_redis = (
+    settings.no_sql
+    or settings.user_cache_enabled
+    or user_replica is not None
+    or (local_user_cache is not None and bool(settings.local_cache_channel))
+)
+process_readiness = ProcessReadiness(
+    None if settings.no_sql else engine,
+    redis_instance if uses_redis else None,
+    min(settings.db_pool_warmup, settings.db_pool_size),
+    min(settings.redis_pool_warmup, settings.redis_max_connections),
+    settings.readiness_timeout,
+    None if settings.no_sql else UserRepositorySQL.warm_up,
+)
@@ -0,0 +1,65 @@
+"""Перестроение индексов поиска пользователей в redis.
+
+Индексы удаляются и строятся заново по всем пользователям. Нужно
+выполнить после обновления приложения до версии с поиском, переноса
+пользователей migrate_redis_users.py и других изменений пользователей
+в обход приложения. Приложение на время перестроения нужно
+остановить.
+
+Запуск из директории app:
+    python rebuild_search_index.py
+"""
+import argparse
+import asyncio
+
+from config import redis_instance
+from data_sources.storages.user_repository import UserRepositoryNoSQL
+
+
+async def main(args):
+    index = UserRepositoryNoSQL.SEARCH_INDEX
+    codec = UserRepositoryNoSQL.CODEC
+    removed = 0
+    keys = []
+    async for key in redis_instance.scan_iter(match=index.match, count=args.batch_size):
+        keys.append(key)
+        if len(keys) >= args.batch_size:
+            removed += await redis_instance.delete(*keys)
+            keys = []
+    if keys:
+        removed += await redis_instance.delete(*keys)
+    indexed = 0
+    async for user_keys in scan_user_keys(codec.match, args.batch_size):
+        values = await redis_instance.mget(user_keys)
+        pipeline = redis_instance.pipeline(transaction=False)
+        for user_key, value in zip(user_keys, values):
+            if value is None:
+                continue
+            index.add(pipeline, user_key, codec.decode(value))
+            indexed += 1
+        await pipeline.execute()
+    await redis_instance.aclose()
+    print(f'Удалено ключей индексов {removed}, проиндексировано пользователей {indexed}')
+
+
+async def scan_user_keys(match: bytes, batch_size: int):
+    """Возвращает ключи пользователей пачками."""
+
+    keys = []
+    async for key in redis_instance.scan_iter(match=match, count=batch_size, _type='string'):
+        keys.append(key)
+        if len(keys) >= batch_size:
+            yield keys
+            keys = []
+    if keys:
+        yield keys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,54 @@
+"""Сверка реплики пользователей в redis с реляционной СУБД.
+
+Все пользователи реляционной СУБД записываются в реплику, если там
+их нет либо данные отличаются, а пользователи, которых нет
+в реляционной СУБД, удаляются из реплики. Запускается после
+восстановления базы данных из резервной копии, очистки redis
+и других изменений в обход приложения.
+
+Запуск из директории app:
+    python reconcile_redis_replica.py
+"""
+import argparse
+import asyncio
+import json
+
+from config import redis_instance, settings
+from data_sources.models import engine
+from data_sources.storages.redis_codec import RedisUserCodec
+from data_sources.storages.redis_scripts import RedisUserScripts
+from data_sources.storages.user_replica import RedisUserReplica
+
+
+async def main(args):
+    replica = RedisUserReplica(
+        engine,
+        redis_instance,
+        RedisUserCodec(
+            settings.redis_key_prefix,
+            settings.redis_key_format,
+            settings.redis_value_format,
+        ),
+        RedisUserScripts(redis_instance, settings.redis_value_format),
+        args.batch_size,
+        settings.redis_replica_poll_interval,
+        0,
+    )
+    try:
+        counts = await replica.reconcile()
+    finally:
+        await engine.dispose()
+        await redis_instance.aclose()
+    print(json.dumps(counts))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int,
+                        default=settings.redis_replica_batch_size,
+                        help='число пользователей, сверяемых за раз')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
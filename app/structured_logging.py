@@ -0,0 +1,223 @@
+"""Модуль содержит неблокирующее структурированное логирование.
+
+Записи журнала не пишутся в поток вывода из цикла событий: обработчик
+корневого логгера только кладет их в ограниченную очередь, а
+форматирование в JSON и запись выполняет фоновый поток. Повторяющиеся
+ошибки ограничиваются по частоте, при переполнении очереди записи
+отбрасываются, а не блокируют обработку запросов.
+"""
+import json
+import logging
+import queue
+import sys
+import time
+import traceback
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from metrics import LOG_RECORDS_DROPPED
+
+#id текущего запроса, добавляется во все записи журнала.
+request_id: 'ContextVar[Optional[str]]' = ContextVar(
+    'request_id', default=None,
+)
+
+REQUEST_ID_HEADER = b'x-request-id'
+
+#Поля записи журнала, которые переносятся в JSON, если заданы.
+EXTRA_FIELDS = ('request_id', 'backend', 'operation', 'suppressed')
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись журнала в одну строку JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': time.strftime(
+                '%Y-%m-%dT%H:%M:%S', time.gmtime(record.created),
+            ) + '.%03dZ' % record.msecs,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            exc_type, exc_value, exc_traceback = record.exc_info
+            entry['error_type'] = exc_type.__name__
+            entry['error'] = str(exc_value)
+            entry['traceback'] = ''.join(
+                traceback.format_exception(exc_type, exc_value, exc_traceback),
+            )
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничивает частоту повторяющихся записей уровня WARNING и выше.
+
+    Записи считаются повторяющимися, если у них совпадают логгер,
+    хранилище, операция и тип исключения. За интервал пропускается
+    не больше burst таких записей, число отброшенных сообщается в поле
+    suppressed первой записи следующего интервала.
+    """
+
+    def __init__(self, burst: int, interval: float):
+        """Инициализатор класса.
+
+        Parameters
+        ----------
+        burst: int
+            Число повторяющихся записей, пропускаемых за интервал.
+        interval: float
+            Длительность интервала в секундах.
+        """
+
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows: Dict[tuple, list] = {}
+
+    @staticmethod
+    def _key(record: logging.LogRecord) -> tuple:
+        exc_type = record.exc_info[0].__name__ if record.exc_info else None
+        return (
+            record.name,
+            getattr(record, 'backend', None),
+            getattr(record, 'operation', None),
+            exc_type,
+        )
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        now = time.monotonic()
+        key = self._key(record)
+        #Окно: [начало интервала, число записей, число отброшенных].
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window is not None else 0
+            self._windows[key] = [now, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed
+            return True
+        window[1] += 1
+        if window[1] <= self.burst:
+            return True
+        window[2] += 1
+        LOG_RECORDS_DROPPED.labels('rate_limited').inc()
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Обработчик, передающий записи в очередь фонового потока.
+
+    В отличие от QueueHandler, не форматирует запись в цикле событий,
+    а только фиксирует текст сообщения и id запроса; трассировка
+    исключения форматируется в фоновом потоке. Если очередь
+    заполнена, запись отбрасывается.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = request_id.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels('queue_full').inc()
+
+
+def setup_logging(level: str, queue_size: int, error_burst: int, error_interval: float):
+    """Настраивает корневой логгер на запись через очередь.
+
+    Записи накапливаются в очереди до вызова start_logging().
+
+    Parameters
+    ----------
+    level: str
+        Минимальный уровень записей.
+    queue_size: int
+        Максимальное число записей в очереди.
+    error_burst: int
+        Число повторяющихся ошибок, записываемых за интервал.
+    error_interval: float
+        Интервал ограничения повторяющихся ошибок в секундах.
+    """
+
+    global _listener
+    if _listener is not None:
+        return
+    log_queue: 'queue.Queue[logging.LogRecord]' = queue.Queue(queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(error_burst, error_interval))
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    root_logger = logging.getLogger()
+    root_logger.handlers = [queue_handler]
+    root_logger.setLevel(level.upper())
+    _listener = QueueListener(log_queue, stream_handler)
+
+
+def start_logging():
+    """Запускает фоновый поток записи журнала."""
+
+    if _listener is not None and _listener._thread is None:
+        _listener.start()
+
+
+def stop_logging():
+    """Записывает оставшиеся в очереди записи и останавливает
+    фоновый поток."""
+
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+class RequestIdMiddleware():
+    """ASGI-промежуточный слой, присваивающий запросу id.
+
+    id берется из заголовка X-Request-ID либо генерируется и
+    возвращается в том же заголовке ответа.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        current_id = self._header(scope) or uuid.uuid4().hex
+        token = request_id.set(current_id)
+
+        async def send_with_request_id(message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = [
+                    *message.get('headers', []),
+                    (REQUEST_ID_HEADER, current_id.encode('latin-1')),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
+
+    @staticmethod
+    def _header(scope) -> Optional[str]:
+        for name, value in scope['headers']:
+            if name == REQUEST_ID_HEADER:
+                #Чужой id ограничивается по длине, чтобы не раздувать журнал.
+                return value.decode('latin-1')[:128] or None
+        return None
@@ -1,19 +1,140 @@
 """Модуль с функциями-обработчиками запросов."""
-from fastapi import APIRouter, Depends
-from fastapi import Request
-from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, List, Literal, Optional, Union
 
-from data_sources.models import get_async_session
-from pydantic_models.pydantic_models import UserModel
+import pydantic_core
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi import Request, Response
+from starlette import status
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from bulk_export import MEDIA_TYPES, gzip_chunks, users_to_ndjson
+from bulk_import import UserImport, format_from_content_type
+from data_sources.models import (
+    get_no_connection,
+    get_read_connection,
+    get_write_connection,
+)
+from pydantic_models.pydantic_models import (
+    UserModel,
+    UserPatchModel,
+    UserResp,
+    UserUpdateResp,
+    UsersBatchResp,
+    UsersIdsModel,
+    UsersPageResp,
+    UsersSearchResp,
+)
+from metrics import InstrumentedRoute
 from data_sources.storages.user_repository import user_repository
 from config import settings
 
-user_router = APIRouter()
 
-@user_router.post('/api/v1/users')
+#Зависимости соединения выбираются один раз при запуске: при работе
+#с redis обработчики не получают соединение с базой данных,
+#запросы на чтение получают соединение в режиме autocommit,
+#и только изменения данных выполняются в транзакции. При групповой
+#записи добавление и обновление одного пользователя выполняются
+#соединением UserWriteBatcher и не занимают соединение на запрос.
+#При объединении чтений пользователь по id читается собственным
+#соединением UserRepositorySingleFlight: соединение запроса,
+#удерживаемое на время ожидания общего чтения, исчерпало бы пул.
+if settings.no_sql:
+    read_connection = write_connection = get_no_connection
+else:
+    read_connection = get_read_connection
+    write_connection = get_write_connection
+if settings.no_sql or settings.write_batch_enabled:
+    batched_write_connection = get_no_connection
+else:
+    batched_write_connection = get_write_connection
+if settings.no_sql or settings.single_flight_enabled:
+    user_read_connection = get_no_connection
+else:
+    user_read_connection = get_read_connection
+
+
+def user_etag(version: int) -> str:
+    """Возвращает ETag пользователя по его версии."""
+    return f'"{version}"'
+
+
+def etag_versions(header: str) -> Optional[List[int]]:
+    """Возвращает версии из заголовка If-Match либо If-None-Match.
+
+    Возвращает None, если заголовок равен "*", то есть подходит
+    любая версия. Слабые ETag сравниваются как сильные, значения,
+    не являющиеся версиями, пропускаются.
+
+    Parameters
+    ----------
+    header: str
+        Значение заголовка.
+    """
+    if header.strip() == '*':
+        return None
+    versions = []
+    for etag in header.split(','):
+        etag = etag.strip()
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        etag = etag.strip('"')
+        if etag.isdigit():
+            versions.append(int(etag))
+    return versions
+
+
+class PydanticJSONResponse(JSONResponse):
+    """Ответ JSON, который сериализует модели pydantic напрямую
+    сериализатором pydantic-core.
+
+    Обработчики возвращают этот ответ с моделью, созданной
+    в репозитории, поэтому FastAPI не проверяет ее повторно по
+    response_model и не преобразует через jsonable_encoder.
+    response_model маршрутов используется только для схемы OpenAPI.
+    """
+
+    def render(self, content) -> bytes:
+        return pydantic_core.to_json(content)
+
+
+user_router = APIRouter(
+    route_class=InstrumentedRoute,
+    default_response_class=PydanticJSONResponse,
+)
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """Потоковый ответ, который формируется по мере чтения тела
+    запроса.
+
+    StreamingResponse во время передачи читает входящие сообщения,
+    ожидая отключения клиента, и забрал бы части тела запроса;
+    этот ответ их не читает.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def progress_to_ndjson(reports: AsyncIterator) -> AsyncIterator[str]:
+    """Преобразует отчеты о ходе импорта в строки формата NDJSON.
+
+    Parameters
+    ----------
+    reports: AsyncIterator
+        Асинхронный итератор по отчетам.
+    """
+    async for report in reports:
+        yield report.model_dump_json() + '\n'
+
+
+@user_router.post('/api/v1/users', response_model=UserResp)
 async def create_user(
     request: UserModel,
-    session: AsyncSession = Depends(get_async_session),
+    connection: AsyncConnection = Depends(batched_write_connection),
 ):
     """Запрос на создание нового пользователя.
 
@@ -22,65 +143,305 @@ async def create_user(
     request: UserModel
         Данные запроса.
         
-    session: AsyncSession
-        Сессия соединения с базой данных.
+    connection: AsyncConnection
+        Соединение с базой данных.
     """
     if settings.no_sql:
-        return await user_repository.create_user(
+        user = await user_repository.create_user(
             request.surname,
             request.name,
             request.patronymic,
         )
-    return await user_repository.create_user(
-        request.surname,
-        request.name,
-        request.patronymic,
-        session,
+    else:
+        user = await user_repository.create_user(
+            request.surname,
+            request.name,
+            request.patronymic,
+            connection,
+        )
+    return PydanticJSONResponse(user)
+
+
+@user_router.post('/api/v1/users/bulk', response_model=List[UserResp])
+async def create_users(
+    request: List[UserModel],
+    connection: AsyncConnection = Depends(write_connection),
+):
+    """Запрос на создание списка пользователей.
+
+    Parameters
+    ----------
+    request: List[UserModel]
+        Данные запроса.
+
+    connection: AsyncConnection
+        Соединение с базой данных.
+    """
+    if settings.no_sql:
+        users = await user_repository.create_users(request)
+    else:
+        users = await user_repository.create_users(request, connection)
+    return PydanticJSONResponse(users)
+
+
+@user_router.post('/api/v1/users/import')
+async def import_users(
+    request: Request,
+    import_format: Optional[Literal['csv', 'ndjson']] = Query(None, alias='format'),
+    chunk_size: int = Query(5000, ge=1, le=50000),
+):
+    """Запрос на импорт пользователей из файла CSV либо NDJSON.
+
+    Файл передается телом запроса и записывается пачками по мере
+    получения. Формат берется из параметра format либо заголовка
+    Content-Type(text/csv, application/x-ndjson), по умолчанию NDJSON;
+    в CSV первая строка- заголовок с колонками surname, name,
+    patronymic. Ответ передается потоком NDJSON: отчет после каждой
+    записанной пачки и итоговый отчет с done=true.
+
+    Parameters
+    ----------
+    request: Request
+        Объект запроса.
+
+    import_format: Optional[Literal['csv', 'ndjson']]
+        Формат файла.
+
+    chunk_size: int
+        Число пользователей в пачке записи.
+    """
+    user_import = UserImport(
+        import_format
+        or format_from_content_type(request.headers.get('content-type'))
+        or 'ndjson',
+        chunk_size,
+    )
+    written = await user_repository.import_users(
+        user_import.chunks(request.stream()),
+    )
+    return RequestStreamingResponse(
+        progress_to_ndjson(user_import.run(written)),
+        media_type='application/x-ndjson',
+    )
+
+
+@user_router.get('/api/v1/users', response_model=Union[UsersPageResp, UsersBatchResp])
+async def get_users(
+    ids: Optional[List[str]] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    connection: AsyncConnection = Depends(read_connection),
+):
+    """Запрос на получение данных списка пользователей.
+
+    Если переданы ids, возвращаются пользователи с этими id,
+    id можно передать повторяющимся параметром либо через запятую.
+    Иначе возвращается страница списка пользователей, а при stream=true
+    все пользователи передаются потоком в формате NDJSON.
+
+    Parameters
+    ----------
+    ids: Optional[List[str]]
+        Список id пользователей.
+
+    limit: int
+        Размер страницы.
+
+    cursor: Optional[str]
+        Курсор следующей страницы из предыдущего ответа.
+
+    stream: bool
+        Передать всех пользователей потоком NDJSON.
+
+    connection: AsyncConnection
+        Соединение с базой данных.
+    """
+    if stream:
+        return StreamingResponse(
+            users_to_ndjson(await user_repository.stream_users()),
+            media_type='application/x-ndjson',
+        )
+    if not ids:
+        if settings.no_sql:
+            page = await user_repository.list_users(limit, cursor)
+        else:
+            page = await user_repository.list_users(limit, cursor, connection)
+        return PydanticJSONResponse(page)
+    user_ids = [
+        user_id for value in ids for user_id in value.split(',') if user_id
+    ]
+    if settings.no_sql:
+        users = await user_repository.get_users(user_ids)
+    else:
+        users = await user_repository.get_users(user_ids, connection)
+    return PydanticJSONResponse(users)
+
+
+@user_router.get('/api/v1/users/export')
+async def export_users(
+    export_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format'),
+    gzip: bool = False,
+):
+    """Запрос на выгрузку всех пользователей.
+
+    Пользователи передаются потоком по мере чтения из хранилища;
+    чтение приостанавливается, пока клиент не примет переданные
+    данные. CSV содержит заголовок с колонками id, surname, name,
+    patronymic, version.
+
+    Parameters
+    ----------
+    export_format: Literal['ndjson', 'csv']
+        Формат выгрузки.
+
+    gzip: bool
+        Сжать выгрузку в формат gzip.
+    """
+    chunks = await user_repository.export_users(export_format)
+    filename = f'users.{export_format}'
+    media_type = MEDIA_TYPES[export_format]
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        media_type = 'application/gzip'
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
     )
 
 
-@user_router.patch('/api/v1/users/{target_user_id}')
+@user_router.get('/api/v1/users/search', response_model=UsersSearchResp)
+async def search_users(
+    surname: Optional[str] = None,
+    name: Optional[str] = None,
+    patronymic: Optional[str] = None,
+    mode: Literal['exact', 'prefix', 'fuzzy'] = 'exact',
+    limit: int = Query(50, ge=1, le=1000),
+    connection: AsyncConnection = Depends(read_connection),
+):
+    """Запрос на поиск пользователей по фамилии, имени и отчеству.
+
+    Должно быть задано хотя бы одно поле, условия по нескольким
+    полям должны выполняться одновременно, регистр букв не
+    учитывается.
+
+    Parameters
+    ----------
+    surname: Optional[str]
+        Фамилия либо ее начало.
+
+    name: Optional[str]
+        Имя либо его начало.
+
+    patronymic: Optional[str]
+        Отчество либо его начало.
+
+    mode: Literal['exact', 'prefix', 'fuzzy']
+        Вид поиска: точное совпадение, совпадение начала либо
+        нечеткое совпадение по триграммам.
+
+    limit: int
+        Максимальное число пользователей.
+
+    connection: AsyncConnection
+        Соединение с базой данных.
+    """
+    values = {'surname': surname, 'name': name, 'patronymic': patronymic}
+    if settings.no_sql:
+        users = await user_repository.search_users(values, mode, limit)
+    else:
+        users = await user_repository.search_users(values, mode, limit, connection)
+    return PydanticJSONResponse(users)
+
+
+@user_router.post('/api/v1/users/lookup', response_model=UsersBatchResp)
+async def lookup_users(
+    request: UsersIdsModel,
+    connection: AsyncConnection = Depends(read_connection),
+):
+    """Запрос на получение данных списка пользователей.
+
+    Вариант запроса get_users для длинных списков id.
+
+    Parameters
+    ----------
+    request: UsersIdsModel
+        Данные запроса.
+
+    connection: AsyncConnection
+        Соединение с базой данных.
+    """
+    if settings.no_sql:
+        users = await user_repository.get_users(request.ids)
+    else:
+        users = await user_repository.get_users(request.ids, connection)
+    return PydanticJSONResponse(users)
+
+
+@user_router.patch('/api/v1/users/{target_user_id}', response_model=UserUpdateResp)
 async def update_user(
-    request: UserModel,
+    request: UserPatchModel,
     target_user_id: str,
-    session: AsyncSession = Depends(get_async_session),
+    if_match: Optional[str] = Header(None),
+    connection: AsyncConnection = Depends(batched_write_connection),
 ):
     """Запрос на обновление данных пользователя.
 
+    Изменяются только переданные поля. Если данные не изменились,
+    запись не выполняется, версия остается прежней, а в ответе
+    updated=false. Если передан заголовок If-Match, пользователь обновляется, только
+    если его версия совпадает с ETag из заголовка, иначе возвращается
+    412. ETag ответа содержит новую версию.
+
     Parameters
     ----------
-    requests: UserModel
+    requests: UserPatchModel
         Данные запроса.
         
     target_user_id: str
         id пользователя.
 
-    session: AsyncSession
-        Сессия соединения с базой данных.
+    if_match: Optional[str]
+        Заголовок If-Match.
+
+    connection: AsyncConnection
+        Соединение с базой данных.
     """
+    expected_versions = etag_versions(if_match) if if_match else None
     if settings.no_sql:
-        return await user_repository.update_user(
+        user = await user_repository.update_user(
             request.surname,
             request.name,
             request.patronymic,
             target_user_id,
+            expected_versions=expected_versions,
         )
-    return await user_repository.update_user(
-        request.surname,
-        request.name,
-        request.patronymic,
-        target_user_id,
-        session)
+    else:
+        user = await user_repository.update_user(
+            request.surname,
+            request.name,
+            request.patronymic,
+            target_user_id,
+            connection,
+            expected_versions=expected_versions,
+        )
+    return PydanticJSONResponse(user, headers={'ETag': user_etag(user.version)})
 
 
-@user_router.get('/api/v1/users/{user_id}')
+@user_router.get('/api/v1/users/{user_id}', response_model=UserResp)
 async def get_user(
     request: Request,
     user_id: str,
-    session: AsyncSession = Depends(get_async_session),
+    if_none_match: Optional[str] = Header(None),
+    connection: AsyncConnection = Depends(user_read_connection),
 ):
     """Запрос на получение данных пользователя.
 
+    Ответ содержит ETag с версией пользователя. Если версия совпадает
+    с заголовком If-None-Match, возвращается 304 без тела.
+
     Parameters
     ----------
     requests: Request
@@ -89,22 +450,40 @@ async def get_user(
     user_id: str
         id пользователя
 
-    session: AsyncSession
-        Сессия соединения с базой данных.
+    if_none_match: Optional[str]
+        Заголовок If-None-Match.
+
+    connection: AsyncConnection
+        Соединение с базой данных.
     """
     if settings.no_sql:
-        return await user_repository.get_user(user_id)
-    return await user_repository.get_user(user_id, session)
+        user = await user_repository.get_user(user_id)
+    else:
+        user = await user_repository.get_user(user_id, connection)
+    etag = user_etag(user.version)
+    if if_none_match:
+        versions = etag_versions(if_none_match)
+        if versions is None or user.version in versions:
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers={'ETag': etag},
+            )
+    return PydanticJSONResponse(user, headers={'ETag': etag})
 
 
 @user_router.delete('/api/v1/users/{user_id}')
 async def delete_user(
     request: Request,
     user_id: str,
-    session: AsyncSession = Depends(get_async_session),
+    if_match: Optional[str] = Header(None),
+    connection: AsyncConnection = Depends(write_connection),
 ):
     """Запрос на удаление пользователя.
 
+    Если передан заголовок If-Match, пользователь удаляется, только
+    если его версия совпадает с ETag из заголовка, иначе возвращается
+    412.
+
     Parameters
     ----------
     requests: Request
@@ -113,9 +492,22 @@ async def delete_user(
     user_id: str
         id пользователя
 
-    session: AsyncSession
-        Сессия соединения с базой данных.
+    if_match: Optional[str]
+        Заголовок If-Match.
+
+    connection: AsyncConnection
+        Соединение с базой данных.
     """
+    expected_versions = etag_versions(if_match) if if_match else None
     if settings.no_sql:
-        return await user_repository.delete_user(user_id)
-    return await user_repository.delete_user(user_id, session)
+        result = await user_repository.delete_user(
+            user_id,
+            expected_versions=expected_versions,
+        )
+    else:
+        result = await user_repository.delete_user(
+            user_id,
+            connection,
+            expected_versions=expected_versions,
+        )
+    return PydanticJSONResponse(result)
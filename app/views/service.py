@@ -0,0 +1,99 @@
+"""Модуль с функциями-обработчиками служебных запросов."""
+from fastapi import APIRouter, Response
+from fastapi.responses import JSONResponse
+from starlette import status
+
+from config import get_redis_pool_stats
+from data_sources.models import get_db_pool_stats
+from data_sources.storages.user_repository import (
+    local_user_cache,
+    user_single_flight,
+)
+from metrics import render_metrics
+from readiness import process_readiness
+
+service_router = APIRouter()
+
+
+@service_router.get('/api/v1/service/cache')
+async def get_cache_stats():
+    """Запрос на получение счетчиков кэша пользователей в памяти
+    процесса.
+
+    Счетчики относятся к процессу, обработавшему запрос.
+    """
+    if local_user_cache is None:
+        return {'enabled': False}
+    return {'enabled': True, **local_user_cache.stats()}
+
+
+@service_router.get('/api/v1/service/single-flight')
+async def get_single_flight_stats():
+    """Запрос на получение счетчиков объединения одновременных
+    чтений пользователей.
+
+    Счетчики относятся к процессу, обработавшему запрос.
+    """
+    if user_single_flight is None:
+        return {'enabled': False}
+    return {'enabled': True, **user_single_flight.stats()}
+
+
+@service_router.get('/api/v1/service/pools')
+async def get_pools_stats():
+    """Запрос на получение состояния пулов соединений с базой данных
+    и redis.
+
+    Состояние относится к процессу, обработавшему запрос.
+    """
+    return {
+        'db': get_db_pool_stats(),
+        'redis': get_redis_pool_stats(),
+    }
+
+
+@service_router.get('/healthz', include_in_schema=False)
+async def get_health():
+    """Запрос на проверку работы процесса приложения.
+
+    Не обращается к хранилищам: отвечает, пока процесс обрабатывает
+    запросы.
+    """
+    return {'status': 'ok'}
+
+
+@service_router.get('/readyz', include_in_schema=False)
+async def get_readiness():
+    """Запрос на проверку готовности процесса приложения к приему
+    запросов.
+
+    Возвращает 503, пока пулы соединений не прогреты, после начала
+    остановки процесса и если используемое хранилище не отвечает.
+    """
+    checks = await process_readiness.check()
+    ready = (
+        process_readiness.warmed_up
+        and not process_readiness.stopping
+        and all(checks.values())
+    )
+    return JSONResponse(
+        {
+            'ready': ready,
+            'warmed_up': process_readiness.warmed_up,
+            'stopping': process_readiness.stopping,
+            'warmup_seconds': process_readiness.warmup_seconds,
+            'checks': checks,
+            'pools': {
+                'db': get_db_pool_stats(),
+                'redis': get_redis_pool_stats(),
+            },
+        },
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+@service_router.get('/metrics', include_in_schema=False)
+async def get_metrics():
+    """Запрос на получение метрик в формате Prometheus."""
+    content, media_type = render_metrics()
+    return Response(content=content, media_type=media_type)
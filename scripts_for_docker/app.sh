@@ -2,8 +2,22 @@
 
 cd app
 
-alembic upgrade head
+#Миграции выполняются один раз до запуска процессов gunicorn. Пока
+#PostgreSQL не принимает соединения, попытка повторяется.
+MIGRATION_ATTEMPTS=${MIGRATION_ATTEMPTS:-30}
+for attempt in $(seq 1 $MIGRATION_ATTEMPTS); do
+    alembic upgrade head && break
+    if [ "$attempt" -eq "$MIGRATION_ATTEMPTS" ]; then
+        exit 1
+    fi
+    sleep 2
+done
 
-alembic upgrade head
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+rm -rf $PROMETHEUS_MULTIPROC_DIR
+mkdir -p $PROMETHEUS_MULTIPROC_DIR
 
-gunicorn main:application --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
\ No newline at end of file
+#Приложение импортируется в каждом процессе после его создания(без
+#--preload), поэтому движок базы данных, клиент redis и прогретые
+#при запуске соединения принадлежат процессу.
+exec gunicorn main:application --workers ${WEB_CONCURRENCY:-4} --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
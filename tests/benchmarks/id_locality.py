@@ -0,0 +1,182 @@
+"""Бенчмарк влияния вида id пользователей на вставку и размер индексов.
+
+Для каждого варианта создается отдельная таблица с колонками таблицы
+user, в нее через COPY пачками вставляются --rows строк:
+    uuid4_ix_user_id - случайные id и дублирующий индекс ix_user_id
+        (схема до revision5),
+    uuid4 - случайные id, только индекс первичного ключа,
+    uuid7 - id по времени(UUID версии 7), только индекс первичного ключа.
+После каждых --report-every строк печатается скорость вставки отрезка,
+в конце - размеры таблицы и индексов и задержка одиночных INSERT
+в заполненную таблицу. Время создания id в замер не входит. Эффект
+заметен, когда индексы перестают помещаться в shared_buffers,
+поэтому по умолчанию вставляется 10 млн строк. Требует запущенный
+PostgreSQL, параметры подключения берутся из ".env", таблицы
+удаляются после замера.
+
+Запуск из корневой директории:
+    python -m tests.benchmarks.id_locality --rows 10000000 --output ids.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from data_sources.models import engine  # noqa: E402
+from data_sources.user_ids import uuid7  # noqa: E402
+
+from tests.benchmarks.load import PERCENTILES, percentile  # noqa: E402
+
+VARIANTS = {
+    'uuid4_ix_user_id': (uuid.uuid4, True),
+    'uuid4': (uuid.uuid4, False),
+    'uuid7': (uuid7, False),
+}
+COLUMNS = ('id', 'surname', 'name', 'patronymic', 'version')
+
+
+async def create_table(connection, table: str, id_index: bool):
+    """Создает таблицу варианта с колонками таблицы user."""
+    await connection.execute(f'DROP TABLE IF EXISTS {table}')
+    await connection.execute(
+        f'CREATE TABLE {table} ('
+        'id UUID PRIMARY KEY, surname VARCHAR NOT NULL, name VARCHAR NOT NULL, '
+        'patronymic VARCHAR NOT NULL, version INTEGER NOT NULL DEFAULT 1)'
+    )
+    if id_index:
+        await connection.execute(f'CREATE INDEX {table}_ix_id ON {table} (id)')
+
+
+async def relation_sizes(connection, table: str) -> dict:
+    """Возвращает размеры таблицы и ее индексов в байтах."""
+    rows = await connection.fetch(
+        'SELECT indexrelid::regclass::text AS name, pg_relation_size(indexrelid) AS size '
+        'FROM pg_index WHERE indrelid = $1::regclass',
+        table,
+    )
+    return {
+        'table_bytes': await connection.fetchval('SELECT pg_relation_size($1::regclass)', table),
+        'indexes_bytes': {row['name']: row['size'] for row in rows},
+    }
+
+
+async def run_variant(
+    connection,
+    variant: str,
+    rows: int,
+    batch_size: int,
+    report_every: int,
+    single_inserts: int,
+) -> dict:
+    """Заполняет таблицу варианта и возвращает результаты замера."""
+    make_id, id_index = VARIANTS[variant]
+    table = f'bench_ids_{variant}'
+    await create_table(connection, table, id_index)
+    segments = []
+    segment_rows = 0
+    segment_elapsed = 0.0
+    inserted = 0
+    total_elapsed = 0.0
+    try:
+        while inserted < rows:
+            count = min(batch_size, rows - inserted)
+            records = [
+                (make_id(), 'surname', 'name', 'patronymic', 1)
+                for _ in range(count)
+            ]
+            started = time.perf_counter()
+            await connection.copy_records_to_table(table, records=records, columns=COLUMNS)
+            elapsed = time.perf_counter() - started
+            inserted += count
+            total_elapsed += elapsed
+            segment_rows += count
+            segment_elapsed += elapsed
+            if segment_rows >= report_every or inserted == rows:
+                rate = round(segment_rows / segment_elapsed, 1)
+                segments.append({'rows': inserted, 'rows_per_second': rate})
+                print(f'{variant:<18}{inserted:>12} строк{rate:>14.1f} строк/с')
+                segment_rows = 0
+                segment_elapsed = 0.0
+        latencies = []
+        for _ in range(single_inserts):
+            started = time.perf_counter()
+            await connection.execute(
+                f'INSERT INTO {table} (id, surname, name, patronymic) VALUES ($1, $2, $3, $4)',
+                make_id(), 'surname', 'name', 'patronymic',
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        await connection.execute(f'VACUUM ANALYZE {table}')
+        report = {
+            'rows': inserted,
+            'copy_rows_per_second': round(inserted / total_elapsed, 1),
+            'segments': segments,
+            'single_insert_ms': {
+                f'p{rank}': round(percentile(latencies, rank), 3) for rank in PERCENTILES
+            },
+            **await relation_sizes(connection, table),
+        }
+    finally:
+        await connection.execute(f'DROP TABLE IF EXISTS {table}')
+    return report
+
+
+def print_report(results: dict):
+    """Печатает сводную таблицу результатов."""
+    print(
+        f"{'вариант':<18}{'строк/с COPY':>14}{'INSERT p50, мс':>16}"
+        f"{'INSERT p99, мс':>16}{'таблица, МБ':>13}{'индексы, МБ':>13}"
+    )
+    for variant, report in results.items():
+        print(
+            f"{variant:<18}{report['copy_rows_per_second']:>14.1f}"
+            f"{report['single_insert_ms']['p50']:>16.3f}"
+            f"{report['single_insert_ms']['p99']:>16.3f}"
+            f"{report['table_bytes'] / 2 ** 20:>13.1f}"
+            f"{sum(report['indexes_bytes'].values()) / 2 ** 20:>13.1f}"
+        )
+
+
+async def main(args):
+    results = {}
+    try:
+        async with engine.connect() as connection:
+            await connection.execution_options(isolation_level='AUTOCOMMIT')
+            raw_connection = await connection.get_raw_connection()
+            driver_connection = raw_connection.driver_connection
+            for variant in args.variants.split(','):
+                results[variant] = await run_variant(
+                    driver_connection,
+                    variant,
+                    args.rows,
+                    args.batch_size,
+                    args.report_every,
+                    args.single_inserts,
+                )
+    finally:
+        await engine.dispose()
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--report-every', type=int, default=1_000_000)
+    parser.add_argument('--single-inserts', type=int, default=2000)
+    parser.add_argument('--variants', default=','.join(VARIANTS),
+                        help='варианты через запятую: ' + ', '.join(VARIANTS))
+    parser.add_argument('--output', help='файл JSON для результатов')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
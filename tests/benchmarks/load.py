@@ -0,0 +1,282 @@
+"""Нагрузочный бенчмарк CRUD API пользователей.
+
+Приложение запускается в том же процессе и вызывается через
+ASGI-транспорт httpx, без сети и gunicorn. Для каждого репозитория
+(sql - UserRepositorySQL, nosql - UserRepositoryNoSQL) бенчмарк
+выполняется в отдельном процессе, так как репозиторий выбирается при
+импорте приложения. Для sql нужен PostgreSQL с примененными миграциями,
+для nosql - Redis либо, с флагом --fake-redis, fakeredis. Параметры
+подключения берутся из ".env" и переменных окружения.
+
+Результаты сохраняются в JSON: пропускная способность и перцентили
+задержки для каждого репозитория, уровня конкурентности и обработчика.
+
+Запуск из корневой директории:
+    python -m tests.benchmarks.load --backends sql,nosql \\
+        --concurrency 1,16,64 --requests 2000 --output bench.json
+    python -m tests.benchmarks.load --compare old.json new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+APP_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', '..', 'app'),
+)
+
+#Доли операций в смесях нагрузки.
+MIXES = {
+    'read-heavy': {'create': 2, 'get': 90, 'update': 6, 'delete': 2},
+    'balanced': {'create': 10, 'get': 60, 'update': 20, 'delete': 10},
+    'write-heavy': {'create': 30, 'get': 20, 'update': 40, 'delete': 10},
+}
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values: List[float], rank: int) -> float:
+    """Возвращает перцентиль отсортированного списка по ближайшему рангу."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(rank / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    """Сводит задержки одного обработчика в отчет."""
+    latencies = sorted(latencies)
+    report = {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+    for rank in PERCENTILES:
+        report[f'p{rank}_ms'] = round(percentile(latencies, rank) * 1000, 3)
+    report['max_ms'] = round(latencies[-1] * 1000, 3) if latencies else 0.0
+    return report
+
+
+def new_user() -> dict:
+    suffix = random.randrange(1_000_000)
+    return {
+        'surname': f'surname{suffix}',
+        'name': f'name{suffix}',
+        'patronymic': f'patronymic{suffix}',
+    }
+
+
+async def run_level(client, mix: dict, concurrency: int, requests: int, user_ids: list) -> dict:
+    """Выполняет requests запросов с заданной конкурентностью."""
+    operations = list(mix)
+    weights = [mix[operation] for operation in operations]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            operation = random.choices(operations, weights)[0]
+            if operation != 'create' and not user_ids:
+                operation = 'create'
+            started = time.perf_counter()
+            if operation == 'create':
+                response = await client.post('/api/v1/users', json=new_user())
+                if response.status_code == 200:
+                    user_ids.append(response.json()['id'])
+            elif operation == 'get':
+                user_id = random.choice(user_ids)
+                response = await client.get(f'/api/v1/users/{user_id}')
+            elif operation == 'update':
+                user_id = random.choice(user_ids)
+                response = await client.patch(f'/api/v1/users/{user_id}', json=new_user())
+            else:
+                user_id = user_ids.pop(random.randrange(len(user_ids)))
+                response = await client.delete(f'/api/v1/users/{user_id}')
+            latency = time.perf_counter() - started
+            #Гонки удаления с чтением и обновлением того же id в
+            #бенчмарке ожидаемы и не считаются ошибками.
+            if response.status_code >= 500:
+                errors[operation] += 1
+            latencies[operation].append(latency)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    return {
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'total': summarize(all_latencies, sum(errors.values()), elapsed),
+        'endpoints': {
+            operation: summarize(latencies[operation], errors[operation], elapsed)
+            for operation in operations
+            if latencies[operation]
+        },
+    }
+
+
+async def run_backend(args) -> dict:
+    """Выполняет бенчмарк для репозитория, выбранного переменной NO_SQL."""
+    sys.path.insert(0, APP_DIR)
+    import config
+    if args.fake_redis:
+        import fakeredis
+        config.redis_instance = fakeredis.aioredis.FakeRedis()
+    import httpx
+    from main import application
+
+    random.seed(args.seed)
+    transport = httpx.ASGITransport(app=application)
+    async with application.router.lifespan_context(application):
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+            response = await client.post(
+                '/api/v1/users/bulk',
+                json=[new_user() for _ in range(args.seed_users)],
+            )
+            response.raise_for_status()
+            user_ids = [user['id'] for user in response.json()]
+            levels = []
+            for concurrency in args.concurrency:
+                await run_level(client, MIXES[args.mix], concurrency, args.warmup, user_ids)
+                levels.append(await run_level(
+                    client, MIXES[args.mix], concurrency, args.requests, user_ids,
+                ))
+    return {
+        'repository': 'UserRepositoryNoSQL' if config.settings.no_sql else 'UserRepositorySQL',
+        'levels': levels,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=APP_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_all(args) -> dict:
+    """Запускает бенчмарк каждого репозитория в отдельном процессе."""
+    results = {}
+    for backend in args.backends:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as output:
+            output_path = output.name
+        command = [
+            sys.executable, '-m', 'tests.benchmarks.load',
+            '--run-backend', backend,
+            '--output', output_path,
+            '--mix', args.mix,
+            '--concurrency', ','.join(str(level) for level in args.concurrency),
+            '--requests', str(args.requests),
+            '--warmup', str(args.warmup),
+            '--seed-users', str(args.seed_users),
+            '--seed', str(args.seed),
+        ]
+        if args.fake_redis:
+            command.append('--fake-redis')
+        env = {**os.environ, 'NO_SQL': str(backend == 'nosql')}
+        subprocess.run(command, env=env, check=True)
+        with open(output_path) as output:
+            results[backend] = json.load(output)
+        os.remove(output_path)
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'mix': args.mix,
+            'requests_per_level': args.requests,
+            'seed_users': args.seed_users,
+            'fake_redis': args.fake_redis,
+        },
+        'results': results,
+    }
+
+
+def print_report(report: dict):
+    for backend, result in report['results'].items():
+        print(f"{backend} ({result['repository']})")
+        for level in result['levels']:
+            for name, stats in [('total', level['total']), *level['endpoints'].items()]:
+                print(
+                    f"  c={level['concurrency']:<4}{name:<8}"
+                    f"{stats['throughput_rps']:>10.1f} rps"
+                    f"{stats['p50_ms']:>10.2f} p50"
+                    f"{stats['p99_ms']:>10.2f} p99 ms"
+                    f"{stats['errors']:>6} ошибок"
+                )
+
+
+def compare(old_path: str, new_path: str):
+    """Печатает изменение пропускной способности и p99 между отчетами."""
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+    print(f"{old['meta']['revision']} -> {new['meta']['revision']}")
+    for backend, result in new['results'].items():
+        old_levels = {
+            level['concurrency']: level
+            for level in old['results'].get(backend, {}).get('levels', [])
+        }
+        for level in result['levels']:
+            old_level = old_levels.get(level['concurrency'])
+            if old_level is None:
+                continue
+            for name, stats in [('total', level['total']), *level['endpoints'].items()]:
+                old_stats = old_level['total'] if name == 'total' else old_level['endpoints'].get(name)
+                if not old_stats or not old_stats['throughput_rps'] or not old_stats['p99_ms']:
+                    continue
+                rps_change = stats['throughput_rps'] / old_stats['throughput_rps'] - 1
+                p99_change = stats['p99_ms'] / old_stats['p99_ms'] - 1
+                print(
+                    f"{backend:<6} c={level['concurrency']:<4}{name:<8}"
+                    f"{rps_change:>+9.1%} rps{p99_change:>+9.1%} p99"
+                )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', default='sql,nosql',
+                        type=lambda value: value.split(','))
+    parser.add_argument('--mix', choices=sorted(MIXES), default='read-heavy')
+    parser.add_argument('--concurrency', default='1,16,64',
+                        type=lambda value: [int(level) for level in value.split(',')])
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='число запросов на уровень конкурентности')
+    parser.add_argument('--warmup', type=int, default=200,
+                        help='число прогревочных запросов перед уровнем')
+    parser.add_argument('--seed-users', type=int, default=1000,
+                        help='число пользователей, создаваемых до замеров')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fake-redis', action='store_true',
+                        help='использовать fakeredis вместо сервера Redis')
+    parser.add_argument('--output', help='путь к файлу JSON с результатами')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--run-backend', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+    elif args.run_backend:
+        with open(args.output, 'w') as output:
+            json.dump(asyncio.run(run_backend(args)), output)
+    else:
+        report = run_all(args)
+        print_report(report)
+        if args.output:
+            with open(args.output, 'w') as output:
+                json.dump(report, output, indent=2, ensure_ascii=False)
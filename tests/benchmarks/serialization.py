@@ -0,0 +1,172 @@
+"""Микро-бенчмарк формирования ответов API пользователей.
+
+Сравнивает процессорное время на запрос для трех вариантов
+обработчика в отдельных приложениях FastAPI, вызываемых напрямую
+через ASGI, без сети и хранилищ:
+    model - обработчик возвращает модель без response_model (как было
+        до PydanticJSONResponse): FastAPI преобразует ее через
+        jsonable_encoder и json.dumps,
+    response_model - обработчик возвращает модель при объявленном
+        response_model: FastAPI проверяет ее заново и сериализует
+        по схеме ответа,
+    pydantic_core - обработчик возвращает PydanticJSONResponse с
+        моделью (текущие обработчики).
+Ответы: один пользователь(UserResp) и страница из --page-size
+пользователей(UsersPageResp). Также печатается время создания
+UserResp с проверкой и через model_construct.
+
+Запуск из корневой директории:
+    python -m tests.benchmarks.serialization --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from fastapi import FastAPI  # noqa: E402
+
+from data_sources.user_ids import uuid7  # noqa: E402
+from pydantic_models.pydantic_models import UserResp, UsersPageResp  # noqa: E402
+from views.crud_for_users import PydanticJSONResponse  # noqa: E402
+
+VARIANTS = ('model', 'response_model', 'pydantic_core')
+
+
+def make_user() -> dict:
+    return {
+        'id': str(uuid7()),
+        'surname': 'Иванов',
+        'name': 'Иван',
+        'patronymic': 'Иванович',
+        'version': 3,
+    }
+
+
+def make_app(variant: str, user: UserResp, page: UsersPageResp) -> FastAPI:
+    """Создает приложение с обработчиками одного пользователя и
+    страницы в заданном варианте.
+    """
+    app = FastAPI()
+    if variant == 'model':
+        @app.get('/user')
+        async def get_user():
+            return user
+
+        @app.get('/page')
+        async def get_page():
+            return page
+    elif variant == 'response_model':
+        @app.get('/user', response_model=UserResp)
+        async def get_user():
+            return user
+
+        @app.get('/page', response_model=UsersPageResp)
+        async def get_page():
+            return page
+    else:
+        @app.get('/user', response_model=UserResp)
+        async def get_user():
+            return PydanticJSONResponse(user)
+
+        @app.get('/page', response_model=UsersPageResp)
+        async def get_page():
+            return PydanticJSONResponse(page)
+    return app
+
+
+async def call(app: FastAPI, path: str) -> bytes:
+    """Выполняет GET-запрос к приложению через ASGI и возвращает тело."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [],
+        'server': ('test', 80),
+        'client': ('test', 1),
+    }
+    body = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.body':
+            body.append(message.get('body', b''))
+
+    await app(scope, receive, send)
+    return b''.join(body)
+
+
+async def measure(app: FastAPI, path: str, requests: int) -> float:
+    """Возвращает процессорное время на запрос в микросекундах."""
+    for _ in range(200):
+        await call(app, path)
+    started = time.process_time()
+    for _ in range(requests):
+        await call(app, path)
+    return (time.process_time() - started) / requests * 1_000_000
+
+
+def measure_construction(iterations: int) -> dict:
+    """Возвращает время создания UserResp в микросекундах."""
+    values = make_user()
+    return {
+        'validated': timeit.timeit(lambda: UserResp(**values), number=iterations)
+        / iterations * 1_000_000,
+        'model_construct': timeit.timeit(lambda: UserResp.model_construct(**values), number=iterations)
+        / iterations * 1_000_000,
+    }
+
+
+async def main(args):
+    user = UserResp(**make_user())
+    page = UsersPageResp(
+        users=[UserResp(**make_user()) for _ in range(args.page_size)],
+        next_cursor=None,
+    )
+    apps = {variant: make_app(variant, user, page) for variant in VARIANTS}
+    bodies = {variant: await call(apps[variant], '/page') for variant in VARIANTS}
+    decoded = [json.loads(body) for body in bodies.values()]
+    if any(body != decoded[0] for body in decoded):
+        raise SystemExit('Ответы вариантов отличаются')
+    results = {}
+    print(f"{'вариант':<18}{'пользователь, мкс':>20}{'страница, мкс':>18}")
+    for variant, app in apps.items():
+        results[variant] = {
+            'user_us': round(await measure(app, '/user', args.requests), 2),
+            'page_us': round(await measure(app, '/page', max(1, args.requests // 10)), 2),
+        }
+        print(
+            f"{variant:<18}{results[variant]['user_us']:>20.2f}"
+            f"{results[variant]['page_us']:>18.2f}"
+        )
+    construction = measure_construction(args.requests * 5)
+    results['construction_us'] = {name: round(value, 3) for name, value in construction.items()}
+    for name, value in construction.items():
+        print(f'UserResp {name:<24}{value:>10.3f} мкс')
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--output', help='файл JSON для результатов')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
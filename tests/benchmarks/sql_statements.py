@@ -0,0 +1,113 @@
+"""Микро-бенчмарк горячих запросов репозитория UserRepositorySQL.
+
+Сравнивает стоимость вызова запроса, который строится заново при
+каждом вызове, и заранее построенного запроса репозитория с
+параметрами. Требует запущенный PostgreSQL с примененными миграциями,
+параметры подключения берутся из ".env".
+
+Запуск из корневой директории:
+    python -m tests.benchmarks.sql_statements --iterations 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from sqlalchemy import select  # noqa: E402
+
+from data_sources.models import User_model, engine  # noqa: E402
+from data_sources.storages.user_repository import (  # noqa: E402
+    UserRepositorySQL,
+    build_update_user,
+)
+
+
+def build_select(user_id: uuid.UUID):
+    """Строит запрос так, как он строился до предварительной сборки."""
+    return select(User_model).where(User_model.c.id == user_id)
+
+
+def update_parameters(user_id: uuid.UUID) -> dict:
+    """Параметры запроса обновления, совпадающие с текущими данными."""
+    return {
+        'user_id': user_id,
+        'new_surname': 'surname',
+        'new_name': 'name',
+        'new_patronymic': 'patronymic',
+    }
+
+
+async def measure(name: str, iterations: int, call) -> float:
+    """Выполняет call iterations раз и печатает среднее время вызова."""
+    async with engine.connect() as connection:
+        for _ in range(100):
+            await call(connection)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await call(connection)
+        elapsed = time.perf_counter() - started
+        await connection.rollback()
+    per_call = elapsed / iterations * 1_000_000
+    print(f'{name:<32}{per_call:>10.1f} мкс/вызов')
+    return per_call
+
+
+async def main(iterations: int):
+    user_id = uuid.uuid4()
+    async with engine.connect() as connection:
+        await connection.execute(
+            UserRepositorySQL.INSERT_USER,
+            {
+                'new_id': user_id,
+                'new_surname': 'surname',
+                'new_name': 'name',
+                'new_patronymic': 'patronymic',
+            },
+        )
+        await connection.commit()
+    try:
+        await measure(
+            'select: построение при вызове',
+            iterations,
+            lambda connection: connection.execute(build_select(user_id)),
+        )
+        await measure(
+            'select: готовый запрос',
+            iterations,
+            lambda connection: connection.execute(
+                UserRepositorySQL.SELECT_USER_BY_ID, {'user_id': user_id},
+            ),
+        )
+        await measure(
+            'update: построение при вызове',
+            iterations,
+            lambda connection: connection.execute(
+                build_update_user(check_version=False),
+                update_parameters(user_id),
+            ),
+        )
+        await measure(
+            'update: готовый запрос',
+            iterations,
+            lambda connection: connection.execute(
+                UserRepositorySQL.UPDATE_USER,
+                update_parameters(user_id),
+            ),
+        )
+    finally:
+        async with engine.connect() as connection:
+            await connection.execute(
+                UserRepositorySQL.DELETE_USER, {'user_id': user_id},
+            )
+            await connection.commit()
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=5000)
+    asyncio.run(main(parser.parse_args().iterations))
@@ -0,0 +1,28 @@
+"""Общая настройка тестов: модули приложения импортируются из
+директории app, как при запуске приложения.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+
+@pytest.fixture
+def run():
+    """Выполняет корутину в новом цикле событий и возвращает ее
+    результат.
+    """
+
+    return asyncio.run
+
+
+@pytest.fixture
+def redis():
+    """Экземпляр fakeredis с интерпретатором Lua."""
+
+    pytest.importorskip('lupa')
+    fakeredis = pytest.importorskip('fakeredis')
+    return fakeredis.FakeAsyncRedis()
@@ -0,0 +1,72 @@
+"""Тесты потокового импорта пользователей UserImport.
+
+Хранилище заменено функцией записи, которая отклоняет строки
+с фамилией bad и может прервать импорт.
+
+Запуск из корневой директории:
+    python -m pytest tests
+"""
+import json
+from typing import AsyncIterator, List
+
+from bulk_import import UserImport
+
+
+async def iter_file(lines: List[str]) -> AsyncIterator[bytes]:
+    yield '\n'.join(lines).encode()
+
+
+async def write(chunks, fail_on: int = 0):
+    number = 0
+    async for chunk in chunks:
+        number += 1
+        if number == fail_on:
+            raise ConnectionError('connection lost')
+        rejected = [
+            (position, 'violates check constraint')
+            for position, user in enumerate(chunk)
+            if user.surname == 'bad'
+        ]
+        yield len(chunk) - len(rejected), rejected
+
+
+def user_line(surname: str) -> str:
+    return json.dumps({'surname': surname, 'name': 'Ivan', 'patronymic': 'Ivanovich'})
+
+
+def test_rejected_rows_are_reported_with_file_lines(run):
+    async def check():
+        lines = [user_line(surname) for surname in ('Ivanov', 'bad', 'Petrov', 'Sidorov', 'bad')]
+        lines.insert(2, 'garbage')
+        user_import = UserImport('ndjson', 2)
+        reports = [
+            report async for report in
+            user_import.run(write(user_import.chunks(iter_file(lines))))
+        ]
+        final = reports[-1]
+        assert final.done and final.error is None
+        assert final.imported == 3 and final.failed == 3
+        errors = [error for report in reports for error in report.errors]
+        assert [(error.line, error.error) for error in errors if 'constraint' in error.error] == [
+            (2, 'violates check constraint'),
+            (6, 'violates check constraint'),
+        ]
+        assert [error.line for error in errors] == [2, 3, 6]
+
+    run(check())
+
+
+def test_failed_chunk_lines_are_reported(run):
+    async def check():
+        lines = [user_line(f'Ivanov{index}') for index in range(6)]
+        lines.insert(3, 'garbage')
+        user_import = UserImport('ndjson', 2)
+        reports = [
+            report async for report in
+            user_import.run(write(user_import.chunks(iter_file(lines)), fail_on=2))
+        ]
+        final = reports[-1]
+        assert final.done and final.imported == 2
+        assert final.error == 'Ошибка на стороне сервера, не записаны строки 3-5'
+
+    run(check())
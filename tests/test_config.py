@@ -0,0 +1,39 @@
+"""Тесты конфигурации пула соединений с redis.
+
+Запуск из корневой директории:
+    python -m pytest tests
+"""
+import pytest
+
+import config
+
+
+def test_redis_pool_uses_configured_limit():
+    assert config.redis_instance.connection_pool is config.redis_pool
+    assert isinstance(config.redis_pool, config.CountingConnectionPool)
+    assert config.redis_pool.max_connections == config.settings.redis_max_connections
+    stats = config.get_redis_pool_stats()
+    assert stats['max_connections'] == config.settings.redis_max_connections
+
+
+def test_redis_pool_stats_count_connections(run, monkeypatch):
+    async def check():
+        fakeredis = pytest.importorskip('fakeredis')
+        client = fakeredis.FakeAsyncRedis(
+            connection_pool_class=config.CountingConnectionPool,
+            max_connections=5,
+        )
+        monkeypatch.setattr(config, 'redis_instance', client)
+        assert config.get_redis_pool_stats() == {'max_connections': 5, 'idle': 0, 'in_use': 0}
+
+        await client.set('key', 1)
+        assert config.get_redis_pool_stats() == {'max_connections': 5, 'idle': 1, 'in_use': 0}
+
+        connection = await client.connection_pool.get_connection('GET')
+        await client.get('key')
+        assert config.get_redis_pool_stats() == {'max_connections': 5, 'idle': 1, 'in_use': 1}
+        await client.connection_pool.release(connection)
+        assert config.get_redis_pool_stats() == {'max_connections': 5, 'idle': 2, 'in_use': 0}
+        await client.aclose()
+
+    run(check())
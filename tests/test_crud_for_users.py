@@ -0,0 +1,119 @@
+"""Тесты условных запросов к пользователю по ETag: If-None-Match
+в GET и If-Match в PATCH и DELETE.
+
+Обработчики работают с репозиторием UserRepositoryNoSQL поверх
+fakeredis с интерпретатором Lua.
+
+Запуск из корневой директории:
+    python -m pytest tests
+"""
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from config import settings
+from data_sources.models import get_no_connection, get_read_connection, get_write_connection
+from data_sources.storages.redis_scripts import RedisUserScripts
+from data_sources.storages.user_repository import UserRepositoryNoSQL
+from data_sources.storages.user_search import RedisUserSearchIndex
+from views import crud_for_users
+
+USER = {'surname': 'Ivanov', 'name': 'Ivan', 'patronymic': 'Ivanovich'}
+
+
+@pytest.fixture
+def client(redis, monkeypatch):
+    """Возвращает функцию, создающую клиента приложения с
+    пользователями в fakeredis.
+    """
+
+    monkeypatch.setattr(settings, 'no_sql', True)
+    monkeypatch.setattr(UserRepositoryNoSQL, 'REDIS_INSTANCE', redis)
+    monkeypatch.setattr(UserRepositoryNoSQL, 'SCRIPTS', RedisUserScripts(
+        redis, settings.redis_value_format, settings.redis_search_prefix,
+    ))
+    monkeypatch.setattr(UserRepositoryNoSQL, 'SEARCH_INDEX', RedisUserSearchIndex(
+        redis, UserRepositoryNoSQL.CODEC, settings.redis_search_prefix,
+    ))
+    monkeypatch.setattr(
+        crud_for_users, 'user_repository', UserRepositoryNoSQL(True, True, True, True),
+    )
+    application = FastAPI()
+    application.include_router(crud_for_users.user_router)
+    application.dependency_overrides[get_read_connection] = get_no_connection
+    application.dependency_overrides[get_write_connection] = get_no_connection
+    return lambda: httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=application), base_url='http://test',
+    )
+
+
+def test_get_if_none_match(run, client):
+    async def check():
+        async with client() as http:
+            user_id = (await http.post('/api/v1/users', json=USER)).json()['id']
+            response = await http.get(f'/api/v1/users/{user_id}')
+            assert response.status_code == 200
+            assert response.headers['etag'] == '"1"'
+
+            for header in ('"1"', 'W/"1"', '"5", "1"', '*'):
+                response = await http.get(
+                    f'/api/v1/users/{user_id}', headers={'If-None-Match': header},
+                )
+                assert response.status_code == 304
+                assert response.headers['etag'] == '"1"'
+                assert response.content == b''
+
+            response = await http.get(
+                f'/api/v1/users/{user_id}', headers={'If-None-Match': '"2"'},
+            )
+            assert response.status_code == 200
+            assert response.json()['name'] == 'Ivan'
+
+    run(check())
+
+
+def test_patch_if_match(run, client):
+    async def check():
+        async with client() as http:
+            user_id = (await http.post('/api/v1/users', json=USER)).json()['id']
+            url = f'/api/v1/users/{user_id}'
+
+            response = await http.patch(url, json={'name': 'Petr'}, headers={'If-Match': '"2"'})
+            assert response.status_code == 412
+            assert (await http.get(url)).json()['name'] == 'Ivan'
+
+            response = await http.patch(url, json={'name': 'Petr'}, headers={'If-Match': '"1"'})
+            assert response.status_code == 200
+            assert response.json()['updated'] is True
+            assert response.headers['etag'] == '"2"'
+
+            #Клиент с устаревшей версией не перезаписывает изменение.
+            response = await http.patch(url, json={'name': 'Pavel'}, headers={'If-Match': '"1"'})
+            assert response.status_code == 412
+            response = await http.get(url, headers={'If-None-Match': '"2"'})
+            assert response.status_code == 304
+
+            #Без изменения данных версия остается прежней.
+            response = await http.patch(url, json={'name': 'Petr'}, headers={'If-Match': '*'})
+            assert response.status_code == 200
+            assert response.json()['updated'] is False
+            assert response.headers['etag'] == '"2"'
+
+    run(check())
+
+
+def test_delete_if_match(run, client):
+    async def check():
+        async with client() as http:
+            user_id = (await http.post('/api/v1/users', json=USER)).json()['id']
+            url = f'/api/v1/users/{user_id}'
+
+            response = await http.delete(url, headers={'If-Match': '"2"'})
+            assert response.status_code == 412
+            assert (await http.get(url)).status_code == 200
+
+            response = await http.delete(url, headers={'If-Match': '"1"'})
+            assert response.status_code == 200
+            assert (await http.get(url)).status_code == 400
+
+    run(check())
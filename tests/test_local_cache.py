@@ -0,0 +1,56 @@
+"""Тесты кэша пользователей в памяти процесса LocalUserCache.
+
+Запуск из корневой директории:
+    python -m pytest tests
+"""
+from data_sources.storages.local_cache import LocalUserCache
+
+
+def test_invalidation_of_other_key_keeps_load(run):
+    async def check():
+        cache = LocalUserCache(100, 60)
+        epoch = cache.epoch()
+        #Пока загружаются оба пользователя, пользователь a изменен
+        #в этом процессе, а о другом пришло оповещение из канала.
+        await cache.invalidate('a')
+        cache._evict('c')
+        cache.set('a', {'version': 1}, epoch)
+        cache.set('b', {'version': 1}, epoch)
+        assert cache.get('a') is None
+        assert cache.get('b') == {'version': 1}
+
+        #Загрузка, начатая после инвалидации, сохраняется.
+        cache.set('a', {'version': 2}, cache.epoch())
+        assert cache.get('a') == {'version': 2}
+
+    run(check())
+
+
+def test_forgotten_invalidations_reject_older_loads(run):
+    async def check():
+        cache = LocalUserCache(2, 60)
+        epoch = cache.epoch()
+        for key in ('a', 'b', 'c'):
+            await cache.invalidate(key)
+        #Отметка ключа a вытеснена, поэтому загрузка a, начатая до
+        #нее, отклоняется, а начатая после - сохраняется.
+        cache.set('a', {'version': 1}, epoch)
+        assert cache.get('a') is None
+        cache.set('d', {'version': 1}, epoch)
+        assert cache.get('d') is None
+        cache.set('a', {'version': 2}, cache.epoch())
+        assert cache.get('a') == {'version': 2}
+
+    run(check())
+
+
+def test_clear_rejects_all_loads_in_flight():
+    cache = LocalUserCache(100, 60)
+    epoch = cache.epoch()
+    cache.set('a', {'version': 1}, epoch)
+    cache._clear()
+    assert cache.get('a') is None
+    cache.set('b', {'version': 1}, epoch)
+    assert cache.get('b') is None
+    cache.set('b', {'version': 1}, cache.epoch())
+    assert cache.get('b') == {'version': 1}
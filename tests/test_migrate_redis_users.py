@@ -0,0 +1,34 @@
+"""Тесты переноса хэшей пользователей redis в формат хранения
+RedisUserCodec.
+
+Запуск из корневой директории:
+    python -m pytest tests
+"""
+import uuid
+
+from data_sources.storages.redis_codec import RedisUserCodec
+from migrate_redis_users import LEGACY_ID_MATCH, migrate_hashes
+
+USER = {'surname': 'Ivanov', 'name': 'Ivan', 'patronymic': 'Ivanovich'}
+
+
+def test_only_user_hashes_are_migrated(run, redis):
+    async def check():
+        codec = RedisUserCodec('user:', 'binary', 'msgpack')
+        prefixed_id, bare_id = uuid.uuid4(), uuid.uuid4()
+        await redis.hset(b'user:' + str(prefixed_id).encode(), mapping=USER)
+        await redis.hset(str(bare_id).encode(), mapping=USER)
+        #Хэш другого приложения с id в ключе и полями пользователя.
+        other_key = f'orders:{uuid.uuid4()}'.encode()
+        await redis.hset(other_key, mapping=USER)
+
+        counts = await migrate_hashes(redis, codec, [LEGACY_ID_MATCH, codec.match], 10, False)
+        assert counts == {'migrated': 2, 'skipped': 0}
+        for user_id in (prefixed_id, bare_id):
+            assert codec.decode(await redis.get(codec.key(user_id))) == {**USER, 'version': '1'}
+        assert await redis.exists(str(bare_id).encode()) == 0
+        assert await redis.hgetall(other_key) == {
+            field.encode(): value.encode() for field, value in USER.items()
+        }
+
+    run(check())
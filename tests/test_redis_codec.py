@@ -0,0 +1,141 @@
+"""Тесты формата хранения пользователей в redis: значения, записанные
+RedisUserCodec, читаются Lua-скриптами RedisUserScripts и наоборот.
+
+Скрипты выполняются в fakeredis с интерпретатором Lua(lupa).
+
+Запуск из корневой директории:
+    python -m pytest tests
+"""
+import uuid
+
+import msgpack
+import pytest
+
+from data_sources.storages.redis_codec import RedisUserCodec
+from data_sources.storages.redis_scripts import RedisUserScripts
+
+FORMATS = [
+    (key_format, value_format)
+    for key_format in RedisUserCodec.KEY_FORMATS
+    for value_format in RedisUserCodec.VALUE_FORMATS
+]
+
+#Длины полей в байтах покрывают все заголовки строк msgpack:
+#fixstr, str8, str16 и str32.
+USERS = [
+    {'surname': 'Ivanov', 'name': 'Ivan', 'patronymic': 'Ivanovich', 'version': '1'},
+    {'surname': 'Иванов', 'name': 'Иван', 'patronymic': 'Иванович', 'version': '7'},
+    {'surname': '', 'name': '|:', 'patronymic': '', 'version': '12'},
+    {'surname': 'ф' * 40, 'name': 'n' * 300, 'patronymic': 'p' * 70000, 'version': '3'},
+]
+
+
+def make_codec(key_format: str, value_format: str) -> RedisUserCodec:
+    return RedisUserCodec('user:*', key_format, value_format)
+
+
+@pytest.mark.parametrize('key_format,value_format', FORMATS)
+def test_key_round_trip(key_format, value_format):
+    codec = make_codec(key_format, value_format)
+    user_id = uuid.uuid4()
+    key = codec.key(user_id)
+    assert key.startswith(b'user:*')
+    assert codec.user_id(key) == str(user_id)
+
+
+@pytest.mark.parametrize('key_format,value_format', FORMATS)
+@pytest.mark.parametrize('user', USERS)
+def test_value_round_trip(key_format, value_format, user):
+    codec = make_codec(key_format, value_format)
+    assert codec.decode(codec.encode(user)) == user
+
+
+@pytest.mark.parametrize('value_format', RedisUserCodec.VALUE_FORMATS)
+def test_value_without_version(value_format):
+    codec = make_codec('text', value_format)
+    fields = ['Ivanov', 'Ivan', 'Ivanovich']
+    if value_format == 'msgpack':
+        value = msgpack.packb(fields)
+    else:
+        value = RedisUserCodec.encode_string(fields)
+    assert codec.decode(value) == {
+        'surname': 'Ivanov',
+        'name': 'Ivan',
+        'patronymic': 'Ivanovich',
+        'version': '1',
+    }
+
+
+@pytest.mark.parametrize('key_format,value_format', FORMATS)
+@pytest.mark.parametrize('user', USERS)
+def test_lua_reads_and_writes_codec_values(key_format, value_format, user, run, redis):
+    async def check():
+        codec = make_codec(key_format, value_format)
+        scripts = RedisUserScripts(redis, value_format)
+        key = codec.key(uuid.uuid4())
+        await redis.set(key, codec.encode(user))
+
+        #Lua разбирает значение Python и кодирует его заново.
+        result, value = await scripts.update_user(
+            key, ['Петров', None, None], [int(user['version'])],
+        )
+        assert result == RedisUserScripts.APPLIED
+        expected = {
+            **user,
+            'surname': 'Петров',
+            'version': str(int(user['version']) + 1),
+        }
+        assert value == codec.encode(expected)
+        assert codec.decode(await redis.get(key)) == expected
+
+        #Данные не изменились: значение, записанное Lua, совпадает
+        #с переданными полями.
+        result, value = await scripts.update_user(key, ['Петров', None, None])
+        assert result == RedisUserScripts.UNCHANGED
+        assert codec.decode(value) == expected
+
+        deleted, value = await scripts.delete_user(key, [int(expected['version'])])
+        assert deleted
+        assert codec.decode(value) == expected
+        assert await redis.get(key) is None
+
+    run(check())
+
+
+@pytest.mark.parametrize('value_format', RedisUserCodec.VALUE_FORMATS)
+def test_lua_version_check(value_format, run, redis):
+    async def check():
+        codec = make_codec('binary', value_format)
+        scripts = RedisUserScripts(redis, value_format)
+        key = codec.key(uuid.uuid4())
+        user = USERS[0]
+        await redis.set(key, codec.encode(user))
+
+        result, value = await scripts.update_user(key, ['Petrov', None, None], [2])
+        assert result == RedisUserScripts.CONFLICT
+        assert codec.decode(value) == user
+
+        tombstone_key = b'deleted:' + key
+        written = await scripts.set_users_if_newer(
+            [key], [codec.encode({**user, 'name': 'Petr', 'version': '2'})], [2], [tombstone_key],
+        )
+        assert written == 1
+        assert codec.decode(await redis.get(key))['name'] == 'Petr'
+
+        written = await scripts.set_users_if_newer(
+            [key], [codec.encode(user)], [1], [tombstone_key],
+        )
+        assert written == 0
+
+        #Удаленный пользователь не записывается снова никакой версией.
+        assert await scripts.remove_users([key], [tombstone_key], 60) == 1
+        assert await redis.get(key) is None
+        written = await scripts.set_users_if_newer(
+            [key], [codec.encode({**user, 'version': '9'})], [9], [tombstone_key],
+        )
+        assert written == 0
+        assert await redis.get(key) is None
+
+        assert await scripts.update_user(codec.key(uuid.uuid4()), ['Petrov', None, None]) is None
+
+    run(check())
@@ -0,0 +1,104 @@
+"""Тесты объединения одновременных обращений SingleFlight.
+
+Запуск из корневой директории:
+    python -m pytest tests
+"""
+import asyncio
+
+import pytest
+
+from data_sources.storages.single_flight import SingleFlight
+
+
+class Source():
+    """Источник, отвечающий номером вызова после сигнала release."""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def read(self) -> int:
+        self.calls += 1
+        number = self.calls
+        await self.release.wait()
+        return number
+
+
+def test_concurrent_calls_are_shared(run):
+    async def check():
+        single_flight, source = SingleFlight(), Source()
+        tasks = [
+            asyncio.ensure_future(single_flight.do('user:1', source.read))
+            for _ in range(5)
+        ]
+        await asyncio.sleep(0)
+        assert single_flight.stats()['in_flight'] == 1
+        source.release.set()
+        results = await asyncio.gather(*tasks)
+        assert results == [(1, False)] + [(1, True)] * 4
+        assert source.calls == 1
+        assert single_flight.stats() == {'in_flight': 0, 'calls': 1, 'shared': 4, 'forgotten': 0}
+
+        #Результат не сохраняется: следующее обращение- новый вызов.
+        assert await single_flight.do('user:1', source.read) == (2, False)
+
+    run(check())
+
+
+def test_error_is_passed_to_every_caller(run):
+    async def check():
+        single_flight = SingleFlight()
+        calls = []
+
+        async def fail():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ConnectionError('connection lost')
+
+        results = await asyncio.gather(*[
+            single_flight.do('user:1', fail) for _ in range(3)
+        ], return_exceptions=True)
+        assert len(calls) == 1
+        assert all(isinstance(result, ConnectionError) for result in results)
+        assert single_flight.stats()['in_flight'] == 0
+
+    run(check())
+
+
+def test_cancelled_leader_does_not_cancel_call(run):
+    async def check():
+        single_flight, source = SingleFlight(), Source()
+        leader = asyncio.ensure_future(single_flight.do('user:1', source.read))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(single_flight.do('user:1', source.read))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        source.release.set()
+        assert await follower == (1, True)
+        assert source.calls == 1
+        assert single_flight.stats()['in_flight'] == 0
+
+    run(check())
+
+
+def test_forget_starts_new_call(run):
+    async def check():
+        single_flight, source = SingleFlight(), Source()
+        before = asyncio.ensure_future(single_flight.do('user:1', source.read))
+        await asyncio.sleep(0)
+
+        #Данные изменены: обращения после forget() не получают
+        #результат вызова, начатого до изменения.
+        single_flight.forget('user:1')
+        single_flight.forget('user:2')
+        after = asyncio.ensure_future(single_flight.do('user:1', source.read))
+        await asyncio.sleep(0)
+        source.release.set()
+        assert await before == (1, False)
+        assert await after == (2, False)
+        assert single_flight.stats() == {'in_flight': 0, 'calls': 2, 'shared': 0, 'forgotten': 1}
+
+    run(check())
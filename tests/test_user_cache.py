@@ -0,0 +1,109 @@
+"""Тесты кэша пользователей RedisUserCache в fakeredis: запись только
+более новых данных скриптом SET_IF_NEWER и одна загрузка на ключ.
+
+Запуск из корневой директории:
+    python -m pytest tests
+"""
+import asyncio
+import uuid
+
+from data_sources.storages.user_cache import RedisUserCache
+
+
+def user(name: str, version: int) -> dict:
+    return {'surname': 'Ivanov', 'name': name, 'patronymic': 'Ivanovich', 'version': version}
+
+
+def test_stale_load_is_not_written(run, redis):
+    async def check():
+        cache = RedisUserCache(redis, 60)
+        user_id = str(uuid.uuid4())
+        assert await cache.set(user_id, user('Ivan', 2))
+        assert not await cache.set(user_id, user('Petr', 1))
+        assert not await cache.set(user_id, user('Petr', 2))
+        assert not await cache.set(user_id, {})
+        assert (await cache.get(user_id))['name'] == 'Ivan'
+
+        #Загрузка, прочитавшая пользователя до изменения, не
+        #перезаписывает отметку изменения.
+        await cache.invalidate(user_id, 3)
+        assert await cache.get(user_id) is None
+        assert not await cache.set(user_id, user('Ivan', 2))
+        assert await cache.set(user_id, user('Pavel', 3))
+        assert (await cache.get(user_id))['name'] == 'Pavel'
+        #Отметка изменения не заменяет ту же либо более новую версию.
+        await cache.invalidate(user_id, 3)
+        assert (await cache.get(user_id))['name'] == 'Pavel'
+
+        await cache.mark_deleted(user_id)
+        assert await cache.get(user_id) == {}
+        assert not await cache.set(user_id, user('Pavel', 9))
+        assert await cache.get(user_id) == {}
+        ttl = await redis.ttl(RedisUserCache.KEY_PREFIX + user_id)
+        assert 0 < ttl <= RedisUserCache.TOMBSTONE_TTL
+
+    run(check())
+
+
+def test_missing_user_is_replaced_by_created(run, redis):
+    async def check():
+        cache = RedisUserCache(redis, 60)
+        user_id = str(uuid.uuid4())
+        assert await cache.set(user_id, {})
+        assert await cache.get(user_id) == {}
+        ttl = await redis.ttl(RedisUserCache.KEY_PREFIX + user_id)
+        assert 0 < ttl <= RedisUserCache.MISSING_TTL
+        assert not await cache.set(user_id, {})
+        assert await cache.set(user_id, user('Ivan', 1))
+
+    run(check())
+
+
+def test_concurrent_misses_load_once(run, redis):
+    async def check():
+        #Два экземпляра кэша- два процесса с общим redis.
+        caches = [RedisUserCache(redis, 60), RedisUserCache(redis, 60)]
+        user_id = str(uuid.uuid4())
+        loads = []
+
+        async def loader():
+            loads.append(user_id)
+            await asyncio.sleep(0.05)
+            return user('Ivan', 1)
+
+        users = await asyncio.gather(*[
+            caches[index % 2].get_or_load(user_id, loader) for index in range(10)
+        ])
+        assert loads == [user_id]
+        assert all(loaded == user('Ivan', 1) for loaded in users)
+        assert await redis.exists(RedisUserCache.KEY_PREFIX + user_id + ':lock') == 0
+        assert all(not cache._loading for cache in caches)
+
+    run(check())
+
+
+def test_load_error_is_passed_to_waiters(run, redis):
+    async def check():
+        cache = RedisUserCache(redis, 60)
+        user_id = str(uuid.uuid4())
+        loads = []
+
+        async def loader():
+            loads.append(user_id)
+            await asyncio.sleep(0.01)
+            raise ConnectionError('connection lost')
+
+        results = await asyncio.gather(*[
+            cache.get_or_load(user_id, loader) for _ in range(3)
+        ], return_exceptions=True)
+        assert len(loads) == 1
+        assert all(isinstance(result, ConnectionError) for result in results)
+
+        #Следующий промах загружает пользователя заново.
+        async def reload():
+            return user('Ivan', 1)
+
+        assert await cache.get_or_load(user_id, reload) == user('Ivan', 1)
+        assert user_id not in cache._loading
+
+    run(check())
@@ -0,0 +1,67 @@
+"""Тесты реплики пользователей RedisUserReplica в fakeredis.
+
+Запуск из корневой директории:
+    python -m pytest tests
+"""
+import uuid
+
+from data_sources.storages.redis_codec import RedisUserCodec
+from data_sources.storages.redis_scripts import RedisUserScripts
+from data_sources.storages.user_replica import RedisUserReplica
+
+
+def make_replica(redis) -> RedisUserReplica:
+    return RedisUserReplica(
+        None,
+        redis,
+        RedisUserCodec('user:', 'binary', 'string'),
+        RedisUserScripts(redis, 'string'),
+        100,
+        0.5,
+        0,
+    )
+
+
+def user_row(user_id: uuid.UUID, name: str, version: int) -> tuple:
+    return (user_id, 'Ivanov', name, 'Ivanovich', version)
+
+
+def test_write_keeps_newer_version(run, redis):
+    async def check():
+        replica = make_replica(redis)
+        user_id = uuid.uuid4()
+        assert await replica.write_users([user_row(user_id, 'Petr', 2)]) == 1
+        assert await replica.write_users([user_row(user_id, 'Ivan', 1)]) == 0
+        assert await replica.write_users([user_row(user_id, 'Petr', 2)]) == 0
+        assert (await replica.get_users([user_id]))[0]['name'] == 'Petr'
+
+    run(check())
+
+
+def test_removed_user_is_not_written_back(run, redis):
+    async def check():
+        replica = make_replica(redis)
+        user_id, missing_id, other_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        await replica.write_users([user_row(user_id, 'Ivan', 1)])
+
+        #Удаление пользователя, которого нет в реплике, тоже
+        #оставляет отметку удаления.
+        assert await replica.remove_users([user_id, missing_id]) == 1
+        written = await replica.write_users([
+            user_row(user_id, 'Petr', 2),
+            user_row(missing_id, 'Ivan', 1),
+            user_row(other_id, 'Ivan', 1),
+        ])
+        assert written == 1
+        users = await replica.get_users([user_id, missing_id, other_id])
+        assert users[0] is None and users[1] is None
+        assert users[2]['name'] == 'Ivan'
+
+        tombstone_key = RedisUserReplica.TOMBSTONE_PREFIX + replica.codec.key(user_id)
+        ttl = await redis.ttl(tombstone_key)
+        assert 0 < ttl <= RedisUserReplica.TOMBSTONE_TTL
+        #Отметки удаления не попадают в SCAN ключей пользователей.
+        keys = [key async for key in redis.scan_iter(match=replica.codec.match)]
+        assert keys == [replica.codec.key(other_id)]
+
+    run(check())
@@ -0,0 +1,81 @@
+"""Тесты поиска пользователей RedisUserSearchIndex в fakeredis.
+
+Запуск из корневой директории:
+    python -m pytest tests
+"""
+import uuid
+from typing import List
+
+from data_sources.storages import user_search
+from data_sources.storages.redis_codec import RedisUserCodec
+from data_sources.storages.user_search import RedisUserSearchIndex, search_criteria
+
+
+def make_index(redis) -> RedisUserSearchIndex:
+    return RedisUserSearchIndex(redis, RedisUserCodec('user:', 'text', 'string'), 'user_search:')
+
+
+async def add_users(redis, index: RedisUserSearchIndex, users: List[dict]):
+    pipeline = redis.pipeline(transaction=False)
+    for user in users:
+        user = {'patronymic': 'Ivanovich', 'version': '1', **user}
+        user_key = index.codec.key(uuid.uuid4())
+        pipeline.set(user_key, index.codec.encode(user))
+        index.add(pipeline, user_key, user)
+    await pipeline.execute()
+
+
+def test_prefix_search_reads_following_pages(run, redis):
+    async def check():
+        index = make_index(redis)
+        await add_users(redis, index, [
+            {'surname': f'Petrov{number:03}', 'name': 'Ivan'} for number in range(250)
+        ])
+        await add_users(redis, index, [
+            {'surname': 'Petrovzz', 'name': 'Zed'} for _ in range(3)
+        ])
+
+        #Подходящие под оба условия пользователи- в конце индекса
+        #фамилий, после двух страниц неподходящих.
+        users = await index.search(
+            search_criteria({'surname': 'petrov', 'name': 'zed'}), 'prefix', 10,
+        )
+        assert [user['surname'] for user in users] == ['Petrovzz'] * 3
+
+        users = await index.search(search_criteria({'surname': 'petrov'}), 'prefix', 150)
+        assert [user['surname'] for user in users] == [
+            f'Petrov{number:03}' for number in range(150)
+        ]
+
+        users = await index.search(search_criteria({'surname': 'petrov001'}), 'exact', 10)
+        assert [user['surname'] for user in users] == ['Petrov001']
+
+    run(check())
+
+
+def test_fuzzy_search_checks_bounded_candidates(run, redis, monkeypatch):
+    async def check():
+        monkeypatch.setattr(user_search, 'MAX_FUZZY_CANDIDATES', 5)
+        index = make_index(redis)
+        await add_users(redis, index, [{'surname': 'Ivanov', 'name': 'Ivan'} for _ in range(3)])
+        await add_users(redis, index, [
+            {'surname': f'Ivanovskiy{number}', 'name': 'Ivan'} for number in range(20)
+        ])
+        loaded = []
+        load = index._load
+
+        async def counting_load(user_keys):
+            loaded.extend(user_keys)
+            return await load(user_keys)
+
+        monkeypatch.setattr(index, '_load', counting_load)
+        users = await index.search(search_criteria({'surname': 'ivanov'}), 'fuzzy', 10)
+        #Проверяются только кандидаты с наибольшим числом общих
+        #триграмм, точные совпадения идут первыми.
+        assert len(loaded) == 5
+        assert len(users) <= 5
+        assert [user['surname'] for user in users[:3]] == ['Ivanov'] * 3
+        #Временный ключ объединения удален.
+        assert [key async for key in redis.scan_iter(match=b'user_search:tmp:*')] == []
+
+    run(check())
@@ -0,0 +1,245 @@
+"""Тесты групповой записи пользователей UserWriteBatcher.
+
+База данных заменена движком, который выполняет запросы пачек над
+словарем пользователей и может отказывать в записи отдельных строк.
+
+Запуск из корневой директории:
+    python -m pytest tests
+"""
+import asyncio
+import uuid
+from typing import Dict, List, Optional
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import DataError, OperationalError
+
+from data_sources.storages.user_repository import UserRepositorySQL
+from data_sources.storages.write_batcher import UserWriteBatcher
+
+FIELDS = ('surnames', 'names', 'patronymics')
+
+
+class FakeResult():
+
+    def __init__(self, rows: list):
+        self.rows = rows
+
+    def all(self) -> list:
+        return self.rows
+
+
+class FakeConnection():
+    """Соединение, выполняющее запросы пачек над словарем
+    пользователей FakeEngine. Изменения видны после commit().
+    """
+
+    def __init__(self, engine: 'FakeEngine'):
+        self.engine = engine
+        self.users = dict(engine.users)
+        self.locked: List[uuid.UUID] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def execute(self, statement, parameters: dict) -> FakeResult:
+        await asyncio.sleep(0)
+        if statement is UserWriteBatcher.LOCK_USERS:
+            self.locked.extend(parameters['ids'])
+            self.engine.locks.append(parameters['ids'])
+            return FakeResult([])
+        self.engine.statements.append(parameters)
+        if any(value == 'bad' for field in FIELDS for value in parameters[field]):
+            raise DataError('INSERT', parameters, Exception('value too long'))
+        if statement is UserWriteBatcher.UPDATE_USERS:
+            assert set(parameters['ids']) <= set(self.locked)
+        if statement is UserWriteBatcher.INSERT_USERS:
+            rows = []
+            for user in zip(parameters['ids'], *(parameters[field] for field in FIELDS)):
+                self.users[user[0]] = (*user, 1)
+                rows.append((*user, 1))
+            return FakeResult(rows)
+        rows = []
+        for position, user in enumerate(zip(
+            parameters['ids'],
+            *(parameters[field] for field in FIELDS),
+            parameters['versions'],
+        ), 1):
+            user_id, versions = user[0], user[4]
+            before = self.users.get(user_id)
+            if before is None:
+                rows.append((position, *([None] * 10)))
+                continue
+            values = tuple(
+                new if new is not None else old
+                for new, old in zip(user[1:4], before[1:4])
+            )
+            after = None
+            if values != before[1:4] and (
+                versions is None or str(before[4]) in versions.split(' ')
+            ):
+                after = (user_id, *values, before[4] + 1)
+                self.users[user_id] = after
+            rows.append((position, *before, *(after or [None] * 5)))
+        return FakeResult(rows)
+
+    async def commit(self):
+        self.engine.users = self.users
+        self.engine.commits += 1
+        if self.engine.lose_commit:
+            #Соединение потеряно после фиксации: клиент не знает,
+            #записана ли пачка.
+            raise OperationalError('COMMIT', {}, Exception('connection lost'))
+
+
+class FakeEngine():
+
+    def __init__(self):
+        self.users: Dict[uuid.UUID, tuple] = {}
+        self.statements: List[dict] = []
+        self.locks: List[list] = []
+        self.commits = 0
+        self.lose_commit = False
+
+    def connect(self) -> FakeConnection:
+        return FakeConnection(self)
+
+
+def create_parameters(surname: str) -> dict:
+    return {
+        'new_id': uuid.uuid4(),
+        'new_surname': surname,
+        'new_name': 'Ivan',
+        'new_patronymic': 'Ivanovich',
+    }
+
+
+def update_parameters(user_id: uuid.UUID, name: Optional[str]) -> dict:
+    return {
+        'user_id': user_id,
+        'new_surname': None,
+        'new_name': name,
+        'new_patronymic': None,
+    }
+
+
+def test_writes_batch_in_one_transaction_sorted_by_id(run):
+    async def check():
+        engine = FakeEngine()
+        batcher = UserWriteBatcher(engine, 100, 0.01)
+        parameters = [create_parameters(f'Ivanov{index}') for index in range(10)]
+        rows = await asyncio.gather(*[
+            batcher.create_user(parameter) for parameter in parameters
+        ])
+        assert [row[0] for row in rows] == [parameter['new_id'] for parameter in parameters]
+        assert engine.commits == 1
+        assert engine.statements[0]['ids'] == sorted(engine.statements[0]['ids'])
+
+        user_ids = [parameter['new_id'] for parameter in parameters]
+        rows = await asyncio.gather(*[
+            batcher.update_user(update_parameters(user_id, 'Petr'), [1])
+            for user_id in reversed(user_ids)
+        ])
+        assert [row[5] for row in rows] == list(reversed(user_ids))
+        assert all(row[7] == 'Petr' and row[9] == 2 for row in rows)
+        assert engine.commits == 2
+        assert engine.locks == [sorted(user_ids)]
+        await batcher.stop()
+
+    run(check())
+
+
+def test_repeated_updates_of_one_user_keep_order(run):
+    async def check():
+        engine = FakeEngine()
+        batcher = UserWriteBatcher(engine, 100, 0.01)
+        user_id = (await batcher.create_user(create_parameters('Ivanov')))[0]
+        rows = await asyncio.gather(*[
+            batcher.update_user(update_parameters(user_id, name))
+            for name in ('Petr', 'Pavel', 'Petr')
+        ])
+        assert [row[9] for row in rows] == [2, 3, 4]
+        assert engine.users[user_id][2] == 'Petr'
+        await batcher.stop()
+
+    run(check())
+
+
+def test_failed_row_does_not_fail_batch(run):
+    async def check():
+        engine = FakeEngine()
+        batcher = UserWriteBatcher(engine, 100, 0.01)
+        results = await asyncio.gather(
+            batcher.create_user(create_parameters('Ivanov')),
+            batcher.create_user(create_parameters('bad')),
+            batcher.create_user(create_parameters('Petrov')),
+            return_exceptions=True,
+        )
+        assert isinstance(results[1], DataError)
+        assert results[0][1] == 'Ivanov'
+        assert results[2][1] == 'Petrov'
+        assert sorted(user[1] for user in engine.users.values()) == ['Ivanov', 'Petrov']
+
+        user_id = results[0][0]
+        missing_id = uuid.uuid4()
+        results = await asyncio.gather(
+            batcher.update_user(update_parameters(user_id, 'bad')),
+            batcher.update_user(update_parameters(user_id, 'Petr')),
+            batcher.update_user(update_parameters(missing_id, 'Petr')),
+            return_exceptions=True,
+        )
+        assert isinstance(results[0], DataError)
+        assert results[1][7] == 'Petr'
+        assert results[2] is None
+        await batcher.stop()
+
+    run(check())
+
+
+def test_unknown_commit_outcome_fails_batch_without_replay(run):
+    async def check():
+        engine = FakeEngine()
+        batcher = UserWriteBatcher(engine, 100, 0.01)
+        user_id = (await batcher.create_user(create_parameters('Ivanov')))[0]
+        engine.lose_commit = True
+        results = await asyncio.gather(
+            batcher.create_user(create_parameters('Petrov')),
+            batcher.update_user(update_parameters(user_id, 'Petr')),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, OperationalError) for result in results)
+        #Пачка записана один раз: пользователь не добавлен повторно,
+        #версия увеличена на единицу.
+        assert engine.commits == 2
+        assert len(engine.users) == 2
+        assert engine.users[user_id][4] == 2
+        engine.lose_commit = False
+        await batcher.stop()
+
+    run(check())
+
+
+def test_version_mismatch_is_precondition_failed(run):
+    async def check():
+        engine = FakeEngine()
+        batcher = UserWriteBatcher(engine, 100, 0.01)
+        repository = UserRepositorySQL(True, True, True, True, batcher)
+        user = await repository.create_user('Ivanov', 'Ivan', 'Ivanovich', None)
+        results = await asyncio.gather(
+            repository.update_user(None, 'Petr', None, user.id, None, [user.version]),
+            repository.update_user(None, 'Pavel', None, user.id, None, [user.version + 5]),
+            return_exceptions=True,
+        )
+        assert results[0].updated and results[0].version == user.version + 1
+        assert isinstance(results[1], HTTPException)
+        assert results[1].status_code == 412
+
+        with pytest.raises(HTTPException) as missing:
+            await repository.update_user(None, 'Petr', None, str(uuid.uuid4()), None, [1])
+        assert missing.value.status_code == 400
+        await batcher.stop()
+
+    run(check())